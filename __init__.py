@@ -1 +1,5 @@
-from .chart_session import ChartSession
\ No newline at end of file
+from .chart_session import ChartSession
+from .async_session import AsyncChartSession
+from .plot import new_figure
+from .batch_export import render_many
+from .datasource import NpySource, RawSource, CsvSource
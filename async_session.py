@@ -0,0 +1,118 @@
+import asyncio
+
+from .chart_session import ChartSession, RENDER_TIMEOUT, BROWSER_LOAD_TIMEOUT, SAVE_TIMEOUT
+from .utils import exception_as_string, wait_with_timeout
+from .raster import save_spec_png
+
+# ChartSession for code that already runs an event loop (an aiohttp or FastAPI
+# service, a notebook): the server and the browser run on the caller's loop, no loop
+# threads are started and nothing blocks it.
+#
+#   async with AsyncChartSession() as session:
+#     session.get_figure().get_new_plot().plot(x, y)
+#     await session.show()
+#     await session.save("plot.png")
+#
+# Figures are only touched from the loop. Updates to the page go out one at a time, as
+# the page acks each render; saves are written (and with renderer="raster" drawn) on
+# the I/O thread pool, so several of them proceed together. daemon=True isn't
+# supported.
+class AsyncChartSession(ChartSession):
+  def __init__(self, *args, **kwargs):
+    if kwargs.get("daemon"):
+      raise ValueError("AsyncChartSession doesn't support daemon=True, use ChartSession")
+    super().__init__(*args, **kwargs)
+    self._browser = None
+    self._server_started = False
+    self._page_lock = asyncio.Lock()
+
+  def __enter__(self):
+    raise TypeError("Use 'async with AsyncChartSession() as session'")
+
+  async def __aenter__(self):
+    if self._renderer == "raster":
+      return self
+    if not await self._start_server():
+      raise RuntimeError("Could not start server")
+    self._server_started = True
+    try:
+      await self._open_page()
+      if not await wait_with_timeout(self._sio_connecting, BROWSER_LOAD_TIMEOUT):
+        raise RuntimeError("Could not start browser")
+    except Exception as e:
+      print ("".join(exception_as_string(e)))
+      await self.__aexit__(type(e), e, e.__traceback__)
+      raise
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    # saves still in flight need the page and the server
+    if self._save_futures:
+      await asyncio.wait(list(self._save_futures), timeout=SAVE_TIMEOUT)
+    self._io_pool.shutdown(wait=False)
+    # don't wait for evaluations nobody is going to look at
+    for token in self._update_tokens.values():
+      token.set()
+    if self._browser is not None:
+      await self._browser.try_close()
+    if self._server_started:
+      if not await self._stop_server():
+        print ("Could not stop server.")
+      self._server_started = False
+    self._thread_pool.shutdown(wait=False)
+    if self._process_pool is not None:
+      self._process_pool.shutdown(wait=False)
+
+  async def set_figure_size(self, width, height):
+    if self._renderer == "raster":
+      self._update_viewports((width, height, 2 if self._retina else 1))
+      return
+    async with self._page_lock:
+      await self._set_figure_size(width, height)
+
+  # send figure (a figure of this session or a list of them, all of them by default)
+  # to the page, returns once the page has drawn them
+  async def show(self, figure=None):
+    if self._renderer == "raster":
+      raise RuntimeError("There is no page to show figures on with renderer='raster', use save()")
+    await self._send(self._get_figures(figure), stream=False)
+
+  # like ChartSession.push()
+  async def push(self, figure=None):
+    if self._renderer == "raster":
+      raise RuntimeError("There is no page to push to with renderer='raster', use save()")
+    await self._send(self._get_figures(figure), stream=True)
+
+  async def _send(self, figures, stream):
+    async with self._page_lock:
+      # serialized under the lock, so deltas go out in the order they were taken
+      updates = [self._get_figure_update(fig, stream=stream) for fig in figures]
+      if not await self._emit_all(updates):
+        raise RuntimeError(f"Could not update graph data, the page didn't render it within {RENDER_TIMEOUT}s")
+
+  # like ChartSession.sweep()
+  async def sweep(self, param_grid, out_pattern, figure=None, xmin=None, xmax=None,
+                  ymin=None, ymax=None):
+    figure, ipl, frames = self._sweep_setup(param_grid, figure, xmin, xmax, ymin, ymax)
+    async with self._page_lock:
+      return await self._sweep(figure, ipl, frames, out_pattern)
+
+  # like ChartSession.save(), returns the file names written
+  async def save(self, filename, figure=None):
+    if self._renderer == "raster":
+      return list(await asyncio.gather(*self.save_async(filename, figure)))
+    figures, filenames = self._save_targets(filename, figure)
+    for fig, name in zip(figures, filenames):
+      with self._metrics.time("save_seconds"):
+        async with self._page_lock:
+          await self._browser.take_screenshot({"path": name}, f"#chart-{fig.id_} canvas")
+    return filenames
+
+  # like ChartSession.save_async(), with asyncio futures of the caller's loop
+  def _submit_save(self, figure, filename):
+    loop = asyncio.get_event_loop()
+    if self._renderer == "raster":
+      # serialized here on the loop, only drawing and writing happen on the worker
+      spec = figure._get_static_data("float64")
+      return loop.run_in_executor(self._io_pool, save_spec_png, spec, filename, *figure._viewport)
+    return asyncio.ensure_future(self._request_image_data(figure, filename))
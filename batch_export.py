@@ -0,0 +1,166 @@
+import asyncio
+import contextlib
+import itertools
+import os
+import time
+
+from .chart_session import (DEFAULT_HOST, STATIC_FILES, RENDER_TIMEOUT, BROWSER_LOAD_TIMEOUT,
+                            RENDERERS)
+from .raster import save_png
+from .utils import exception_as_string
+
+DEFAULT_CONCURRENCY = 4
+
+# Renders many figures to PNG with one headless Chromium. Each of the concurrency pages
+# is a separate client of one socket.io server; figures are handed out to whichever
+# page is free, sent only to that page's sid and screenshotted when it acks the render.
+# Every render has an id the page echoes in its ack, so a late ack of a figure that
+# timed out doesn't pass for the next figure's.
+class _BatchRenderer(object):
+  def __init__(self, concurrency, width, height, scale):
+    self.concurrency = concurrency
+    self.viewport = {"width": width, "height": height, "deviceScaleFactor": scale}
+    # sid -> (render id, future set on its ack) of the render the page is drawing
+    self._rendering = {}
+    self._render_ids = itertools.count()
+    # sid -> id of the figure the page shows
+    self._shown = {}
+
+  async def start(self):
+    import aiohttp.web
+    import socketio
+    from pyppeteer import launch
+    self._connected = asyncio.Queue()
+    self.app = aiohttp.web.Application()
+    self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins="*")
+    self.sio.attach(self.app)
+    self.sio.on("connect", self._record_connection)
+    self.sio.on("graph_updated", self._graph_updated)
+    self.app.router.add_static("/", STATIC_FILES)
+    self.runner = aiohttp.web.AppRunner(self.app)
+    await self.runner.setup()
+    # any free port, the page connects back to wherever it was loaded from
+    self.site = aiohttp.web.TCPSite(self.runner, DEFAULT_HOST, 0)
+    await self.site.start()
+    port = self.runner.addresses[0][1]
+
+    # not necessarily on the main thread, so pyppeteer can't install signal handlers
+    self.browser = await launch(headless=True, handleSIGINT=False, handleSIGTERM=False,
+                                handleSIGHUP=False)
+    self.pages = []
+    for _ in range(self.concurrency):
+      page = await self.browser.newPage()
+      await page.setViewport(self.viewport)
+      await page.goto(f"http://{DEFAULT_HOST}:{port}/index.html")
+      sid = await asyncio.wait_for(self._connected.get(), BROWSER_LOAD_TIMEOUT)
+      self.pages.append((page, sid))
+
+  async def stop(self):
+    with contextlib.suppress(Exception):
+      await self.browser.close()
+    with contextlib.suppress(Exception):
+      await self.runner.cleanup()
+
+  async def _record_connection(self, sid, params):
+    await self._connected.put(sid)
+
+  async def _graph_updated(self, sid, params=None):
+    rendering = self._rendering.get(sid)
+    if rendering is None or (params or {}).get("render") != rendering[0]:
+      return
+    if not rendering[1].done():
+      rendering[1].set_result(None)
+
+  async def render(self, page, sid, figure, path):
+    data = figure._get_data()
+    data["render"] = next(self._render_ids)
+    rendered = asyncio.get_event_loop().create_future()
+    self._rendering[sid] = (data["render"], rendered)
+    if self._shown.get(sid, figure.id_) != figure.id_:
+      # the page lays figures with different ids out side by side, one at a time
+      # gets the whole viewport
+      await self.sio.emit("clear_graphs", room=sid)
+    self._shown[sid] = figure.id_
+    try:
+      await self.sio.emit("update_graph", data, room=sid)
+      await asyncio.wait_for(rendered, RENDER_TIMEOUT)
+    finally:
+      self._rendering.pop(sid, None)
+    canvas = await page.querySelector(f"#chart-{figure.id_} canvas")
+    await canvas.screenshot({"path": path})
+
+  # pull (name, figure) pairs from the shared iterator until it runs out
+  async def _worker(self, page, sid, items, out_dir, stats):
+    for name, figure in items:
+      path = os.path.join(out_dir, f"{name}.png")
+      try:
+        await self.render(page, sid, figure, path)
+        stats["rendered"] += 1
+      except Exception as e:
+        stats["failed"] += 1
+        stats["failures"].append((name, ''.join(exception_as_string(e))))
+
+  async def render_all(self, items, out_dir):
+    stats = {"rendered": 0, "failed": 0, "failures": []}
+    start = time.perf_counter()
+    await asyncio.gather(*[self._worker(page, sid, items, out_dir, stats)
+                           for page, sid in self.pages])
+    stats["seconds"] = time.perf_counter() - start
+    stats["figures_per_second"] = stats["rendered"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+# the same without a browser, see raster.py
+def _render_raster(items, out_dir, width, height, scale):
+  stats = {"rendered": 0, "failed": 0, "failures": []}
+  start = time.perf_counter()
+  for name, figure in items:
+    try:
+      save_png(figure, os.path.join(out_dir, f"{name}.png"), width, height, scale)
+      stats["rendered"] += 1
+    except Exception as e:
+      stats["failed"] += 1
+      stats["failures"].append((name, ''.join(exception_as_string(e))))
+  stats["seconds"] = time.perf_counter() - start
+  stats["figures_per_second"] = stats["rendered"] / stats["seconds"] if stats["seconds"] else 0.0
+  return stats
+
+def _named_figures(figures):
+  if isinstance(figures, dict):
+    return iter(figures.items())
+  return ((f"figure_{i:05d}", figure) for i, figure in enumerate(figures))
+
+async def render_many_async(figures, out_dir, concurrency=DEFAULT_CONCURRENCY,
+                            width=1200, height=700, retina=False, renderer="browser"):
+  os.makedirs(out_dir, exist_ok=True)
+  scale = 2 if retina else 1
+  items = _named_figures(figures)
+  if renderer == "raster":
+    return _render_raster(items, out_dir, width, height, scale)
+  renderer = _BatchRenderer(concurrency, width, height, scale)
+  try:
+    await renderer.start()
+    # decimation budgets have to match the pages the figures are drawn on
+    def sized(items):
+      for name, figure in items:
+        figure._set_viewport(width, height, scale)
+        yield name, figure
+    return await renderer.render_all(sized(items), out_dir)
+  finally:
+    await renderer.stop()
+
+# Save each figure as out_dir/<name>.png using one headless browser with concurrency
+# pages. figures is a dict of name -> figure, or any iterable of figures (named
+# figure_00000, figure_00001, ...), including a generator that builds them lazily.
+# Returns counts of rendered and failed figures, the failures with their tracebacks,
+# the total time and the throughput. renderer="raster" draws with NumPy instead of
+# Chromium, concurrency doesn't apply then.
+def render_many(figures, out_dir, concurrency=DEFAULT_CONCURRENCY, width=1200, height=700,
+                retina=False, renderer="browser"):
+  if renderer not in RENDERERS:
+    raise ValueError(f"renderer must be one of {RENDERERS}, got {renderer!r}")
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(
+      render_many_async(figures, out_dir, concurrency, width, height, retina, renderer))
+  finally:
+    loop.close()
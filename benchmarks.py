@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import platform
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from .chart_session import ChartSession
+from .encoding import dumps_spec
+from .plot import new_figure
+from .lod import LOD_MIN_POINTS
+
+# Reproducible offline benchmarks, results as JSON so runs can be compared between
+# versions:  python -m <package>.benchmarks --out results.json [--quick]
+# The round trip benchmark starts the session's server on a free port and stands in
+# for the browser with a socket.io client that acks every update straight away.
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+QUICK_SIZES = [10 ** 3, 10 ** 4, 10 ** 5]
+FUNCTIONS = {
+  "smooth": "def f(x, a):\n  return a * np.sin(x)",
+  "steep": "def f(x, a):\n  return np.tanh(50 * a * x)",
+  "discontinuous": "def f(x, a):\n  return np.tan(a * x)",
+  # not vectorizable, evaluated one x at a time
+  "scalar": "def f(x, a):\n  return math.sin(a * x) if x > 0 else -1.0",
+}
+SAMPLING_PARAMS = {"xmin": -5.0, "xmax": 5.0, "parameters": {"a": 1.0}}
+# seconds a fresh interpreter may take (median of the runs): importing the package,
+# building and serializing a 1000 point figure, and starting the server through to the
+# first acked full update, which is what a first show() does minus Chromium
+STARTUP_BUDGET = {"import_s": 0.5, "figure_s": 0.1, "first_update_s": 2.0}
+# must not be loaded by importing the package, only once a server or browser is used
+HEAVY_MODULES = ("socketio", "engineio", "aiohttp", "pyppeteer", "scipy")
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {package}
+imported = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+from {package}.benchmarks import _build_figure, _first_update
+start_figure = time.perf_counter()
+_build_figure()
+built = time.perf_counter()
+print (json.dumps({{"import_s": imported - start, "figure_s": built - start_figure,
+                   "first_update_s": _first_update(), "heavy_modules": heavy}}))
+"""
+
+def _timings(fn, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return {"min_s": min(times), "median_s": statistics.median(times)}
+
+def _data(n, seed=0):
+  rng = np.random.default_rng(seed)
+  x = np.sort(rng.random(n)) * 100
+  return x, np.sin(x) + rng.normal(0, 0.1, n)
+
+def bench_ingestion(sizes, repeat):
+  results = []
+  for n in sizes:
+    x, y = _data(n)
+    plot = new_figure().get_new_plot()
+    result = {"points": n}
+    result.update(_timings(lambda: plot.scatter(x, y), repeat))
+    results.append(result)
+  return results
+
+# the full figure message as sent, in JSON point form and as float32/float64 columns
+def bench_serialization(sizes, repeat):
+  results = []
+  for n in sizes:
+    x, y = _data(n)
+    for precision in (None, "float32", "float64"):
+      figure = new_figure()
+      plot = figure.get_new_plot()
+      plot.scatter(x, y)
+      plot.set_precision(precision)
+      def serialize():
+        # a new version, so nothing cached from the previous round is reused
+        plot._invalidate()
+        return dumps_spec(figure._get_data())
+      result = {"points": n, "precision": precision or "json", "bytes": len(serialize())}
+      result.update(_timings(serialize, repeat))
+      results.append(result)
+  return results
+
+# a decimated line zoomed into 1% of its x range: building its min/max pyramid on the
+# first update, then the delta for a new x range, which only reads the tiles in view.
+# Shorter lines don't get a pyramid and aren't re-decimated on zoom, they are skipped.
+def bench_zoom(sizes, repeat):
+  results = []
+  for n in (n for n in sizes if n >= LOD_MIN_POINTS):
+    x, y = _data(n)
+    figure = new_figure()
+    plot = figure.get_new_plot()
+    plot.plot(x, y, decimate="minmax", precision="float32")
+    start = time.perf_counter()
+    figure._get_data()
+    first = time.perf_counter() - start
+    views = iter(np.linspace(0, 99, 2 * repeat))
+    def zoom():
+      lo = next(views)
+      figure._defaultXAxis.set_lims(lo, lo + 1)
+      delta = figure._get_delta()
+      if not delta["datasets"]:
+        raise RuntimeError("Zooming didn't re-query the line's pyramid")
+      return delta
+    points = zoom()["datasets"][0]["columns"]["length"]
+    result = {"points": n, "first_update_s": first, "sent_points": points}
+    result.update(_timings(zoom, repeat))
+    results.append(result)
+  return results
+
+# wall time and number of f evaluations, cold (empty sample cache) and warm (same request)
+def bench_sampling(repeat):
+  results = []
+  for name, code in FUNCTIONS.items():
+    figure = new_figure()
+    ipl = figure.add_interactive_plot()
+    info = ipl._get_function_info({"code": code})
+    if info["error"]:
+      raise RuntimeError("".join(info["error"]))
+    f = ipl.f
+    evaluations = [0]
+    def counted(x, *args):
+      evaluations[0] += np.size(x)
+      return f(x, *args)
+    ipl.f = counted
+    cold = []
+    for _ in range(repeat):
+      ipl._eval_cache.clear()
+      evaluations[0] = 0
+      start = time.perf_counter()
+      xs, _ = ipl.get_result(SAMPLING_PARAMS)
+      cold.append(time.perf_counter() - start)
+    cold_evaluations = evaluations[0]
+    evaluations[0] = 0
+    warm = _timings(lambda: ipl.get_result(SAMPLING_PARAMS), repeat)
+    results.append({
+      "function": name,
+      "samples": int(xs.shape[0]),
+      # the scalar fallback first tries the whole array once
+      "evaluations": cold_evaluations,
+      "cold_min_s": min(cold),
+      "cold_median_s": statistics.median(cold),
+      "warm_min_s": warm["min_s"],
+      "warm_median_s": warm["median_s"],
+      "warm_evaluations": evaluations[0] // repeat,
+    })
+  return results
+
+def _build_figure():
+  figure = new_figure()
+  x, y = _data(1000)
+  figure.get_new_plot().scatter(x, y)
+  return dumps_spec(figure._get_data())
+
+def _free_port():
+  with socket.socket() as s:
+    s.bind(("localhost", 0))
+    return s.getsockname()[1]
+
+# socket.io client standing in for the page, acks every update straight away
+async def _connect_stub_client(session):
+  import socketio
+  # no message size limit, like the browser (aiohttp's default is 4 MB)
+  client = socketio.AsyncClient(reconnection=False,
+                                websocket_extra_options={"max_msg_size": 0})
+  async def ack(data):
+    await client.emit("graph_updated", {"figure": data.get("id")})
+  for event in ("update_graph", "update_graph_delta", "append_graph_data"):
+    client.on(event, ack)
+  await client.connect(f"http://{session.host}:{session.port}")
+  await asyncio.wait_for(session._sio_connecting.wait(), 5)
+  return client
+
+# _emit -> graph_updated latency through the real server, full and delta messages
+async def bench_roundtrip(sizes, repeat):
+  session = ChartSession(port=_free_port())
+  if not await session._start_server():
+    raise RuntimeError("Could not start server")
+  client = None
+  results = []
+  try:
+    client = await _connect_stub_client(session)
+    figure = session.get_figure()
+    plot = figure.get_new_plot()
+    for n in sizes:
+      x, y = _data(n)
+      for precision in (None, "float32"):
+        plot.scatter(x, y)
+        plot.set_precision(precision)
+        for kind in ("full", "delta"):
+          times = []
+          for _ in range(repeat):
+            plot._touch()
+            if kind == "full":
+              session._send_full.add(figure.id_)
+            update = session._get_figure_update(figure)
+            start = time.perf_counter()
+            if not await session._emit(*update):
+              raise RuntimeError("No graph_updated from the stub client")
+            times.append(time.perf_counter() - start)
+          results.append({"points": n, "precision": precision or "json", "message": kind,
+                          "min_s": min(times), "median_s": statistics.median(times)})
+  finally:
+    if client is not None:
+      await client.disconnect()
+    await session._stop_server()
+    session._thread_pool.shutdown(wait=False)
+  return results
+
+async def _first_update_async():
+  start = time.perf_counter()
+  session = ChartSession(port=_free_port())
+  if not await session._start_server():
+    raise RuntimeError("Could not start server")
+  client = None
+  try:
+    client = await _connect_stub_client(session)
+    session.get_figure().get_new_plot().scatter(*_data(1000))
+    if not await session._emit(*session._get_figure_update(session.get_figure())):
+      raise RuntimeError("No graph_updated from the stub client")
+    return time.perf_counter() - start
+  finally:
+    if client is not None:
+      await client.disconnect()
+    await session._stop_server()
+    session._thread_pool.shutdown(wait=False)
+
+# in the fresh interpreter of bench_startup, including the lazy server imports
+def _first_update():
+  loop = asyncio.new_event_loop()
+  try:
+    elapsed = loop.run_until_complete(_first_update_async())
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+      task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    return elapsed
+  finally:
+    loop.close()
+
+# each run in a new interpreter, so nothing is imported or cached yet
+def bench_startup(repeat):
+  package_dir = os.path.dirname(os.path.abspath(__file__))
+  script = STARTUP_SCRIPT.format(package=__package__, heavy=HEAVY_MODULES)
+  runs = []
+  for _ in range(repeat):
+    output = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(package_dir),
+                            check=True, capture_output=True, text=True).stdout
+    runs.append(json.loads(output.strip().splitlines()[-1]))
+  result = {name: statistics.median(run[name] for run in runs) for name in STARTUP_BUDGET}
+  result["heavy_modules"] = sorted({m for run in runs for m in run["heavy_modules"]})
+  result["budget"] = STARTUP_BUDGET
+  result["within_budget"] = (not result["heavy_modules"] and
+                             all(result[name] <= limit for name, limit in STARTUP_BUDGET.items()))
+  return result
+
+def run(quick=False, repeat=None):
+  sizes = QUICK_SIZES if quick else SIZES
+  repeat = repeat or (3 if quick else 5)
+  # the largest messages take seconds per round trip
+  roundtrip_sizes = [n for n in sizes if n <= 10 ** 6]
+  loop = asyncio.new_event_loop()
+  try:
+    roundtrip = loop.run_until_complete(bench_roundtrip(roundtrip_sizes, repeat))
+    # engine.io ping tasks of the closed connection
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+      task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+  finally:
+    loop.close()
+  return {
+    "meta": {
+      "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+      "python": sys.version.split()[0],
+      "numpy": np.__version__,
+      "platform": platform.platform(),
+      "machine": platform.machine(),
+      "quick": quick,
+      "repeat": repeat,
+    },
+    "ingestion": bench_ingestion(sizes, repeat),
+    "serialization": bench_serialization(sizes, repeat),
+    "sampling": bench_sampling(repeat),
+    "zoom": bench_zoom(sizes, repeat),
+    "roundtrip": roundtrip,
+    "startup": bench_startup(repeat),
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmarks, written as JSON.")
+  parser.add_argument("--out", help="file to write the results to, stdout by default")
+  parser.add_argument("--quick", action="store_true", help="only up to 1e5 points")
+  parser.add_argument("--repeat", type=int, help="runs per measurement")
+  parser.add_argument("--check-startup", action="store_true",
+                      help="only the startup benchmark, exit with 1 if it is over budget")
+  args = parser.parse_args(argv)
+  if args.check_startup:
+    startup = bench_startup(args.repeat or 5)
+    print (json.dumps(startup, indent=2))
+    return 0 if startup["within_budget"] else 1
+  results = json.dumps(run(args.quick, args.repeat), indent=2)
+  if args.out:
+    with open(args.out, "w") as f:
+      f.write(results + "\n")
+  else:
+    print (results)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
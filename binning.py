@@ -0,0 +1,346 @@
+import math
+
+import numpy as np
+
+from .utils import finite_extent
+
+# Server-side aggregation for hist, hist2d and hexbin: samples are binned here in
+# chunks and only the occupied bins are sent. The samples are kept, so zooming in
+# re-bins what is visible instead of stretching the old bins.
+
+# samples per pass, keeps the temporaries of large inputs at a few tens of MB
+CHUNK_SIZE = 1 << 20
+
+# anchors, interpolated to COLOR_LEVELS colors
+COLORMAPS = {
+  "viridis": ["#440154", "#482878", "#3e4989", "#31688e", "#26828e", "#1f9e89",
+              "#35b779", "#6ece58", "#b5de2b", "#fde725"],
+  "magma": ["#000004", "#180f3d", "#440f76", "#721f81", "#9e2f7f", "#cd4071",
+            "#f1605d", "#fd9668", "#feca8d", "#fcfdbf"],
+  "greys": ["#f0f0f0", "#000000"],
+}
+COLOR_LEVELS = 256
+
+def _chunks(n):
+  for start in range(0, n, CHUNK_SIZE):
+    yield slice(start, min(start + CHUNK_SIZE, n))
+
+def _is_uniform(edges):
+  steps = np.diff(edges)
+  return bool(np.allclose(steps, steps[0], rtol=1e-9, atol=0))
+
+# bin of each value for the edges, -1 outside. Bins are [e_i, e_i+1) except the last,
+# which includes its right edge like np.histogram.
+def _bin_index(values, edges, uniform):
+  count = edges.shape[0] - 1
+  lo, hi = edges[0], edges[-1]
+  if uniform:
+    with np.errstate(invalid="ignore"):
+      idx = np.minimum(((values - lo) * (count / (hi - lo))).astype(np.int64), count - 1)
+  else:
+    idx = np.searchsorted(edges, values, side="right") - 1
+  idx[values == hi] = count - 1
+  idx[~((values >= lo) & (values <= hi))] = -1
+  return idx
+
+def histogram(values, edges):
+  edges = np.asarray(edges, dtype=np.float64)
+  uniform = _is_uniform(edges)
+  counts = np.zeros(edges.shape[0] - 1, dtype=np.int64)
+  for chunk in _chunks(values.shape[0]):
+    idx = _bin_index(values[chunk], edges, uniform)
+    counts += np.bincount(idx[idx >= 0], minlength=counts.shape[0])
+  return counts
+
+# the same from sorted values, in O(bins log n)
+def histogram_sorted(sorted_values, edges):
+  idx = np.searchsorted(sorted_values, edges, side="left")
+  idx[-1] = np.searchsorted(sorted_values, edges[-1], side="right")
+  return np.diff(idx)
+
+# counts of shape (x bins, y bins)
+def histogram2d(x, y, xedges, yedges):
+  xedges = np.asarray(xedges, dtype=np.float64)
+  yedges = np.asarray(yedges, dtype=np.float64)
+  xuniform, yuniform = _is_uniform(xedges), _is_uniform(yedges)
+  nx, ny = xedges.shape[0] - 1, yedges.shape[0] - 1
+  counts = np.zeros(nx * ny, dtype=np.int64)
+  for chunk in _chunks(x.shape[0]):
+    ix = _bin_index(x[chunk], xedges, xuniform)
+    iy = _bin_index(y[chunk], yedges, yuniform)
+    inside = (ix >= 0) & (iy >= 0)
+    counts += np.bincount(ix[inside] * ny + iy[inside], minlength=nx * ny)
+  return counts.reshape(nx, ny)
+
+def _hex_grid(extent, gridsize):
+  xmin, xmax, ymin, ymax = extent
+  nx = gridsize
+  ny = max(1, int(round(gridsize / math.sqrt(3))))
+  return nx, ny, (xmax - xmin) / nx or 1.0, (ymax - ymin) / ny or 1.0
+
+# hexagonal binning like matplotlib's hexbin: gridsize hexagons across extent
+# (xmin, xmax, ymin, ymax), two offset rectangular lattices and each sample goes to
+# the nearer center. Counts for every hexagon, see hexbin_cells.
+def hexbin_counts(x, y, extent, gridsize):
+  xmin, xmax, ymin, ymax = extent
+  nx, ny, sx, sy = _hex_grid(extent, gridsize)
+  n1 = (nx + 1) * (ny + 1)
+  counts = np.zeros(n1 + nx * ny, dtype=np.int64)
+  for chunk in _chunks(x.shape[0]):
+    xc, yc = x[chunk], y[chunk]
+    inside = (xc >= xmin) & (xc <= xmax) & (yc >= ymin) & (yc <= ymax)
+    xs = (xc[inside] - xmin) / sx
+    ys = (yc[inside] - ymin) / sy
+    ix1, iy1 = np.round(xs).astype(np.int64), np.round(ys).astype(np.int64)
+    ix2, iy2 = np.floor(xs).astype(np.int64), np.floor(ys).astype(np.int64)
+    d1 = (xs - ix1) ** 2 + 3.0 * (ys - iy1) ** 2
+    d2 = (xs - ix2 - 0.5) ** 2 + 3.0 * (ys - iy2 - 0.5) ** 2
+    first = d1 < d2
+    # the max edge of the second lattice belongs to the last cell
+    ix2 = np.minimum(ix2, nx - 1)
+    iy2 = np.minimum(iy2, ny - 1)
+    cell = np.where(first, ix1 * (ny + 1) + iy1, n1 + ix2 * ny + iy2)
+    counts += np.bincount(cell, minlength=counts.shape[0])
+  return counts
+
+# centers and counts of the occupied hexagons, and the lattice steps
+def hexbin_cells(counts, extent, gridsize):
+  xmin, _, ymin, _ = extent
+  nx, ny, sx, sy = _hex_grid(extent, gridsize)
+  n1 = (nx + 1) * (ny + 1)
+  i1, j1 = np.divmod(np.arange(n1), ny + 1)
+  i2, j2 = np.divmod(np.arange(nx * ny), ny)
+  cx = np.r_[xmin + i1 * sx, xmin + (i2 + 0.5) * sx]
+  cy = np.r_[ymin + j1 * sy, ymin + (j2 + 0.5) * sy]
+  occupied = counts > 0
+  return cx[occupied], cy[occupied], counts[occupied], (sx, sy)
+
+def hexbin(x, y, extent, gridsize):
+  return hexbin_cells(hexbin_counts(x, y, extent, gridsize), extent, gridsize)
+
+# a color string per count, linear or log scaled between the smallest and largest count
+def colormap(counts, cmap="viridis", log=False):
+  if cmap not in COLORMAPS:
+    raise ValueError(f"cmap must be one of {sorted(COLORMAPS)}, got {cmap!r}")
+  if counts.shape[0] == 0:
+    return []
+  values = np.log(counts.astype(np.float64)) if log else counts.astype(np.float64)
+  lo, hi = values.min(), values.max()
+  t = (values - lo) / (hi - lo) if hi > lo else np.ones_like(values)
+  table = _color_table(cmap)
+  return [table[i] for i in np.round(t * (COLOR_LEVELS - 1)).astype(np.int64)]
+
+_tables = {}
+
+def _color_table(cmap):
+  if cmap not in _tables:
+    anchors = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in COLORMAPS[cmap]],
+                       dtype=np.float64)
+    pos = np.linspace(0, 1, anchors.shape[0])
+    t = np.linspace(0, 1, COLOR_LEVELS)
+    rgb = np.stack([np.interp(t, pos, anchors[:, k]) for k in range(3)], axis=1)
+    _tables[cmap] = ["#%02x%02x%02x" % tuple(c) for c in np.round(rgb).astype(np.int64)]
+  return _tables[cmap]
+
+# finite samples of an aggregate plot. Sorted copies (by x) are made on the first re-bin, after that a re-bin only touches the
+# samples in the visible x range.
+class _Samples(object):
+  def __init__(self, x, y=None):
+    finite = np.isfinite(x) if y is None else np.isfinite(x) & np.isfinite(y)
+    if finite.all():
+      self.x, self.y = x, y
+    else:
+      self.x = x[finite]
+      self.y = None if y is None else y[finite]
+    self.xlims = finite_extent(self.x)
+    self.ylims = (None, None) if y is None else finite_extent(self.y)
+    self._sorted = None
+
+  def __len__(self):
+    return self.x.shape[0]
+
+  def _sort(self):
+    if self._sorted is None:
+      if self.y is None:
+        self._sorted = (np.sort(self.x), None)
+      else:
+        order = np.argsort(self.x)
+        self._sorted = (self.x[order], self.y[order])
+    return self._sorted
+
+  # samples with lo <= x <= hi
+  def select(self, lo, hi):
+    xs, ys = self._sort()
+    start, stop = np.searchsorted(xs, lo, side="left"), np.searchsorted(xs, hi, side="right")
+    return xs[start:stop], None if ys is None else ys[start:stop]
+
+  # with sort, the sorted copy is made if there isn't one yet
+  def histogram(self, edges, sort=False):
+    if sort or self._sorted is not None:
+      return histogram_sorted(self._sort()[0], edges)
+    return histogram(self.x, edges)
+
+  def _select(self, xrange_, sort):
+    if sort:
+      return self.select(*xrange_)
+    return self.x, self.y
+
+  def histogram2d(self, xedges, yedges, sort=False):
+    x, y = self._select((xedges[0], xedges[-1]), sort)
+    return histogram2d(x, y, xedges, yedges)
+
+  def hexbin_counts(self, extent, gridsize, sort=False):
+    x, y = self._select(extent[:2], sort)
+    return hexbin_counts(x, y, extent, gridsize)
+
+# the same for a datasource, every binning is a pass over its chunks
+class _SourceSamples(object):
+  def __init__(self, source):
+    self.source = source
+    extents = source.extents()
+    self.xlims = extents[0]
+    self.ylims = extents[1] if len(extents) > 1 else (None, None)
+
+  def histogram(self, edges, sort=False):
+    return sum(histogram(chunk[0], edges) for chunk in self.source.chunks())
+
+  def histogram2d(self, xedges, yedges, sort=False):
+    return sum(histogram2d(x, y, xedges, yedges) for x, y in self.source.chunks())
+
+  def hexbin_counts(self, extent, gridsize, sort=False):
+    return sum(hexbin_counts(x, y, extent, gridsize) for x, y in self.source.chunks())
+
+# the part of the view (lo, hi) inside the data extent, None if nothing is
+def visible_range(view, extent):
+  lo, hi = view
+  if lo is None or hi is None:
+    return extent
+  lo, hi = max(lo, extent[0]), min(hi, extent[1])
+  return (lo, hi) if hi > lo else None
+
+AGGREGATE_KINDS = ("hist", "hist2d", "hexbin")
+# heatmap cells for bins=None are about this many CSS px on a side
+CELL_PX = 8
+
+def _is_count(bins):
+  return bins is None or isinstance(bins, (int, np.integer))
+
+# edges for a bin count over lims, or the given edges
+def _edges(bins, lims):
+  if not _is_count(bins):
+    return np.asarray(bins, dtype=np.float64)
+  return np.linspace(lims[0], lims[1], int(bins) + 1)
+
+# like np.histogram, a range without width becomes one around the value
+def _widen(lims):
+  lo, hi = lims
+  if lo is None:
+    return None
+  return (lo - 0.5, hi + 0.5) if hi <= lo else (lo, hi)
+
+def _px(length, axis_span, size):
+  return length / axis_span * size
+
+# What an aggregate plot was made with. bin() turns the samples into points for the
+# axis ranges and viewport: step line vertices for "hist", occupied cell centers for
+# "hist2d" and "hexbin" (with a color per cell and the marker radius). Bin counts
+# with no explicit range follow the view, explicit edges or ranges are binned once
+# and only the marker size follows.
+class _Aggregate(object):
+  def __init__(self, kind, samples, bins, bin_range=None, cmap="viridis", log=False):
+    self.kind = kind
+    self.samples = samples
+    # a pair is per axis, counts or edges, like np.histogram2d takes it
+    if kind == "hist2d" and not _is_count(bins) and len(bins) == 2:
+      self.xbins, self.ybins = bins
+    else:
+      self.xbins = self.ybins = bins
+    if kind == "hist":
+      self.xlims = _widen(samples.xlims if bin_range is None else tuple(bin_range))
+      self.ylims = None
+    else:
+      self.xlims = _widen(samples.xlims if bin_range is None else tuple(bin_range[0]))
+      self.ylims = _widen(samples.ylims if bin_range is None else tuple(bin_range[1]))
+    if not _is_count(self.xbins):
+      self.xlims = (float(self.xbins[0]), float(self.xbins[-1]))
+    if kind == "hist2d" and not _is_count(self.ybins):
+      self.ylims = (float(self.ybins[0]), float(self.ybins[-1]))
+    self.follows_view = bin_range is None and _is_count(self.xbins) and _is_count(self.ybins)
+    self.cmap = cmap
+    self.log = log
+    self._cached = None  # (bins key, result)
+
+  # what bin() depends on besides the samples
+  def view_key(self, xview, yview, viewport):
+    if self.kind == "hist":
+      return xview if self.follows_view else None
+    return (xview, yview, viewport[:2])
+
+  def _ranges(self, xview, yview):
+    if not self.follows_view or self.xlims is None:
+      return self.xlims, self.ylims
+    return (visible_range(xview, self.xlims),
+            None if self.ylims is None else visible_range(yview, self.ylims))
+
+  # (x, y, colors, radius): colors and radius are None for "hist", radius is a scalar or
+  # an array with one radius per point
+  def bin(self, xview, yview, viewport):
+    xrange_, yrange_ = self._ranges(xview, yview)
+    if xrange_ is None or (self.kind != "hist" and yrange_ is None):
+      return np.empty(0), np.empty(0), None if self.kind == "hist" else [], None
+    # the data is only sorted by x once a part of it is looked at
+    sort = xrange_ != self.xlims
+    if self.kind == "hist":
+      return self._hist(xrange_, sort)
+    width, height = viewport[:2]
+    xspan = xview[1] - xview[0] if xview[0] is not None else xrange_[1] - xrange_[0]
+    yspan = yview[1] - yview[0] if yview[0] is not None else yrange_[1] - yrange_[0]
+    if self.kind == "hist2d":
+      return self._hist2d(xrange_, yrange_, xspan, yspan, width, height, sort)
+    return self._hexbin(xrange_, yrange_, xspan, yspan, width, height, sort)
+
+  def _hist(self, xrange_, sort):
+    edges = _edges(10 if self.xbins is None else self.xbins, xrange_)
+    key = edges.tobytes()
+    if self._cached is None or self._cached[0] != key:
+      self._cached = (key, self.samples.histogram(edges, sort))
+    counts = self._cached[1].astype(np.float64)
+    # step line: each count holds until the next edge, down to 0 at both ends
+    x = np.r_[edges[0], edges[:-1], edges[-1], edges[-1]]
+    y = np.r_[0.0, counts, counts[-1], 0.0]
+    return x, y, None, None
+
+  def _hist2d(self, xrange_, yrange_, xspan, yspan, width, height, sort):
+    # about CELL_PX square cells over the visible part
+    xbins = self.xbins if self.xbins is not None else max(
+      1, int(round(_px(xrange_[1] - xrange_[0], xspan, width) / CELL_PX)))
+    ybins = self.ybins if self.ybins is not None else max(
+      1, int(round(_px(yrange_[1] - yrange_[0], yspan, height) / CELL_PX)))
+    xedges, yedges = _edges(xbins, xrange_), _edges(ybins, yrange_)
+    key = (xedges.tobytes(), yedges.tobytes())
+    if self._cached is None or self._cached[0] != key:
+      self._cached = (key, self.samples.histogram2d(xedges, yedges, sort))
+    counts = self._cached[1]
+    ix, iy = np.nonzero(counts)
+    cx = (xedges[ix] + xedges[ix + 1]) / 2
+    cy = (yedges[iy] + yedges[iy + 1]) / 2
+    # Chart.js draws a "rect" point as a square of side radius * sqrt(2). Cells get a
+    # px to spare so there are no seams, non-square ones overlap their neighbours.
+    side = np.maximum(_px(xedges[ix + 1] - xedges[ix], xspan, width),
+                      _px(yedges[iy + 1] - yedges[iy], yspan, height)) + 1
+    radius = side / math.sqrt(2)
+    if radius.shape[0] and np.allclose(radius, radius[0]):
+      radius = float(radius[0])
+    return cx, cy, colormap(counts[ix, iy], self.cmap, self.log), radius
+
+  def _hexbin(self, xrange_, yrange_, xspan, yspan, width, height, sort):
+    gridsize = self.xbins if self.xbins is not None else max(1, int(width // (3 * CELL_PX)))
+    extent = (xrange_[0], xrange_[1], yrange_[0], yrange_[1])
+    key = (gridsize, extent)
+    if self._cached is None or self._cached[0] != key:
+      counts = self.samples.hexbin_counts(extent, int(gridsize), sort)
+      self._cached = (key, hexbin_cells(counts, extent, int(gridsize)))
+    cx, cy, counts, (sx, sy) = self._cached[1]
+    # circles through the corners of the hexagons, so neighbours leave no gaps
+    radius = max(_px(sx, xspan, width) / math.sqrt(3), _px(sy, yspan, height) / 3) + 0.5
+    return cx, cy, colormap(counts, self.cmap, self.log), float(radius)
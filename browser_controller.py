@@ -1,12 +1,12 @@
 import contextlib
 from time import sleep
 import webbrowser
-from pyppeteer import launch
 
 # Simple implementation that is not up to the task of wrangling a whole browser
 class SimpleBrowser(object):
   def __init__(self):
-    pass
+    # size of the page is unknown, we don't control the browser
+    self.viewport = None
 
   async def start_browser(self):
     pass
@@ -24,17 +24,17 @@ class PuppeteerBrowser(object):
   def __init__(self, headless=False, use_scale_factor=True):
     self._headless = headless
     self._use_scale_factor = use_scale_factor
+    # (width, height, device pixel ratio) of the page once it is set
+    self.viewport = None
 
   async def start_browser(self):
+    # pyppeteer takes a while to import, only pay for it when a browser is needed
+    from pyppeteer import launch
     try:
       self.browser = await launch(headless=self._headless, args=["--start-maximized"], setDefaultViewport=False)
       self.page = await self.browser.newPage()
       height, width, dpr = await self.page.evaluate("[screen.height, screen.width, window.devicePixelRatio]")
-      await self.page.setViewport({
-        "width": width-150,
-        "height": height-275,
-        "deviceScaleFactor": 2 if self._use_scale_factor else 1
-      });
+      await self.set_figure_size(width-150, height-275)
     except:
       await self.try_close()
       raise
@@ -43,17 +43,20 @@ class PuppeteerBrowser(object):
     await self.page.goto(url)
 
   async def set_figure_size(self, width, height):
+    scale = 2 if self._use_scale_factor else 1
     await self.page.setViewport({
       "width": width,
       "height": height,
-      "deviceScaleFactor": 2 if self._use_scale_factor else 1
+      "deviceScaleFactor": scale
     });
+    self.viewport = (width, height, scale)
 
   async def try_close(self):
     with contextlib.suppress(Exception):
       await self.browser.close()
 
-  async def take_screenshot(self, params):
-    canvas = await self.page.querySelector('canvas')
+  # screenshot of the canvas matched by selector, the first one by default
+  async def take_screenshot(self, params, selector='canvas'):
+    canvas = await self.page.querySelector(selector)
     await canvas.screenshot(params)
 
@@ -1,20 +1,23 @@
-import socketio
-import aiohttp.web
 import webbrowser
 import asyncio
 import threading
 import contextlib
+import concurrent.futures
 
-from urllib.request import urlopen
-import binascii
-
+import base64
+import itertools
 import random
 import string
+import time
 import os
 
 from .plot import _Figure
-from .utils import exception_as_string, wait_with_timeout
-from .browser_controller import PuppeteerBrowser, SimpleBrowser
+from .utils import exception_as_string, wait_with_timeout, grid_shape, cancel_pending_tasks, job_cancelled
+from .scheduler import _LatestWinsScheduler
+from .raster import save_png, save_spec_png
+from .metrics import _Metrics, BYTES_BUCKETS
+from .fanout import _FanOut
+from .workers import _WorkerPool
 
 DEFAULT_PORT = 15555
 DEFAULT_HOST = "localhost"
@@ -24,30 +27,84 @@ RENDER_TIMEOUT = 5
 SAVE_TIMEOUT = 30
 BROWSER_LOAD_TIMEOUT = 10
 DISCONNECT_TIMEOUT = 4
+EVAL_TIMEOUT = 10
+# threads decoding and writing saved images, see save_async()
+SAVE_IO_WORKERS = 4
+# page size for renderer="raster" until set_figure_size() is called
+DEFAULT_RASTER_SIZE = (1200, 700)
+RENDERERS = ("browser", "raster")
 
 class ChartSession(object):
-  def __init__(self, port=DEFAULT_PORT, retina_display=True):
+  # interactive functions are evaluated off the event loop, on a "thread" or "process"
+  # pool of workers size. Evaluations taking longer than eval_timeout seconds fail; in
+  # process mode the worker stuck in f is killed and replaced, a thread can't be
+  # stopped and is given up on (counted as workers_lost).
+  # With daemon=True, the server and browser are a persistent daemon process shared
+  # with other sessions (started by the first one), see daemon.py. Interactive plots
+  # aren't supported in daemon mode.
+  # renderer="raster" draws figures with NumPy (see raster.py) instead of Chromium: no
+  # server or browser is started, save() works and show() doesn't.
+  # Per-phase timings, message sizes, timeouts and connections are recorded, see
+  # get_metrics() and the /metrics route of the server.
+  def __init__(self, port=DEFAULT_PORT, retina_display=True, executor="thread", workers=None,
+               eval_timeout=EVAL_TIMEOUT, daemon=False, renderer="browser"):
+    if executor not in ("thread", "process"):
+      raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+    if renderer not in RENDERERS:
+      raise ValueError(f"renderer must be one of {RENDERERS}, got {renderer!r}")
+    if daemon and renderer != "browser":
+      raise ValueError("daemon=True needs renderer='browser'")
     self.port = port
     self.host = DEFAULT_HOST
     self.token = ''.join([random.choice(string.ascii_letters + string.digits) for n in range(25)])  # TODO
-    self._figure = _Figure()
-    self._connections = set()
-    self._save_file = None
+    # all figures are shown on the same page, in a grid, and addressed by id
+    self._figure = _Figure("0")
+    self._figures = [self._figure]
+    # the connected pages, see fanout.py
+    self._fanout = None
+    # ids of figures the page has no state for to apply a delta to
+    self._send_full = {self._figure.id_}
+    # request id -> (file name, future) of images requested from the page
+    self._pending_saves = {}
+    self._save_ids = itertools.count()
+    # futures from save_async() that haven't finished, waited for on exit
+    self._save_futures = set()
+    self._io_pool = concurrent.futures.ThreadPoolExecutor(SAVE_IO_WORKERS, thread_name_prefix="save-io")
     self._retina = retina_display
+    self._eval_timeout = eval_timeout
+    # get_result runs on the thread pool either way, in process mode it only
+    # coordinates batches sent to the process pool
+    self._workers = workers
+    self._thread_pool = concurrent.futures.ThreadPoolExecutor(workers)
+    self._process_pool = _WorkerPool(workers or os.cpu_count() or 1) if executor == "process" else None
+    # in-flight evaluation per (client, figure id), set to cancel it
+    self._update_tokens = {}
+    self._scheduler = None
+    self._use_daemon = daemon
+    self._daemon = None
+    # (width, height, device pixel ratio) of the page, once known
+    self._viewport = None
+    self._renderer = renderer
+    self._metrics = _Metrics()
+    if renderer == "raster":
+      self._update_viewports(DEFAULT_RASTER_SIZE + (2 if retina_display else 1,))
 
   async def _start_server(self):
+    # the server side dependencies are only loaded when a server is started, building
+    # figures or rendering with renderer="raster" doesn't need them
+    import aiohttp.web
+    import socketio
     try:
-      # Basically a condition variable without a lock, lets us lock out from shutting down event loop
-      # and server if we have a pending request for image data or something
-      self._is_saving = asyncio.Event()
-      self._is_rendering = asyncio.Event()
       self._sio_connecting = asyncio.Event()
+      # slider drags send far more requests than we can compute, keep only the newest
+      self._scheduler = _LatestWinsScheduler(self._update)
 
       self.app = aiohttp.web.Application()
       self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins="*")  # TODO cors
       self.sio.attach(self.app)
+      self._fanout = _FanOut(self.sio, self._metrics)
       # request from the client for updated graph data, for interactive visualization
-      self.sio.on("get_graph_update", self._update)
+      self.sio.on("get_graph_update", self._schedule_update)
       # request from the client for updated function data, contains Python to execute on server and
       # give back info about exceptions and parameters for sliders
       self.sio.on("get_function_update", self._function_update)
@@ -58,7 +115,11 @@ class ChartSession(object):
       self.sio.on("connect", self._record_connection)
       self.sio.on("disconnect", self._remove_connection)
 
-      self.app.router.add_static("/", STATIC_FILES)
+      # before the static route, which would otherwise take every path
+      self.app.router.add_get("/metrics", self._metrics_handler)
+      # without a frontend build, socket.io clients (benchmarks, tests) still work
+      if os.path.isdir(STATIC_FILES):
+        self.app.router.add_static("/", STATIC_FILES)
       self.runner = aiohttp.web.AppRunner(self.app)
       await self.runner.setup()
       self.site = aiohttp.web.TCPSite(self.runner, self.host, self.port)
@@ -74,7 +135,12 @@ class ChartSession(object):
 
   async def _stop_server(self):
     try:
+      if self._scheduler is not None:
+        await self._scheduler.close()
       await asyncio.wait_for(self.sio.disconnect(True), DISCONNECT_TIMEOUT)
+      # engine.io's background service task, on python-socketio versions that have it
+      if hasattr(self.sio, "shutdown"):
+        await asyncio.wait_for(self.sio.shutdown(), DISCONNECT_TIMEOUT)
       await asyncio.wait_for(self.runner.cleanup(), DISCONNECT_TIMEOUT)
       return True
     except asyncio.TimeoutError:
@@ -85,6 +151,13 @@ class ChartSession(object):
 
   # context manager syntax handles server spinup and teardown
   def __enter__(self):
+    if self._renderer == "raster":
+      return self
+    if self._use_daemon:
+      from .daemon import _DaemonClient
+      self._daemon = _DaemonClient.attach()
+      self._daemon_session = self._daemon.open_session()
+      return self
     self.event_loop = asyncio.new_event_loop()
     
     # puppeteer can only run from main thread due to multiprocessing things.
@@ -121,6 +194,20 @@ class ChartSession(object):
     return self
 
   def __exit__(self, exc_type, exc_value, traceback):
+    # saves still in flight need the page and the server
+    concurrent.futures.wait(list(self._save_futures), SAVE_TIMEOUT)
+    self._io_pool.shutdown(wait=True)
+    if self._renderer == "raster":
+      self._thread_pool.shutdown(wait=False)
+      if self._process_pool is not None:
+        self._process_pool.shutdown(wait=False)
+      return
+    if self._daemon is not None:
+      # the daemon keeps the page around for the next session
+      with contextlib.suppress(Exception):
+        self._daemon.close_session(self._daemon_session)
+      self._thread_pool.shutdown(wait=False)
+      return
     # close browser window and process if possible
     res = self.main_thread_event_loop.run_until_complete(self._browser.try_close())
     # send server shutdown coroutine to the event loop
@@ -128,83 +215,522 @@ class ChartSession(object):
     # wait for server to finish shutting down
     if not future.result():
       print ("Could not stop server. Going to force close async tasks anyway...")
-    # shut down the event loop on the other thread
-    asyncio.gather(*asyncio.Task.all_tasks()).cancel()  # unsure if this is advisable/necessary
+    # whatever the server left behind (engine.io pings and the like), then the loop
+    future = asyncio.run_coroutine_threadsafe(cancel_pending_tasks(), self.event_loop)
+    with contextlib.suppress(Exception):
+      future.result(DISCONNECT_TIMEOUT)
     self.event_loop.call_soon_threadsafe(self.event_loop.stop)
     self.main_thread_event_loop.close()
     # join the event loop thread
     self._el_thread.join()
+    # don't wait for evaluations nobody is going to look at
+    for token in self._update_tokens.values():
+      token.set()
+    self._thread_pool.shutdown(wait=False)
+    if self._process_pool is not None:
+      self._process_pool.shutdown(wait=False)
 
   async def _open_page(self):
+    from .browser_controller import PuppeteerBrowser
     self._browser = PuppeteerBrowser(use_scale_factor=self._retina)
     await self._browser.start_browser()
     await self._browser.open_page(f"http://{self.host}:{self.port}/index.html")
+    self._update_viewports(self._browser.viewport)
     return True
 
-  async def _update(self, sid, params):
-    ipl = self._figure._get_interactive_plot()
+  def _get_figure_by_id(self, id_):
+    for figure in self._figures:
+      if figure.id_ == id_:
+        return figure
+    raise KeyError(f"No figure with id {id_!r}")
+
+  # None for all figures of the session, otherwise a figure or a list of them
+  def _get_figures(self, figure):
+    if figure is None:
+      return list(self._figures)
+    figures = list(figure) if isinstance(figure, (list, tuple)) else [figure]
+    for fig in figures:
+      if not any(fig is own for own in self._figures):
+        raise ValueError("Figure doesn't belong to this session, use ChartSession.new_figure()")
+    return figures
+
+  # the page lays figures out in a grid of equal cells, this gives each figure
+  # the size of its cell for decimation
+  def _update_viewports(self, viewport=None):
+    if viewport is not None:
+      self._viewport = viewport
+    if self._viewport is None:
+      return
+    width, height, ratio = self._viewport
+    cols, rows = grid_shape(len(self._figures))
+    for figure in self._figures:
+      figure._set_viewport(width // cols, height // rows, ratio)
+
+  async def _schedule_update(self, sid, params):
+    # requests for different figures don't replace each other
+    figure_id = (params or {}).get("figure", self._figure.id_)
+    self._scheduler.submit((sid, figure_id), params)
+
+  async def _update(self, key, params):
+    start = time.perf_counter()
+    figure = self._get_figure_by_id(key[1])
+    ipl = figure._get_interactive_plot()
+    plot_result = {"error": None}
     if params and ipl:
-      plot_result = ipl._update_plot(params)
-    self.figure_data = self._figure._get_data()
+      cancel = threading.Event()
+      self._update_tokens[key] = cancel
+      plot_result = await self._compute_plot(ipl, params, cancel)
+      # the client disconnected in the meantime
+      if self._update_tokens.pop(key, None) is not cancel:
+        self._metrics.increment("updates_abandoned")
+        return False
+    elif params:
+      figure._set_view(params)
+    event, data, snapshot = self._get_figure_update(figure)
     if plot_result["error"]:
-      self.figure_data["error"] = plot_result["error"]
-    return await self._emit()
+      data["error"] = plot_result["error"]
+    result = await self._emit(event, data, snapshot)
+    self._metrics.observe("update_seconds", time.perf_counter() - start)
+    return result
+
+  # evaluate the interactive function on the worker pool, then update the plot here
+  # on the event loop so figure state is only touched from one thread
+  async def _compute_plot(self, ipl, params, cancel):
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(self._thread_pool, ipl.get_result, params, cancel,
+                                  self._process_pool, self._metrics)
+    try:
+      # includes the wait for a free worker
+      with self._metrics.time("evaluate_seconds"):
+        xi, yi = await asyncio.wait_for(future, self._eval_timeout)
+    except asyncio.TimeoutError:
+      self._abandon_evaluation(cancel)
+      return {"error": [f"Evaluating f took longer than {self._eval_timeout}s, gave up."]}
+    except (asyncio.CancelledError, concurrent.futures.CancelledError):
+      if not job_cancelled(future):
+        # this task is cancelled (scheduler.close(), shutdown), stop f along with it
+        cancel.set()
+        raise
+      self._metrics.increment("evals_cancelled")
+      return {"error": None}
+    except Exception as e:
+      self._metrics.increment("eval_errors")
+      return {"error": exception_as_string(e)}
+    with self._metrics.time("apply_seconds"):
+      return ipl._apply_result(params, xi, yi)
+
+  # an evaluation that timed out may be stuck in f. In process mode get_result kills
+  # its worker once it sees cancel. A thread can't be stopped: it is written off and
+  # later evaluations go to a new thread pool, so runaway functions don't use up the
+  # workers for the rest of the session.
+  def _abandon_evaluation(self, cancel):
+    cancel.set()
+    self._metrics.increment("eval_timeouts")
+    if self._process_pool is None:
+      self._metrics.increment("workers_lost")
+      stuck, self._thread_pool = self._thread_pool, concurrent.futures.ThreadPoolExecutor(self._workers)
+      stuck.shutdown(wait=False)
+
+  # (event, data, snapshot): the full figure for pages that don't have it yet, otherwise
+  # only what changed, with the full figure as of the same moment if a page waits to
+  # catch up on it (see fanout.py). Serialized here and not on the loop, which never
+  # reads a figure the caller may be changing.
+  def _get_figure_update(self, figure, stream=False):
+    with self._metrics.time("serialize_seconds"):
+      if figure.id_ in self._send_full:
+        self._send_full.discard(figure.id_)
+        return "update_graph", figure._get_data(), None
+      if stream:
+        event, data = "append_graph_data", figure._get_stream_delta()
+      else:
+        event, data = "update_graph_delta", figure._get_delta()
+      snapshot = None
+      if self._fanout is not None and self._fanout.wants_snapshot(figure.id_):
+        # after the delta, so streamed points are in it exactly once
+        snapshot = figure._get_snapshot()
+      return event, data, snapshot
 
-  async def _emit(self):
-    await self.sio.emit("update_graph", self.figure_data)
-    return await wait_with_timeout(self._is_rendering, RENDER_TIMEOUT)
+  # to every page (encoded once, pages still drawing an earlier frame skip this one),
+  # then wait for the session's own page to draw it
+  async def _emit(self, event, data, snapshot=None):
+    with self._metrics.time("emit_seconds"):
+      size = await self._fanout.send(event, data, snapshot)
+    self._metrics.observe(f"{event}_bytes", size, BYTES_BUCKETS)
+    start = time.perf_counter()
+    rendered = await self._fanout.wait_rendered(data["id"], RENDER_TIMEOUT)
+    if rendered:
+      self._metrics.observe("render_seconds", time.perf_counter() - start)
+    else:
+      self._metrics.increment("render_timeouts")
+    return rendered
+
+  # one figure after the other, each waits for its render
+  async def _emit_all(self, updates):
+    results = [await self._emit(*update) for update in updates]
+    return all(results)
 
   async def _function_update(self, sid, params):
-    ipl = self._figure._get_interactive_plot()
+    figure = self._get_figure_by_id(params.get("figure", self._figure.id_))
+    ipl = figure._get_interactive_plot()
     if ipl:
-      res = ipl._get_function_info(params)
+      with self._metrics.time("function_info_seconds"):
+        res = ipl._get_function_info(params)
+      res["figure"] = figure.id_
       await self.sio.emit("update_function", res)
 
   async def _graph_updated(self, sid, params=None):
-    self._is_rendering.set()
+    await self._fanout.ack(sid, (params or {}).get("figure"))
 
   async def _record_connection(self, sid, params):
-    self._connections.add(sid)
+    self._metrics.increment("connects")
+    # a page joining late gets the figures the others already have
+    sent = [figure.id_ for figure in self._figures if figure.id_ not in self._send_full]
+    await self._fanout.add(sid, sent)
+    self._metrics.set_gauge("connections", len(self._fanout))
     self._sio_connecting.set()
 
   async def _remove_connection(self, sid):
-    self._connections.remove(sid)
+    self._fanout.remove(sid)
+    self._metrics.increment("disconnects")
+    self._metrics.set_gauge("connections", len(self._fanout))
+    for figure in self._figures:
+      cancel = self._update_tokens.pop((sid, figure.id_), None)
+      if cancel is not None:
+        cancel.set()
+      self._scheduler.discard((sid, figure.id_))
+
+  # ask the page for figure's canvas as a PNG and write it to filename, returns
+  # filename. Any number of these can be pending, each under its own request id.
+  async def _request_image_data(self, figure, filename):
+    reply = await self._send_image_request(figure, filename)
+    return await reply
+
+  # returns once the request is queued on the page's socket, ahead of anything sent
+  # after it, with a task for the reply that resolves to filename
+  async def _send_image_request(self, figure, filename):
+    page = self._fanout.primary
+    if page is None:
+      raise RuntimeError("There is no page to take the image from")
+    id_ = next(self._save_ids)
+    future = asyncio.get_event_loop().create_future()
+    self._pending_saves[id_] = (filename, future)
+    try:
+      # only the session's own page, not every viewer
+      await self.sio.emit("request_image_data", {"figure": figure.id_, "id": id_}, to=page.sid)
+    except BaseException:
+      self._pending_saves.pop(id_, None)
+      raise
+    return asyncio.ensure_future(self._wait_image_data(figure, id_, future))
 
-  async def _request_image_data(self):
-    await self.sio.emit("request_image_data")
-    return await wait_with_timeout(self._is_saving, SAVE_TIMEOUT)
-  
+  async def _wait_image_data(self, figure, id_, future):
+    try:
+      return await asyncio.wait_for(future, SAVE_TIMEOUT)
+    except asyncio.TimeoutError:
+      self._metrics.increment("save_timeouts")
+      raise RuntimeError(f"The page didn't send an image of figure {figure.id_} within {SAVE_TIMEOUT}s")
+    finally:
+      self._pending_saves.pop(id_, None)
+
+  # decoding and writing happen on the I/O threads, the loop only hands the data over
   async def _receive_image_data(self, sid, params):
-    with urlopen(params) as image:
-      data = image.read()
-      with open(self._save_file, "wb") as f:
-        f.write(data)
-    self._is_saving.set()
+    pending = self._pending_saves.pop(params.get("id"), None)
+    if pending is None:
+      # timed out already
+      return False
+    filename, future = pending
+    try:
+      if not params.get("data"):
+        raise RuntimeError(f"The page has no chart for figure {params.get('figure')}")
+      loop = asyncio.get_event_loop()
+      await loop.run_in_executor(self._io_pool, _write_data_url, params["data"], filename)
+    except Exception as e:
+      if not future.done():
+        future.set_exception(e)
+      return False
+    if not future.done():
+      future.set_result(filename)
     return True
 
   async def _set_figure_size(self, width, height):
     await self._browser.set_figure_size(width, height)
+    self._update_viewports(self._browser.viewport)
+
+  async def _metrics_handler(self, request):
+    import aiohttp.web
+    if request.query.get("format") == "prometheus":
+      return aiohttp.web.Response(text=self._metrics.to_prometheus(),
+                                  content_type="text/plain")
+    return aiohttp.web.json_response(self.get_metrics())
+
+  # how many interactive update requests were received, dropped as stale and computed
+  def get_update_stats(self):
+    return self._scheduler.stats()
 
-  # right now, there can only be one figure per session, but this could easily be changed.
+  # histograms of per-phase timings in seconds and message sizes in bytes, counts of
+  # timeouts, errors and connections, and the update scheduler's stats
+  def get_metrics(self):
+    metrics = self._metrics.snapshot()
+    if self._scheduler is not None:
+      metrics["scheduler"] = self._scheduler.stats()
+    if self._process_pool is not None:
+      metrics["workers"] = self._process_pool.stats()
+    if self._fanout is not None:
+      metrics["clients"] = self.get_client_stats()
+    return metrics
+
+  # per connected page (by socket.io sid): frames sent, acked, skipped because the
+  # page was still drawing and lost, and the latency from sending a frame to its ack
+  def get_client_stats(self):
+    return self._fanout.stats() if self._fanout is not None else {}
+
+  # the figure every session starts with
   def get_figure(self):
     return self._figure
 
+  # another figure on the same page, show() puts all figures of the session in a grid
+  def new_figure(self):
+    figure = _Figure(str(len(self._figures)))
+    self._figures.append(figure)
+    self._send_full.add(figure.id_)
+    self._update_viewports()
+    return figure
+
   # set height/width of figure viewport in px to be shown in Chromium.
   # the control panel for interactive figures takes up space, so this won't work correctly
   # in interactive mode (for now).
   def set_figure_size(self, width, height):
+    if self._renderer == "raster":
+      self._update_viewports((width, height, 2 if self._retina else 1))
+      return
+    if self._daemon is not None:
+      scale = 2 if self._retina else 1
+      self._daemon.set_figure_size(self._daemon_session, width, height, scale)
+      self._update_viewports((width, height, scale))
+      return
     future = self.main_thread_event_loop.run_until_complete(self._set_figure_size(width, height))
 
-  def show(self, blocking : bool = True):
-    self.figure_data = self._figure._get_data()
-    future = asyncio.run_coroutine_threadsafe(self._emit(), self.event_loop)
+  # send figure (a figure of this session or a list of them, all of them by default)
+  # to the page
+  def show(self, blocking : bool = True, figure=None):
+    figures = self._get_figures(figure)
+    if self._renderer == "raster":
+      raise RuntimeError("There is no page to show figures on with renderer='raster', use save()")
+    if self._daemon is not None:
+      if any(fig._get_interactive_plot() is not None for fig in figures):
+        raise RuntimeError("Interactive plots need a ChartSession without daemon=True")
+      for fig in figures:
+        self._daemon.show(self._daemon_session, fig._get_data())
+      if blocking:
+        input("Press enter to unblock.")
+      return
+    updates = [self._get_figure_update(fig) for fig in figures]
+    future = asyncio.run_coroutine_threadsafe(self._emit_all(updates), self.event_loop)
     if not future.result():  # waits until coroutine is executed or raises
-      raise RuntimeError("Could not update graph data")
+      raise RuntimeError(f"Could not update graph data, the page didn't render it within {RENDER_TIMEOUT}s")
     if blocking:
       input("Press enter to unblock.")
 
-  # save the figure as a png
-  def save(self, filename):
-    params = {"path": filename}
-    self.main_thread_event_loop.run_until_complete(self._browser.take_screenshot(params))
+  # send the points added with _Plot.append() since the last show()/push(). The browser
+  # appends them to its datasets, so the cost doesn't depend on the history kept.
+  # Decimated streams are sent whole, decimated to the viewport again.
+  def push(self, figure=None):
+    if self._renderer == "raster":
+      raise RuntimeError("There is no page to push to with renderer='raster', use save()")
+    if self._daemon is not None:
+      return self.show(blocking=False, figure=figure)
+    updates = [self._get_figure_update(fig, stream=True) for fig in self._get_figures(figure)]
+    future = asyncio.run_coroutine_threadsafe(self._emit_all(updates), self.event_loop)
+    if not future.result():
+      raise RuntimeError(f"Could not update graph data, the page didn't render it within {RENDER_TIMEOUT}s")
+
+  # save a figure as a png, the first figure by default. For a list of figures the
+  # id is added to each file name (plot.png -> plot_0.png, plot_1.png, ...).
+  # Returns the file names written.
+  def save(self, filename, figure=None):
+    figures, filenames = self._save_targets(filename, figure)
+    for fig, name in zip(figures, filenames):
+      with self._metrics.time("save_seconds"):
+        self._save_figure(fig, name)
+    return filenames
+
+  # Render figure's interactive function (see _InteractivePlot.set_function) once per
+  # parameter set and save each frame to out_pattern formatted with the frame number i
+  # and the parameters, e.g. "frames/{i:04d}_a={a:.2f}.png". param_grid is a dict of
+  # name -> values (every combination, in order) or a list of parameter dicts. f is
+  # sampled for all frames in parallel on the workers, and each frame goes to the page
+  # as a delta of the interactive dataset and the axes, the other plots stay there.
+  # Returns counts of saved and failed frames, the failures, the files, the total time
+  # and the frames per second.
+  def sweep(self, param_grid, out_pattern, figure=None, xmin=None, xmax=None,
+            ymin=None, ymax=None):
+    figure, ipl, frames = self._sweep_setup(param_grid, figure, xmin, xmax, ymin, ymax)
+    if self._renderer == "raster":
+      loop = asyncio.new_event_loop()
+      try:
+        return loop.run_until_complete(self._sweep(figure, ipl, frames, out_pattern))
+      finally:
+        loop.close()
+    future = asyncio.run_coroutine_threadsafe(self._sweep(figure, ipl, frames, out_pattern),
+                                              self.event_loop)
+    return future.result()
+
+  def _sweep_setup(self, param_grid, figure, xmin, xmax, ymin, ymax):
+    if self._daemon is not None:
+      raise RuntimeError("Interactive plots need a ChartSession without daemon=True")
+    if figure is None:
+      figure = self._figure
+    self._get_figures(figure)
+    ipl = figure._get_interactive_plot()
+    if ipl is None or not ipl.func_params:
+      raise ValueError("sweep() needs a figure with an interactive function, "
+                       "see add_interactive_plot() and set_function()")
+    if xmin is None or xmax is None:
+      xmin, xmax = figure._defaultXAxis.ax_min, figure._defaultXAxis.ax_max
+      if xmin is None:
+        raise ValueError("The figure has no x range yet, pass xmin and xmax")
+    ylims = None if ymin is None or ymax is None else (ymin, ymax)
+    return figure, ipl, _sweep_frames(param_grid, ipl.func_params, (xmin, xmax), ylims)
+
+  async def _sweep(self, figure, ipl, frames, out_pattern):
+    loop = asyncio.get_event_loop()
+    stats = {"rendered": 0, "failed": 0, "failures": [], "files": []}
+    start = time.perf_counter()
+    tokens = [threading.Event() for _ in frames]
+    # everything is sampled up front, frames are drawn in order as their results come in
+    results = [loop.run_in_executor(self._thread_pool, ipl.get_result, params, cancel,
+                                    self._process_pool, self._metrics)
+               for (_, params), cancel in zip(frames, tokens)]
+    saves = []
+    try:
+      for (i, params), result, cancel in zip(frames, results, tokens):
+        path = out_pattern.format(i=i, **params["parameters"])
+        try:
+          try:
+            xi, yi = await asyncio.wait_for(result, self._eval_timeout)
+          except asyncio.TimeoutError:
+            self._abandon_evaluation(cancel)
+            raise RuntimeError(f"Evaluating f took longer than {self._eval_timeout}s, gave up.")
+          error = ipl._apply_result(params, xi, yi)["error"]
+          if error:
+            raise RuntimeError("".join(error))
+          saves.append((path, await self._sweep_frame(figure, path)))
+        except Exception as e:
+          stats["failed"] += 1
+          stats["failures"].append((path, ''.join(exception_as_string(e))))
+      # the last images are still being written
+      for path, save in saves:
+        try:
+          await save
+          stats["rendered"] += 1
+          stats["files"].append(path)
+        except Exception as e:
+          stats["failed"] += 1
+          stats["failures"].append((path, ''.join(exception_as_string(e))))
+    finally:
+      for cancel in tokens:
+        cancel.set()
+    stats["seconds"] = time.perf_counter() - start
+    stats["frames_per_second"] = stats["rendered"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+  # draw the figure as it is now and start saving it, returns the pending save. The
+  # image request is queued before this returns, so the page captures this frame
+  # before the next one can reach it.
+  async def _sweep_frame(self, figure, path):
+    if self._renderer == "raster":
+      spec = figure._get_static_data("float64")
+      loop = asyncio.get_event_loop()
+      return loop.run_in_executor(self._io_pool, save_spec_png, spec, path, *figure._viewport)
+    if not await self._emit(*self._get_figure_update(figure)):
+      raise RuntimeError(f"Could not update graph data, the page didn't render it within {RENDER_TIMEOUT}s")
+    return await self._send_image_request(figure, path)
+
+  # like save(), but returns straight away with a concurrent.futures.Future per file
+  # that resolves to its name, so a loop saving every frame doesn't wait on the disk.
+  # With the browser, the image is the figure's canvas as the page shows it (after
+  # show() or push()), sent by the page and written on a thread pool.
+  def save_async(self, filename, figure=None):
+    figures, filenames = self._save_targets(filename, figure)
+    futures = []
+    for fig, name in zip(figures, filenames):
+      future = self._submit_save(fig, name)
+      self._track_save(future)
+      futures.append(future)
+    return futures
+
+  def _submit_save(self, figure, filename):
+    if self._renderer == "raster":
+      # serialized now, the figure may change before a worker gets to it
+      spec = figure._get_static_data("float64")
+      return self._io_pool.submit(save_spec_png, spec, filename, *figure._viewport)
+    if self._daemon is not None:
+      return self._io_pool.submit(self._save_figure, figure, filename)
+    return asyncio.run_coroutine_threadsafe(self._request_image_data(figure, filename),
+                                            self.event_loop)
+
+  def _track_save(self, future):
+    start = time.perf_counter()
+    self._save_futures.add(future)
+    def done(future):
+      self._save_futures.discard(future)
+      self._metrics.observe("save_seconds", time.perf_counter() - start)
+    future.add_done_callback(done)
+
+  def _save_targets(self, filename, figure):
+    if figure is None:
+      figure = self._figure
+    figures = self._get_figures(figure)
+    if isinstance(figure, (list, tuple)):
+      root, ext = os.path.splitext(filename)
+      return figures, [f"{root}_{fig.id_}{ext}" for fig in figures]
+    return figures, [filename]
+
+  # returns filename
+  def _save_figure(self, figure, filename):
+    if self._renderer == "raster":
+      save_png(figure, filename)
+    elif self._daemon is not None:
+      # the daemon may have a different working directory
+      self._daemon.save(self._daemon_session, os.path.abspath(filename), figure.id_)
+    else:
+      params = {"path": filename}
+      self.main_thread_event_loop.run_until_complete(
+        self._browser.take_screenshot(params, f"#chart-{figure.id_} canvas"))
+    return filename
+
+  # stop the shared daemon started by ChartSession(daemon=True), if there is one
+  @staticmethod
+  def shutdown_daemon():
+    from .daemon import _DaemonClient
+    client = _DaemonClient.find()
+    if client is None:
+      return False
+    client.shutdown()
+    return True
+
+# (frame number, get_result params) for each parameter set of a sweep
+def _sweep_frames(param_grid, names, xlims, ylims):
+  if isinstance(param_grid, dict):
+    keys = list(param_grid)
+    sets = [dict(zip(keys, values)) for values in itertools.product(*param_grid.values())]
+  else:
+    sets = [dict(parameters) for parameters in param_grid]
+  frames = []
+  for i, parameters in enumerate(sets):
+    missing = [name for name in names if name not in parameters]
+    if missing:
+      raise ValueError(f"Frame {i} has no value for {', '.join(missing)}")
+    params = {"xmin": xlims[0], "xmax": xlims[1], "parameters": parameters}
+    if ylims is not None:
+      params["ymin"], params["ymax"] = ylims
+    frames.append((i, params))
+  return frames
 
+# write the payload of a base64 data: URL, e.g. canvas.toDataURL(), to path
+def _write_data_url(data_url, path):
+  header, _, payload = data_url.partition(",")
+  if not header.startswith("data:") or not header.endswith(";base64"):
+    raise ValueError("Expected a base64 data URL from the page")
+  data = base64.b64decode(payload)
+  with open(path, "wb") as f:
+    f.write(data)
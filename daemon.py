@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import secrets
+import stat
+import subprocess
+import sys
+import time
+from urllib.parse import parse_qs
+from urllib.request import Request, urlopen
+from urllib.error import URLError
+
+from .chart_session import STATIC_FILES, RENDER_TIMEOUT, BROWSER_LOAD_TIMEOUT, DISCONNECT_TIMEOUT
+from .encoding import dumps_spec, loads_spec
+from .utils import exception_as_string
+
+DAEMON_HOST = "localhost"
+DAEMON_START_TIMEOUT = 20
+REQUEST_TIMEOUT = 30
+# idle pages are closed, then the browser, then the daemon exits
+PAGE_IDLE_TIMEOUT = 60
+BROWSER_IDLE_TIMEOUT = 5 * 60
+DAEMON_IDLE_TIMEOUT = 60 * 60
+JANITOR_INTERVAL = 5
+
+# where a running daemon leaves its pid, port and token, one daemon per user. The
+# directory is the user's own (0700), so nobody else can plant or read the file.
+def state_dir():
+  base = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache")
+  path = os.path.join(base, "chartjs-python")
+  os.makedirs(path, mode=0o700, exist_ok=True)
+  info = os.lstat(path)
+  if not stat.S_ISDIR(info.st_mode) or not _owned_by_user(info) or stat.S_IMODE(info.st_mode) & 0o077:
+    raise RuntimeError(f"{path} has to be a directory of this user that only they can access")
+  return path
+
+def state_file():
+  return os.path.join(state_dir(), "daemon.json")
+
+def _owned_by_user(info):
+  return not hasattr(os, "getuid") or info.st_uid == os.getuid()
+
+# write the state file, replacing one a daemon that died left behind. Created with
+# 0600 from the start and never through a symlink.
+def _write_state(state):
+  path = state_file()
+  with contextlib.suppress(FileNotFoundError):
+    os.remove(path)
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+  with os.fdopen(fd, "w") as f:
+    json.dump(state, f)
+
+# the state file if it's a regular file of this user that only they can read
+def _read_state():
+  path = state_file()
+  fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+  with os.fdopen(fd) as f:
+    info = os.fstat(f.fileno())
+    if not stat.S_ISREG(info.st_mode) or not _owned_by_user(info) or stat.S_IMODE(info.st_mode) != 0o600:
+      raise ValueError(f"Ignoring {path}, it isn't a 0600 file of this user")
+    return json.load(f)
+
+# aiohttp is only imported in the daemon process, sessions attaching to it don't need it
+def _json_response(data, status=200):
+  import aiohttp.web
+  return aiohttp.web.json_response(data, status=status)
+
+# A browser page of the daemon. It's opened with a token in its URL that its socket.io
+# connection carries, which is how the daemon knows which connection is this page,
+# also after it reconnects under a new sid.
+class _DaemonPage(object):
+  def __init__(self, page):
+    self.page = page
+    self.token = secrets.token_urlsafe(12)
+    # the page's current socket.io connection, None while it's disconnected
+    self.sid = None
+    self.connected = asyncio.Event()
+    self.rendered = asyncio.Event()
+
+  # the current sid, after waiting for the page to (re)connect
+  async def get_sid(self):
+    await asyncio.wait_for(self.connected.wait(), BROWSER_LOAD_TIMEOUT)
+    return self.sid
+
+# the page token a socket.io connection was opened with, if any
+def _page_token(environ):
+  return (parse_qs((environ or {}).get("QUERY_STRING", "")).get("page") or [None])[0]
+
+# A persistent server + Chromium that ChartSession(daemon=True) in any process
+# attaches to over HTTP. Each attached session gets its own page (see _DaemonPage),
+# pages of closed sessions are kept around for reuse for a while.
+class _ChartDaemon(object):
+  def __init__(self, headless=False):
+    self.headless = headless
+    self.token = secrets.token_urlsafe()
+    self.browser = None
+    self._sessions = {}  # session id -> _DaemonPage
+    self._idle_pages = []  # (_DaemonPage, released at)
+    self._pages = {}  # page token -> _DaemonPage
+    self._page_sids = {}  # sid -> _DaemonPage
+    self._last_activity = time.monotonic()
+
+  async def start(self):
+    self._page_lock = asyncio.Lock()
+    self._stopped = asyncio.Event()
+    import aiohttp.web
+    import socketio
+    # bound methods can't be marked as new style middleware
+    @aiohttp.web.middleware
+    async def check_token(request, handler):
+      return await self._check_token(request, handler)
+    self.app = aiohttp.web.Application(middlewares=[check_token])
+    self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins="*")
+    self.sio.attach(self.app)
+    self.sio.on("connect", self._record_connection)
+    self.sio.on("graph_updated", self._graph_updated)
+    self.sio.on("disconnect", self._remove_connection)
+    self.app.router.add_get("/daemon/ping", self._ping)
+    self.app.router.add_post("/daemon/sessions", self._open_session)
+    self.app.router.add_delete("/daemon/sessions/{session}", self._close_session)
+    self.app.router.add_post("/daemon/sessions/{session}/show", self._show)
+    self.app.router.add_post("/daemon/sessions/{session}/save", self._save)
+    self.app.router.add_post("/daemon/sessions/{session}/size", self._set_size)
+    self.app.router.add_post("/daemon/shutdown", self._shutdown)
+    self.app.router.add_static("/", STATIC_FILES)
+    self.runner = aiohttp.web.AppRunner(self.app)
+    await self.runner.setup()
+    site = aiohttp.web.TCPSite(self.runner, DAEMON_HOST, 0)
+    await site.start()
+    self.port = self.runner.addresses[0][1]
+    _write_state({"pid": os.getpid(), "port": self.port, "token": self.token})
+
+  async def run(self):
+    await self.start()
+    janitor = asyncio.ensure_future(self._janitor())
+    try:
+      await self._stopped.wait()
+    finally:
+      # stop new clients from attaching first
+      with contextlib.suppress(FileNotFoundError):
+        os.remove(state_file())
+      janitor.cancel()
+      await self._close_browser()
+      with contextlib.suppress(Exception):
+        await asyncio.wait_for(self.runner.cleanup(), DISCONNECT_TIMEOUT)
+
+  # the static app is public, the control API needs the token from the state file
+  async def _check_token(self, request, handler):
+    if request.path.startswith("/daemon/"):
+      if request.headers.get("X-Daemon-Token") != self.token:
+        return _json_response({"error": "bad token"}, status=403)
+      self._last_activity = time.monotonic()
+    return await handler(request)
+
+  async def _janitor(self):
+    while True:
+      await asyncio.sleep(JANITOR_INTERVAL)
+      now = time.monotonic()
+      for entry in [e for e in self._idle_pages if now - e[1] > PAGE_IDLE_TIMEOUT]:
+        self._idle_pages.remove(entry)
+        await self._close_page(entry[0])
+      idle = now - self._last_activity
+      if not self._sessions and self.browser is not None and idle > BROWSER_IDLE_TIMEOUT:
+        await self._close_browser()
+      if not self._sessions and idle > DAEMON_IDLE_TIMEOUT:
+        self._stopped.set()
+
+  async def _close_browser(self):
+    browser, self.browser = self.browser, None
+    self._idle_pages = []
+    self._pages = {}
+    if browser is not None:
+      with contextlib.suppress(Exception):
+        await browser.close()
+
+  async def _new_page(self):
+    async with self._page_lock:
+      if self.browser is None:
+        from pyppeteer import launch
+        self.browser = await launch(headless=self.headless, handleSIGINT=False,
+                                    handleSIGTERM=False, handleSIGHUP=False)
+      page = _DaemonPage(await self.browser.newPage())
+      self._pages[page.token] = page
+      try:
+        await page.page.goto(f"http://{DAEMON_HOST}:{self.port}/index.html?page={page.token}")
+        await page.get_sid()
+      except BaseException:
+        await self._close_page(page)
+        raise
+      return page
+
+  async def _close_page(self, page):
+    self._pages.pop(page.token, None)
+    with contextlib.suppress(Exception):
+      await page.page.close()
+
+  # only the daemon's own pages, by the token in their URL
+  async def _record_connection(self, sid, environ, auth=None):
+    page = self._pages.get(_page_token(environ))
+    if page is None:
+      from socketio.exceptions import ConnectionRefusedError
+      raise ConnectionRefusedError("Not a page of this daemon")
+    page.sid = sid
+    self._page_sids[sid] = page
+    page.connected.set()
+
+  async def _remove_connection(self, sid):
+    page = self._page_sids.pop(sid, None)
+    if page is not None and page.sid == sid:
+      page.sid = None
+      page.connected.clear()
+
+  async def _graph_updated(self, sid, params=None):
+    page = self._page_sids.get(sid)
+    if page is not None:
+      page.rendered.set()
+
+  def _get_session(self, request):
+    session = self._sessions.get(request.match_info["session"])
+    if session is None:
+      import aiohttp.web
+      raise aiohttp.web.HTTPNotFound()
+    return session
+
+  async def _ping(self, request):
+    return _json_response({
+      "pid": os.getpid(),
+      "sessions": len(self._sessions),
+      "idle_pages": len(self._idle_pages),
+      "browser": self.browser is not None,
+    })
+
+  async def _open_session(self, request):
+    page = None
+    while self._idle_pages and page is None:
+      page, _ = self._idle_pages.pop()
+      try:
+        # figures of the page's previous session
+        await self.sio.emit("clear_graphs", room=await page.get_sid())
+      except asyncio.TimeoutError:
+        # it didn't come back
+        await self._close_page(page)
+        page = None
+    if page is None:
+      page = await self._new_page()
+    session = secrets.token_urlsafe(12)
+    self._sessions[session] = page
+    return _json_response({"session": session})
+
+  async def _close_session(self, request):
+    page = self._get_session(request)
+    del self._sessions[request.match_info["session"]]
+    self._idle_pages.append((page, time.monotonic()))
+    return _json_response({})
+
+  async def _show(self, request):
+    page = self._get_session(request)
+    spec = loads_spec(await request.text())
+    try:
+      sid = await page.get_sid()
+    except asyncio.TimeoutError:
+      return _json_response({"error": "the page is disconnected"}, status=503)
+    page.rendered.clear()
+    await self.sio.emit("update_graph", spec, room=sid)
+    try:
+      await asyncio.wait_for(page.rendered.wait(), RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+      return _json_response({"error": "render timed out"}, status=504)
+    return _json_response({})
+
+  async def _save(self, request):
+    page = self._get_session(request)
+    params = await request.json()
+    selector = f"#chart-{params['figure']} canvas" if params.get("figure") is not None else "canvas"
+    canvas = await page.page.querySelector(selector)
+    await canvas.screenshot({"path": params["path"]})
+    return _json_response({})
+
+  async def _set_size(self, request):
+    page = self._get_session(request)
+    params = await request.json()
+    await page.page.setViewport(params)
+    return _json_response({})
+
+  async def _shutdown(self, request):
+    self._stopped.set()
+    return _json_response({})
+
+# HTTP client for the daemon, used by ChartSession(daemon=True). Only needs the stdlib.
+class _DaemonClient(object):
+  def __init__(self, state):
+    self.port = state["port"]
+    self.token = state["token"]
+    self.pid = state["pid"]
+
+  def request(self, method, path, body=None, timeout=REQUEST_TIMEOUT):
+    data = body.encode() if isinstance(body, str) else body
+    req = Request(f"http://{DAEMON_HOST}:{self.port}{path}", data=data, method=method,
+                  headers={"X-Daemon-Token": self.token, "Content-Type": "application/json"})
+    with urlopen(req, timeout=timeout) as response:
+      return json.loads(response.read() or b"{}")
+
+  def ping(self):
+    return self.request("GET", "/daemon/ping", timeout=2)
+
+  @classmethod
+  def find(cls):
+    try:
+      client = cls(_read_state())
+      client.ping()
+      return client
+    except (OSError, ValueError, KeyError, URLError):
+      return None
+
+  # attach to the running daemon, starting one first if there is none
+  @classmethod
+  def attach(cls, headless=False):
+    client = cls.find()
+    if client is not None:
+      return client
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+      [os.path.dirname(package_dir)] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    args = [sys.executable, "-m", f"{__package__}.daemon", "serve"]
+    if headless:
+      args.append("--headless")
+    subprocess.Popen(args, env=env, start_new_session=True, stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+      time.sleep(0.05)
+      client = cls.find()
+      if client is not None:
+        return client
+    raise RuntimeError("Could not start chart daemon")
+
+  def open_session(self):
+    return self.request("POST", "/daemon/sessions", "{}")["session"]
+
+  def close_session(self, session):
+    self.request("DELETE", f"/daemon/sessions/{session}")
+
+  def show(self, session, spec):
+    self.request("POST", f"/daemon/sessions/{session}/show", dumps_spec(spec))
+
+  def save(self, session, path, figure_id=None):
+    self.request("POST", f"/daemon/sessions/{session}/save",
+                 json.dumps({"path": path, "figure": figure_id}))
+
+  def set_figure_size(self, session, width, height, scale):
+    self.request("POST", f"/daemon/sessions/{session}/size", json.dumps(
+      {"width": width, "height": height, "deviceScaleFactor": scale}))
+
+  def shutdown(self):
+    self.request("POST", "/daemon/shutdown", "{}")
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Persistent chart server shared by ChartSessions.")
+  parser.add_argument("command", choices=["serve", "status", "stop"])
+  parser.add_argument("--headless", action="store_true")
+  args = parser.parse_args(argv)
+  if args.command == "serve":
+    if _DaemonClient.find() is not None:
+      print ("A daemon is already running.")
+      return 1
+    loop = asyncio.new_event_loop()
+    try:
+      loop.run_until_complete(_ChartDaemon(args.headless).run())
+    except Exception as e:
+      print (''.join(exception_as_string(e)))
+      return 1
+    finally:
+      loop.close()
+    return 0
+  client = _DaemonClient.find()
+  if client is None:
+    print ("No daemon running.")
+    return 1
+  if args.command == "status":
+    print (json.dumps(client.ping()))
+  else:
+    client.shutdown()
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
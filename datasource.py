@@ -0,0 +1,213 @@
+import itertools
+
+import numpy as np
+
+from .decimation import DECIMATION_MODES, lttb
+
+# Data that doesn't have to fit in memory: .npy files and raw binary buffers are
+# memory-mapped, CSV files are parsed a block of lines at a time. Everything computed
+# from a source (extents, decimation, binning) is a streaming pass over chunks of
+# chunk_rows rows, converted to float64 one chunk at a time, so peak memory depends on
+# chunk_rows and the size of the output, not on the size of the file.
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+class _DataSource(object):
+  def __init__(self, chunk_rows):
+    if chunk_rows < 1:
+      raise ValueError("chunk_rows must be at least 1")
+    self.chunk_rows = chunk_rows
+    self._extents = None
+
+  # number of columns each chunk has, 1 (x) or 2 (x, y)
+  @property
+  def width(self):
+    raise NotImplementedError
+
+  # float64 arrays (x,) or (x, y) of up to chunk_rows rows each
+  def chunks(self):
+    raise NotImplementedError
+
+  # [(min, max)] per column ignoring NaN/inf, (None, None) for columns without finite
+  # values. One pass, cached.
+  def extents(self):
+    if self._extents is None:
+      lo = np.full(self.width, np.inf)
+      hi = np.full(self.width, -np.inf)
+      for chunk in self.chunks():
+        for i, column in enumerate(chunk):
+          finite = column[np.isfinite(column)]
+          if finite.size:
+            lo[i] = min(lo[i], finite.min())
+            hi[i] = max(hi[i], finite.max())
+      self._extents = [(float(a), float(b)) if a <= b else (None, None) for a, b in zip(lo, hi)]
+    return self._extents
+
+# columns of array-likes indexable by row slices, e.g. np.memmap or np.load(mmap_mode="r")
+class _ArraySource(_DataSource):
+  def __init__(self, columns, chunk_rows):
+    super().__init__(chunk_rows)
+    self._columns = columns
+    if any(c.shape[0] != columns[0].shape[0] for c in columns):
+      raise ValueError("columns of a data source must have the same length")
+
+  @property
+  def width(self):
+    return len(self._columns)
+
+  def __len__(self):
+    return self._columns[0].shape[0]
+
+  def chunks(self):
+    for start in range(0, len(self), self.chunk_rows):
+      stop = start + self.chunk_rows
+      yield tuple(np.asarray(c[start:stop], dtype=np.float64) for c in self._columns)
+
+# one or two .npy files memory-mapped. For a 2D array, columns picks the x (and y)
+# column; with y_path, path holds x and y_path holds y.
+class NpySource(_ArraySource):
+  def __init__(self, path, y_path=None, columns=(0, 1), chunk_rows=DEFAULT_CHUNK_ROWS):
+    data = np.load(path, mmap_mode="r")
+    if y_path is not None:
+      arrays = [data, np.load(y_path, mmap_mode="r")]
+    elif data.ndim == 1:
+      arrays = [data]
+    else:
+      arrays = [data[:, c] for c in columns]
+    super().__init__(arrays, chunk_rows)
+
+# a headerless binary file of rows of row_width values of dtype, memory-mapped
+class RawSource(_ArraySource):
+  def __init__(self, path, dtype="<f8", row_width=2, columns=(0, 1), offset=0,
+               chunk_rows=DEFAULT_CHUNK_ROWS):
+    data = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=offset)
+    rows = data.shape[0] // row_width
+    data = data[:rows * row_width].reshape(rows, row_width)
+    super().__init__([data[:, c] for c in columns[:row_width]], chunk_rows)
+
+# a delimited text file read chunk_rows lines at a time. columns are indices or, with
+# header, names from the first line. Empty or unparseable fields become NaN.
+class CsvSource(_DataSource):
+  def __init__(self, path, columns=(0, 1), delimiter=",", header=True,
+               chunk_rows=DEFAULT_CHUNK_ROWS // 4, encoding="utf-8"):
+    super().__init__(chunk_rows)
+    self.path = path
+    self.delimiter = delimiter
+    self.header = header
+    self.encoding = encoding
+    names = None
+    if header:
+      with open(path, encoding=encoding) as f:
+        names = [n.strip().strip('"') for n in f.readline().rstrip("\r\n").split(delimiter)]
+    self._usecols = []
+    for c in columns:
+      if isinstance(c, str):
+        if names is None or c not in names:
+          raise ValueError(f"column {c!r} not in the header of {path}")
+        c = names.index(c)
+      self._usecols.append(c)
+
+  @property
+  def width(self):
+    return len(self._usecols)
+
+  def _parse(self, lines):
+    try:
+      data = np.loadtxt(lines, delimiter=self.delimiter, usecols=self._usecols,
+                        dtype=np.float64, ndmin=2)
+    except ValueError:
+      # slower, but takes missing values
+      data = np.genfromtxt(lines, delimiter=self.delimiter, usecols=self._usecols,
+                           dtype=np.float64, invalid_raise=False)
+      data = data.reshape(-1, len(self._usecols))
+    return tuple(np.ascontiguousarray(data[:, i]) for i in range(data.shape[1]))
+
+  def chunks(self):
+    with open(self.path, encoding=self.encoding) as f:
+      if self.header:
+        f.readline()
+      while True:
+        lines = [line for line in itertools.islice(f, self.chunk_rows) if line.strip()]
+        if not lines:
+          break
+        yield self._parse(lines)
+
+def _bucket(values, lo, hi, count):
+  if hi <= lo:
+    return np.zeros(values.shape[0], dtype=np.int64)
+  return np.clip(((values - lo) * (count / (hi - lo))).astype(np.int64), 0, count - 1)
+
+# the lowest and highest point of each of n_buckets x columns over the whole source,
+# like decimation.minmax, sorted by x
+def stream_minmax(source, n_buckets):
+  (xlo, xhi), _ = source.extents()
+  if xlo is None:
+    return np.empty(0), np.empty(0)
+  ymin = np.full(n_buckets, np.inf)
+  ymax = np.full(n_buckets, -np.inf)
+  xmin_at = np.zeros(n_buckets)
+  xmax_at = np.zeros(n_buckets)
+  for x, y in source.chunks():
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    if x.shape[0] == 0:
+      continue
+    b = _bucket(x, xlo, xhi, n_buckets)
+    # sorted by bucket, then y: the first of a bucket is its min, the last its max
+    order = np.lexsort((y, b))
+    bs = b[order]
+    starts = np.flatnonzero(np.r_[True, bs[1:] != bs[:-1]])
+    ends = np.r_[starts[1:], bs.shape[0]] - 1
+    buckets = bs[starts]
+    lo_i, hi_i = order[starts], order[ends]
+    lower = y[lo_i] < ymin[buckets]
+    ymin[buckets[lower]] = y[lo_i[lower]]
+    xmin_at[buckets[lower]] = x[lo_i[lower]]
+    higher = y[hi_i] > ymax[buckets]
+    ymax[buckets[higher]] = y[hi_i[higher]]
+    xmax_at[buckets[higher]] = x[hi_i[higher]]
+  occupied = np.isfinite(ymin)
+  xs = np.r_[xmin_at[occupied], xmax_at[occupied]]
+  ys = np.r_[ymin[occupied], ymax[occupied]]
+  order = np.argsort(xs, kind="stable")
+  return xs[order], ys[order]
+
+# the first point in each occupied cell of a width x height grid, like
+# decimation.density, in the order they appear in the source
+def stream_density(source, width, height):
+  (xlo, xhi), (ylo, yhi) = source.extents()
+  if xlo is None or ylo is None:
+    return np.empty(0), np.empty(0)
+  cells = width * height
+  first = np.full(cells, -1, dtype=np.int64)
+  xs = np.empty(cells)
+  ys = np.empty(cells)
+  offset = 0
+  for x, y in source.chunks():
+    n = x.shape[0]
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    cell = _bucket(x[finite], xlo, xhi, width) * height + _bucket(y[finite], ylo, yhi, height)
+    cell, idx = np.unique(cell, return_index=True)
+    new = first[cell] < 0
+    cell, rows = cell[new], finite[idx[new]]
+    first[cell] = offset + rows
+    xs[cell] = x[rows]
+    ys[cell] = y[rows]
+    offset += n
+  occupied = np.flatnonzero(first >= 0)
+  order = occupied[np.argsort(first[occupied])]
+  return xs[order], ys[order]
+
+# (x, y) to send for a decimation mode and viewport size in device pixels. lttb runs on
+# a min/max reduction to a few points per pixel column, which is what it would pick
+# from anyway.
+def stream_decimate(source, mode, width, height, cell_size=2):
+  if mode == "minmax":
+    return stream_minmax(source, max(1, int(width)))
+  if mode == "lttb":
+    x, y = stream_minmax(source, max(1, 4 * int(width)))
+    idx = lttb(x, y, int(width))
+    return x[idx], y[idx]
+  if mode == "density":
+    return stream_density(source, max(1, int(width // cell_size)), max(1, int(height // cell_size)))
+  raise ValueError(f"decimation mode must be one of {DECIMATION_MODES}, got {mode!r}")
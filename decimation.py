@@ -0,0 +1,98 @@
+import numpy as np
+
+# Server-side point reduction. Every reducer returns sorted indices into the input
+# arrays, so labels and per-point styles can be picked with the same indices.
+# Inputs are assumed to be finite; _Plot filters out NaN/inf before calling these.
+
+DECIMATION_MODES = ("lttb", "minmax", "density")
+
+# Largest-Triangle-Three-Buckets, for lines sorted by x. Keeps n_out points.
+def lttb(x, y, n_out):
+  n = x.shape[0]
+  if n_out >= n or n_out < 3:
+    return np.arange(n)
+  # n_out - 2 buckets over the interior points, first and last point are always kept
+  edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+  starts = edges[:-1]
+  x_avg = np.add.reduceat(x[1:n - 1], starts - 1) / np.diff(edges)
+  y_avg = np.add.reduceat(y[1:n - 1], starts - 1) / np.diff(edges)
+  # the third vertex for the last bucket is the last point
+  x_avg = np.append(x_avg[1:], x[n - 1])
+  y_avg = np.append(y_avg[1:], y[n - 1])
+
+  idx = np.empty(n_out, dtype=np.int64)
+  idx[0] = 0
+  idx[-1] = n - 1
+  a = 0
+  for i in range(n_out - 2):
+    lo, hi = edges[i], edges[i + 1]
+    area = np.abs((x[a] - x_avg[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (y_avg[i] - y[a]))
+    a = lo + int(np.argmax(area))
+    idx[i + 1] = a
+  return idx
+
+# first position in each group where values equals the group's target value
+def _first_match(values, targets, group):
+  pos = np.flatnonzero(values == targets[group])
+  g = group[pos]
+  return pos[np.r_[True, g[1:] != g[:-1]]]
+
+# min/max envelope: keeps the lowest and highest point of each of n_buckets x columns,
+# which is exactly what a line drawn at one bucket per pixel column shows.
+def minmax(x, y, n_buckets):
+  n = x.shape[0]
+  if n_buckets < 1 or 2 * n_buckets >= n:
+    return np.arange(n)
+  lo, hi = x.min(), x.max()
+  if hi == lo:
+    bucket = np.zeros(n, dtype=np.int64)
+  else:
+    bucket = np.minimum(((x - lo) * (n_buckets / (hi - lo))).astype(np.int64), n_buckets - 1)
+  # sorted x (the usual case for lines) gives contiguous buckets and needs no sort
+  if np.any(bucket[1:] < bucket[:-1]):
+    order = np.argsort(bucket, kind="stable")
+  else:
+    order = np.arange(n)
+  b = bucket[order]
+  v = y[order]
+  starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+  group = np.repeat(np.arange(starts.shape[0]), np.diff(np.r_[starts, n]))
+  first_min = _first_match(v, np.minimum.reduceat(v, starts), group)
+  first_max = _first_match(v, np.maximum.reduceat(v, starts), group)
+  return np.unique(np.r_[order[first_min], order[first_max], 0, n - 1])
+
+# density-preserving sampling for scatter: one point per occupied cell of a
+# width x height grid. Dense regions collapse to what is visible, outliers survive.
+def density(x, y, width, height):
+  n = x.shape[0]
+  if width < 1 or height < 1 or width * height >= n:
+    return np.arange(n)
+  cx = _grid_cells(x, width)
+  cy = _grid_cells(y, height)
+  _, first = np.unique(cx * height + cy, return_index=True)
+  return np.sort(first)
+
+def _grid_cells(v, count):
+  lo, hi = v.min(), v.max()
+  if hi == lo:
+    return np.zeros(v.shape[0], dtype=np.int64)
+  return np.minimum(((v - lo) * (count / (hi - lo))).astype(np.int64), count - 1)
+
+# indices of the points to send for the given mode and viewport size in device pixels
+def decimate(x, y, mode, width, height, cell_size=2):
+  finite = np.isfinite(x) & np.isfinite(y)
+  if finite.all():
+    base = None
+  else:
+    base = np.flatnonzero(finite)
+    x = x[base]
+    y = y[base]
+  if mode == "lttb":
+    idx = lttb(x, y, int(width))
+  elif mode == "minmax":
+    idx = minmax(x, y, int(width))
+  elif mode == "density":
+    idx = density(x, y, int(width // cell_size), int(height // cell_size))
+  else:
+    raise ValueError(f"decimation mode must be one of {DECIMATION_MODES} or None, got {mode!r}")
+  return idx if base is None else base[idx]
@@ -0,0 +1,47 @@
+import base64
+import json
+
+import numpy as np
+
+# wire dtypes for binary datasets. Little-endian, which is what browsers use for typed arrays.
+PRECISIONS = {
+  "float32": "<f4",
+  "float64": "<f8",
+}
+
+def check_precision(precision):
+  if precision is not None and precision not in PRECISIONS:
+    raise ValueError(f"precision must be one of {sorted(PRECISIONS)} or None, got {precision!r}")
+  return precision
+
+# raw buffer for one coordinate column, sent as a socket.io binary attachment
+def encode_column(arr, precision):
+  return np.ascontiguousarray(arr, dtype=PRECISIONS[precision]).tobytes()
+
+def encode_columns(xdata, ydata, precision, labels=None):
+  return {
+    "dtype": precision,
+    "length": int(xdata.shape[0]),
+    "x": encode_column(xdata, precision),
+    "y": encode_column(ydata, precision),
+    "labels": None if labels is None else list(labels),
+  }
+
+# JSON for figure specs outside socket.io, where binary columns can't be attachments.
+# bytes become {"__bytes__": <base64>} and are turned back into bytes by loads_spec.
+class _SpecEncoder(json.JSONEncoder):
+  def default(self, o):
+    if isinstance(o, (bytes, bytearray)):
+      return {"__bytes__": base64.b64encode(o).decode("ascii")}
+    return super().default(o)
+
+def _decode_bytes(obj):
+  if len(obj) == 1 and "__bytes__" in obj:
+    return base64.b64decode(obj["__bytes__"])
+  return obj
+
+def dumps_spec(spec):
+  return json.dumps(spec, cls=_SpecEncoder)
+
+def loads_spec(text):
+  return json.loads(text, object_hook=_decode_bytes)
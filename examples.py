@@ -1,4 +1,11 @@
+import asyncio
+
+import numpy as np
+
 from .chart_session import ChartSession
+from .async_session import AsyncChartSession
+from .plot import new_figure
+from .batch_export import render_many
 
 def ex1():
   with ChartSession() as session:
@@ -40,7 +47,67 @@ def ex3():
     figure.set_title("test-title")
     session.show()
 
+def ex4():
+  def figures():
+    for i in range(100):
+      figure = new_figure()
+      plot = figure.get_new_plot()
+      x = np.linspace(0, 10, 1000)
+      plot.plot(x, np.sin(x * (i + 1) / 10), linecolor="#0000ff")
+      figure.set_title(f"sin({(i + 1) / 10}x)")
+      yield figure
+  stats = render_many(figures(), "batch_output", concurrency=8)
+  print (f"{stats['rendered']} rendered, {stats['failed']} failed, "
+         f"{stats['figures_per_second']:.1f} figures/s")
+
+def ex5():
+  with ChartSession() as session:
+    x = np.linspace(0, 10, 500)
+    figures = [session.get_figure()] + [session.new_figure() for _ in range(3)]
+    for i, figure in enumerate(figures):
+      plot = figure.get_new_plot()
+      plot.plot(x, np.sin(x * (i + 1)), linecolor="#0000ff")
+      figure.set_title(f"sin({i + 1}x)")
+    session.show(blocking=False)
+    session.save("grid.png", figure=figures)
+    session.show()
+
+def ex6():
+  x = np.random.normal(size=10 ** 7)
+  y = 0.5 * x + np.random.normal(size=10 ** 7)
+  with ChartSession() as session:
+    session.get_figure().get_new_plot().hist(x, bins=100)
+    session.new_figure().get_new_plot().hist2d(x, y, log=True)
+    session.new_figure().get_new_plot().hexbin(x, y, gridsize=40)
+    session.show()
+
+async def ex7():
+  async with AsyncChartSession() as session:
+    x = np.linspace(0, 10, 500)
+    figures = [session.get_figure(), session.new_figure()]
+    plots = [figure.get_new_plot() for figure in figures]
+    for i in range(10):
+      for plot, k in zip(plots, (1, 2)):
+        plot.plot(x, np.sin(k * x + i / 2), linecolor="#0000ff")
+      await session.show()
+      await session.save(f"frame_{i}.png", figure=figures)
+
+def ex8():
+  with ChartSession() as session:
+    figure = session.get_figure()
+    x = np.linspace(-5, 5, 200)
+    figure.get_new_plot().plot(x, np.sin(x), linecolor="#999999")
+    ipl = figure.add_interactive_plot()
+    ipl.set_function("def f(x, a):\n  return np.sin(a * x)")
+    stats = session.sweep({"a": np.linspace(0.5, 3, 100)}, "sweep_{i:03d}.png", xmin=-5, xmax=5)
+    print (f"{stats['rendered']} frames, {stats['frames_per_second']:.1f} frames/s")
+
 if __name__ == "__main__":
     ex1()
     ex2()
     ex3()
+    ex4()
+    ex5()
+    ex6()
+    asyncio.run(ex7())
+    ex8()
@@ -0,0 +1,188 @@
+import asyncio
+import time
+
+from .metrics import _Histogram, SECONDS_BUCKETS
+
+# Figure updates for any number of pages: each frame is encoded into socket.io packets
+# once and the same packets are written to every page, instead of letting sio.emit
+# encode the message per page. Pages ack every frame they draw (graph_updated); a page
+# still drawing the previous frame of a figure skips the new ones, and once it acks
+# gets one full update of the figure as of the last frame sent, so a slow page gets
+# the latest state instead of a backlog and doesn't hold up the others.
+#
+# Figures are only read by whoever serializes the updates, never here: the full
+# update for catching up comes along with a frame (see wants_snapshot), or is the last
+# update_graph itself. A page with nothing to catch up from yet, e.g. one that connects
+# after the figure was last sent as a delta, gets it with the next update.
+
+# a frame that wasn't acked within this many seconds is taken as lost
+ACK_TIMEOUT = 5
+
+# socket.io packets for an event, as sio.emit would build them for each page
+def encode_event(event, data):
+  from socketio import packet
+  encoded = packet.Packet(packet.EVENT, data=[event, data], namespace="/").encode()
+  return encoded if isinstance(encoded, list) else [encoded]
+
+class _Viewer(object):
+  def __init__(self, sid, eio_sid):
+    self.sid = sid
+    self.eio_sid = eio_sid
+    self.connected_at = time.time()
+    # figure id -> (time sent, future set on the ack) of the frame the page is drawing
+    self.in_flight = {}
+    # figure ids with frames the page missed, until it gets a full update
+    self.stale = set()
+    self.latency = _Histogram(SECONDS_BUCKETS)
+    self.sent = 0
+    self.acked = 0
+    self.skipped = 0
+    self.lost = 0
+
+  def stats(self):
+    return {
+      "connected_at": self.connected_at,
+      "frames_sent": self.sent,
+      "frames_acked": self.acked,
+      "frames_skipped": self.skipped,
+      "frames_lost": self.lost,
+      "in_flight": len(self.in_flight),
+      "latency_seconds": self.latency.to_dict(),
+    }
+
+class _FanOut(object):
+  def __init__(self, sio, metrics):
+    self._sio = sio
+    self._metrics = metrics
+    # sid -> _Viewer, in the order they connected
+    self._viewers = {}
+    # figure id -> packets of a full update of the figure as of the last frame sent
+    self._snapshots = {}
+
+  def __len__(self):
+    return len(self._viewers)
+
+  # the page that connected first, the session's own browser page
+  @property
+  def primary(self):
+    return next(iter(self._viewers.values()), None)
+
+  # a new page, stale for the figures other pages already have
+  async def add(self, sid, figure_ids):
+    viewer = self._viewers[sid] = _Viewer(sid, self._sio.manager.eio_sid_from_sid(sid, "/"))
+    viewer.stale.update(figure_ids)
+    for figure_id in figure_ids:
+      await self._catch_up(viewer, figure_id)
+    return viewer
+
+  def remove(self, sid):
+    viewer = self._viewers.pop(sid, None)
+    if viewer is not None:
+      # whoever waits on these looks at the next page instead
+      for _, future in viewer.in_flight.values():
+        if not future.done():
+          future.set_result(None)
+
+  # whether the next frame of figure_id should come with a snapshot, because a page is
+  # ready to catch up on it. Called from the thread that serializes the figure; if the
+  # answer is out of date, that page just catches up a frame later.
+  def wants_snapshot(self, figure_id):
+    now = time.perf_counter()
+    for viewer in list(self._viewers.values()):
+      sent = viewer.in_flight.get(figure_id)
+      if sent is None and figure_id in viewer.stale:
+        return True
+      # taken as lost by send()
+      if sent is not None and now - sent[0] > ACK_TIMEOUT:
+        return True
+    return False
+
+  # send a frame of figure data["id"] to every page that is ready for it. snapshot is
+  # the full update of the figure as of this frame, for pages catching up. Returns the
+  # size of the frame on the wire in bytes.
+  async def send(self, event, data, snapshot=None):
+    figure_id = data["id"]
+    packets = encode_event(event, data)
+    full = event == "update_graph"
+    if full:
+      self._snapshots[figure_id] = packets
+    elif snapshot is not None:
+      self._snapshots[figure_id] = encode_event("update_graph", snapshot)
+    else:
+      # out of date now
+      self._snapshots.pop(figure_id, None)
+    now = time.perf_counter()
+    for viewer in list(self._viewers.values()):
+      sent = viewer.in_flight.get(figure_id)
+      if sent is not None and now - sent[0] > ACK_TIMEOUT:
+        # the ack got lost or the page is stuck, it gets a snapshot instead
+        del viewer.in_flight[figure_id]
+        viewer.lost += 1
+        self._metrics.increment("frames_lost")
+        viewer.stale.add(figure_id)
+        sent = None
+      if sent is not None:
+        viewer.skipped += 1
+        self._metrics.increment("frames_skipped")
+        viewer.stale.add(figure_id)
+      elif figure_id in viewer.stale and not full:
+        await self._catch_up(viewer, figure_id)
+      else:
+        viewer.stale.discard(figure_id)
+        await self._write(viewer, figure_id, packets)
+    # the JSON is ASCII, binary attachments are bytes
+    return sum(len(p) for p in packets)
+
+  async def _write(self, viewer, figure_id, packets):
+    for p in packets:
+      await self._sio.eio.send(viewer.eio_sid, p)
+    viewer.in_flight[figure_id] = (time.perf_counter(), asyncio.get_event_loop().create_future())
+    viewer.sent += 1
+
+  # the full figure as of the last frame, encoded once for all pages catching up on it.
+  # Without one the page stays stale until a frame comes with a snapshot.
+  async def _catch_up(self, viewer, figure_id):
+    packets = self._snapshots.get(figure_id)
+    if packets is None:
+      return
+    viewer.stale.discard(figure_id)
+    self._metrics.increment("frames_caught_up")
+    await self._write(viewer, figure_id, packets)
+
+  async def ack(self, sid, figure_id):
+    viewer = self._viewers.get(sid)
+    if viewer is None:
+      return
+    sent = viewer.in_flight.pop(figure_id, None)
+    if sent is None:
+      return
+    latency = time.perf_counter() - sent[0]
+    viewer.latency.observe(latency)
+    viewer.acked += 1
+    self._metrics.observe("frame_latency_seconds", latency)
+    if not sent[1].done():
+      sent[1].set_result(latency)
+    if figure_id in viewer.stale:
+      await self._catch_up(viewer, figure_id)
+
+  # until the primary page has drawn the latest state of figure_id, False on timeout
+  # or if there is no page
+  async def wait_rendered(self, figure_id, timeout):
+    deadline = time.perf_counter() + timeout
+    while True:
+      viewer = self.primary
+      if viewer is None:
+        return False
+      sent = viewer.in_flight.get(figure_id)
+      if sent is None:
+        return figure_id not in viewer.stale
+      remaining = deadline - time.perf_counter()
+      if remaining <= 0:
+        return False
+      try:
+        await asyncio.wait_for(asyncio.shield(sent[1]), remaining)
+      except asyncio.TimeoutError:
+        return False
+
+  def stats(self):
+    return {sid: viewer.stats() for sid, viewer in self._viewers.items()}
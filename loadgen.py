@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from .server import _HostedServer
+from .utils import exception_as_string, cancel_pending_tasks
+
+# Load generator for the hosted server (server.py): N socket.io clients, each sets a
+# function of its own with get_function_update, then sends get_graph_update with new
+# parameters as soon as the previous one is drawn (closed loop, with optional think
+# time), acking every update like the page does. Prints throughput and latency
+# percentiles as JSON.
+#
+#   python -m <package>.loadgen --clients 200 --duration 30
+#
+# Without --url, a server is started in this process on a free port.
+
+CONNECT_TIMEOUT = 10
+REPLY_TIMEOUT = 30
+# every client gets a different constant, so no two sessions share compiled code
+CODE = "def f(x, a, b):\n  return np.sin(a * x) * np.exp(-b * x * x) + {offset}\n"
+
+# most seconds a client waits before trying again when the server is busy
+BUSY_BACKOFF = 0.5
+
+# requests turned away by the server's admission control
+def _is_busy(reply):
+  return "busy" in "".join(reply.get("error") or ())
+
+class _Client(object):
+  def __init__(self, url, index, think_time):
+    import socketio
+    self.url = url
+    self.index = index
+    self.think_time = think_time
+    self.sio = socketio.AsyncClient(reconnection=False)
+    self.replies = asyncio.Queue()
+    self.latencies = []
+    self.errors = 0
+    self.busy = 0
+    self.refused = False
+    for event in ("update_graph", "update_graph_delta"):
+      self.sio.on(event, self._on_update)
+    self.sio.on("update_function", self._on_function)
+
+  async def _on_update(self, data):
+    await self.sio.emit("graph_updated", {"figure": data.get("id")})
+    await self.replies.put(data)
+
+  async def _on_function(self, data):
+    await self.replies.put(data)
+
+  async def _request(self, event, params):
+    start = time.perf_counter()
+    await self.sio.emit(event, params)
+    reply = await asyncio.wait_for(self.replies.get(), REPLY_TIMEOUT)
+    return reply, time.perf_counter() - start
+
+  async def run(self, deadline):
+    import socketio
+    try:
+      await asyncio.wait_for(self.sio.connect(self.url), CONNECT_TIMEOUT)
+    except (socketio.exceptions.ConnectionError, asyncio.TimeoutError):
+      self.refused = True
+      return
+    try:
+      # the figure the server sends on connect
+      await asyncio.wait_for(self.replies.get(), REPLY_TIMEOUT)
+      rng = random.Random(self.index)
+      while True:
+        reply, _ = await self._request("get_function_update", {"code": CODE.format(offset=self.index)})
+        if not _is_busy(reply):
+          break
+        self.busy += 1
+        if time.perf_counter() > deadline:
+          return
+        await asyncio.sleep(rng.uniform(0, BUSY_BACKOFF))
+      if reply.get("error"):
+        self.errors += 1
+        return
+      while time.perf_counter() < deadline:
+        params = {"xmin": -10, "xmax": 10,
+                  "parameters": {"a": rng.uniform(0.5, 5), "b": rng.uniform(0, 0.1)}}
+        reply, latency = await self._request("get_graph_update", params)
+        if _is_busy(reply):
+          self.busy += 1
+        elif reply.get("error"):
+          self.errors += 1
+        else:
+          self.latencies.append(latency)
+        if self.think_time:
+          await asyncio.sleep(rng.expovariate(1 / self.think_time))
+    except asyncio.TimeoutError:
+      self.errors += 1
+    finally:
+      await self.sio.disconnect()
+
+# throughput and latency percentiles over all clients
+def summarize(clients, seconds):
+  latencies = np.array([l for c in clients for l in c.latencies])
+  completed = latencies.shape[0]
+  summary = {
+    "clients": len(clients),
+    "refused": sum(c.refused for c in clients),
+    "seconds": seconds,
+    "completed": completed,
+    "busy": sum(c.busy for c in clients),
+    "errors": sum(c.errors for c in clients),
+    "throughput_per_s": completed / seconds if seconds else None,
+  }
+  for name, q in (("p50_s", 50), ("p90_s", 90), ("p99_s", 99), ("max_s", 100)):
+    summary[name] = float(np.percentile(latencies, q)) if completed else None
+  return summary
+
+async def run(url, n_clients, duration, think_time=0, ramp_up=1.0):
+  clients = [_Client(url, i, think_time) for i in range(n_clients)]
+  start = time.perf_counter()
+  deadline = start + ramp_up + duration
+  tasks = []
+  for client in clients:
+    tasks.append(asyncio.ensure_future(client.run(deadline)))
+    # spread the connects out instead of hitting the server with all of them at once
+    await asyncio.sleep(ramp_up / n_clients)
+  await asyncio.gather(*tasks)
+  return summarize(clients, time.perf_counter() - start)
+
+async def _run_with_server(args):
+  server = None
+  url = args.url
+  if url is None:
+    server = _HostedServer(port=0, workers=args.workers, max_sessions=args.max_sessions,
+                           max_pending=args.max_pending)
+    await server.start()
+    url = f"http://{server.host}:{server.port}"
+  try:
+    summary = await run(url, args.clients, args.duration, args.think_time, args.ramp_up)
+    if server is not None:
+      summary["server"] = server.get_metrics()
+    return summary
+  finally:
+    if server is not None:
+      await server.stop()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Simulated clients for the hosted chart server.")
+  parser.add_argument("--url", default=None, help="server to load (default: start one here)")
+  parser.add_argument("--clients", type=int, default=50)
+  parser.add_argument("--duration", type=float, default=10, help="seconds of load after ramp up")
+  parser.add_argument("--ramp-up", type=float, default=1.0, help="seconds over which clients connect")
+  parser.add_argument("--think-time", type=float, default=0, help="mean seconds between a client's requests")
+  parser.add_argument("--workers", type=int, default=None, help="worker processes of the local server")
+  parser.add_argument("--max-sessions", type=int, default=None, help="of the local server")
+  parser.add_argument("--max-pending", type=int, default=None, help="of the local server")
+  parser.add_argument("--out", default=None, help="also write the results to this JSON file")
+  args = parser.parse_args(argv)
+  if args.max_sessions is None:
+    args.max_sessions = max(args.clients, 1)
+  loop = asyncio.new_event_loop()
+  try:
+    summary = loop.run_until_complete(_run_with_server(args))
+  except Exception as e:
+    print (''.join(exception_as_string(e)))
+    return 1
+  finally:
+    # engine.io's per-socket tasks outlive the server
+    loop.run_until_complete(cancel_pending_tasks())
+    loop.close()
+  text = json.dumps(summary, indent=2)
+  print (text)
+  if args.out:
+    with open(args.out, "w") as f:
+      f.write(text)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,205 @@
+import numpy as np
+
+from .decimation import minmax
+
+# Level-of-detail index for long lines: a pyramid of min/max tiles over x-sorted data.
+# Level 0 keeps, for every BLOCK consecutive points, the index and value of the lowest
+# and highest y; level L merges pairs of level L-1 tiles, so its tiles cover
+# BLOCK * 2**L points. Built once in O(n) and extended as points are appended, it
+# answers "what to draw between xlo and xhi at n_px columns" from the tiles of the
+# level with a few tiles per pixel column, so the cost of a query depends on n_px and
+# not on how many points are in view.
+
+BLOCK = 64
+# lines shorter than this are decimated directly, see _Plot._get_lod
+LOD_MIN_POINTS = 1 << 16
+# points read at a time while building level 0
+BUILD_CHUNK = BLOCK << 14
+
+# (x, y) arrays as a pyramid store. Stores index points by absolute position: first
+# is the oldest point still there (always 0 here, it moves as a _RingBuffer evicts)
+# and stop is one past the newest.
+class _ArrayStore(object):
+  def __init__(self, x, y):
+    self._x = x
+    self._y = y
+
+  @property
+  def first(self):
+    return 0
+
+  @property
+  def stop(self):
+    return self._x.shape[0]
+
+  def take(self, idx):
+    return self._x[idx], self._y[idx]
+
+  def read(self, start, stop):
+    return self._x[start:stop], self._y[start:stop]
+
+  def searchsorted(self, value, side="left"):
+    return int(np.searchsorted(self._x, value, side=side))
+
+# amortized O(1) append for the per-level arrays
+class _Column(object):
+  def __init__(self, dtype):
+    self._data = np.empty(64, dtype=dtype)
+    self.size = 0
+
+  def extend(self, values):
+    n = values.shape[0]
+    if self.size + n > self._data.shape[0]:
+      grown = np.empty(max(2 * self._data.shape[0], self.size + n), dtype=self._data.dtype)
+      grown[:self.size] = self._data[:self.size]
+      self._data = grown
+    self._data[self.size:self.size + n] = values
+    self.size += n
+
+  # drop the first count entries
+  def drop(self, count):
+    self._data[:self.size - count] = self._data[count:self.size]
+    self.size -= count
+
+  def view(self):
+    return self._data[:self.size]
+
+# tiles of one level: entry j is tile number base + j
+class _Level(object):
+  def __init__(self, base):
+    self.base = base
+    self.imin = _Column(np.int64)
+    self.imax = _Column(np.int64)
+    self.vmin = _Column(np.float64)
+    self.vmax = _Column(np.float64)
+
+  def __len__(self):
+    return self.imin.size
+
+  @property
+  def end(self):
+    return self.base + len(self)
+
+  def extend(self, imin, vmin, imax, vmax):
+    self.imin.extend(imin)
+    self.vmin.extend(vmin)
+    self.imax.extend(imax)
+    self.vmax.extend(vmax)
+
+  def drop_before(self, tile):
+    count = min(tile - self.base, len(self))
+    # compact only once most of the storage is dead, queries never reach those tiles
+    if count > 0 and 2 * count >= len(self):
+      for column in (self.imin, self.imax, self.vmin, self.vmax):
+        column.drop(count)
+      self.base += count
+
+class _MinMaxPyramid(object):
+  def __init__(self, store):
+    self.store = store
+    self._levels = []
+    # level 0 covers the points before _built
+    self._built = 0
+
+  # tiles for points appended (and evicted) since the last call
+  def update(self):
+    store = self.store
+    first = -(-store.first // BLOCK) * BLOCK
+    if first > self._built or not self._levels:
+      # everything built so far was evicted
+      self._levels = [_Level(first // BLOCK)]
+      self._built = first
+    stop = store.stop // BLOCK * BLOCK
+    level0 = self._levels[0]
+    for start in range(self._built, stop, BUILD_CHUNK):
+      end = min(start + BUILD_CHUNK, stop)
+      _, y = store.read(start, end)
+      tiles = y.reshape(-1, BLOCK)
+      offsets = start + BLOCK * np.arange(tiles.shape[0])
+      # NaN never wins, an all-NaN tile ends up with an infinite value
+      lo = np.where(np.isnan(tiles), np.inf, tiles)
+      hi = np.where(np.isnan(tiles), -np.inf, tiles)
+      amin = lo.argmin(axis=1)
+      amax = hi.argmax(axis=1)
+      rows = np.arange(tiles.shape[0])
+      level0.extend(offsets + amin, lo[rows, amin], offsets + amax, hi[rows, amax])
+    self._built = max(self._built, stop)
+    for depth in range(1, 64):
+      child = self._levels[depth - 1]
+      if depth == len(self._levels):
+        if len(child) < 2:
+          break
+        self._levels.append(_Level(-(-child.base // 2)))
+      if 2 * self._levels[depth].end < child.base:
+        # the next parent tile lost points to eviction, start this level over
+        self._levels[depth:] = [_Level(-(-child.base // 2))]
+      self._merge(child, self._levels[depth])
+    for depth, level in enumerate(self._levels):
+      level.drop_before(-(-store.first // (BLOCK << depth)))
+
+  # parent tiles whose two children are both complete
+  @staticmethod
+  def _merge(child, parent):
+    count = child.end // 2 - parent.end
+    if count <= 0:
+      return
+    j = 2 * parent.end - child.base
+    pairs = slice(j, j + 2 * count)
+    vmin = child.vmin.view()[pairs].reshape(-1, 2)
+    vmax = child.vmax.view()[pairs].reshape(-1, 2)
+    imin = child.imin.view()[pairs].reshape(-1, 2)
+    imax = child.imax.view()[pairs].reshape(-1, 2)
+    # ties go to the left child, like argmin/argmax
+    right_min = (vmin[:, 1] < vmin[:, 0]).astype(np.int64)
+    right_max = (vmax[:, 1] > vmax[:, 0]).astype(np.int64)
+    rows = np.arange(count)
+    parent.extend(imin[rows, right_min], vmin[rows, right_min],
+                  imax[rows, right_max], vmax[rows, right_max])
+
+  def _tiles(self, depth, start, stop):
+    level = self._levels[depth]
+    rows = slice(start - level.base, stop - level.base)
+    return (level.imin.view()[rows], level.vmin.view()[rows],
+            level.imax.view()[rows], level.vmax.view()[rows])
+
+  # sorted absolute indices of the points to draw for x in [xlo, xhi] at n_px pixel
+  # columns: the lowest and highest point of every tile in view, at the coarsest level
+  # with at least n_px tiles, plus the first and last point. One point on either side
+  # of the range is included so the line runs to the edges.
+  def query(self, xlo, xhi, n_px):
+    self.update()
+    store = self.store
+    n_px = max(1, int(n_px))
+    lo = store.first if xlo is None else max(store.searchsorted(xlo, "left") - 1, store.first)
+    hi = store.stop if xhi is None else min(store.searchsorted(xhi, "right") + 1, store.stop)
+    if hi - lo <= 2 * n_px:
+      return self._finite(np.arange(lo, hi))
+    if hi - lo < 2 * BLOCK * n_px:
+      # finer than the finest tiles, the range itself is only a few points per pixel
+      x, y = store.read(lo, hi)
+      finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+      return lo + finite[minmax(x[finite], y[finite], n_px)]
+
+    # at least two tiles per column, so there is always a whole tile in the range
+    depth = min(int(np.log2((hi - lo) / (2 * BLOCK * n_px))), len(self._levels) - 1)
+    size = BLOCK << depth
+    first_tile, stop_tile = -(-lo // size), hi // size
+    pieces = [self._tiles(depth, first_tile, stop_tile)]
+    # the partial tiles at the edges, from ever finer levels down to single points
+    left, right = first_tile * size, stop_tile * size
+    for finer in range(depth - 1, -1, -1):
+      finer_size = BLOCK << finer
+      if left - finer_size >= lo:
+        left -= finer_size
+        pieces.append(self._tiles(finer, left // finer_size, left // finer_size + 1))
+      if right + finer_size <= hi:
+        pieces.append(self._tiles(finer, right // finer_size, right // finer_size + 1))
+        right += finer_size
+    idx = [np.arange(lo, left), np.arange(right, hi), [lo, hi - 1]]
+    for imin, vmin, imax, vmax in pieces:
+      idx += [imin[np.isfinite(vmin)], imax[np.isfinite(vmax)]]
+    return self._finite(np.unique(np.concatenate(idx).astype(np.int64)))
+
+  def _finite(self, idx):
+    x, y = self.store.take(idx)
+    return idx[np.isfinite(x) & np.isfinite(y)]
@@ -0,0 +1,136 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+# Timings, sizes and counts collected by a ChartSession, see ChartSession.get_metrics()
+# and the /metrics route. Observations come from the event loop and from the worker
+# threads evaluating interactive functions, so everything is behind one lock.
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = tuple(4 ** k for k in range(5, 15))  # 1 kB to 256 MB
+COUNT_BUCKETS = tuple(4 ** k for k in range(2, 13))  # 16 to 16M
+
+# cumulative histogram in the Prometheus sense, plus min/max
+class _Histogram(object):
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.min = math.inf
+    self.max = -math.inf
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.sum += value
+    self.min = min(self.min, value)
+    self.max = max(self.max, value)
+
+  # upper bound of the bucket the q-quantile falls into
+  def quantile(self, q):
+    if not self.count:
+      return None
+    rank = q * self.count
+    seen = 0
+    for bound, count in zip(self.buckets + (math.inf,), self.counts):
+      seen += count
+      if seen >= rank:
+        return min(bound, self.max)
+    return self.max
+
+  def to_dict(self):
+    return {
+      "count": self.count,
+      "sum": self.sum,
+      "min": self.min if self.count else None,
+      "max": self.max if self.count else None,
+      "mean": self.sum / self.count if self.count else None,
+      "p50": self.quantile(0.5),
+      "p90": self.quantile(0.9),
+      "p99": self.quantile(0.99),
+      "buckets": {("+Inf" if math.isinf(b) else repr(b)): c for b, c in zip(
+        self.buckets + (math.inf,), self._cumulative())},
+    }
+
+  def _cumulative(self):
+    total, out = 0, []
+    for count in self.counts:
+      total += count
+      out.append(total)
+    return out
+
+class _Metrics(object):
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._histograms = {}
+    self._counters = {}
+    self._gauges = {}
+
+  def _histogram(self, name, buckets):
+    histogram = self._histograms.get(name)
+    if histogram is None:
+      histogram = self._histograms[name] = _Histogram(buckets)
+    return histogram
+
+  def observe(self, name, value, buckets=SECONDS_BUCKETS):
+    with self._lock:
+      self._histogram(name, buckets).observe(value)
+
+  def increment(self, name, amount=1):
+    with self._lock:
+      self._counters[name] = self._counters.get(name, 0) + amount
+
+  def set_gauge(self, name, value):
+    with self._lock:
+      self._gauges[name] = value
+
+  # with metrics.time("phase_seconds"): ...
+  @contextlib.contextmanager
+  def time(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(name, time.perf_counter() - start)
+
+  def snapshot(self):
+    with self._lock:
+      return {
+        "histograms": {name: h.to_dict() for name, h in sorted(self._histograms.items())},
+        "counters": dict(sorted(self._counters.items())),
+        "gauges": dict(sorted(self._gauges.items())),
+      }
+
+  # Prometheus text exposition format, names get prefix
+  def to_prometheus(self, prefix="chartjs_"):
+    lines = []
+    with self._lock:
+      for name, value in sorted(self._counters.items()):
+        lines += [f"# TYPE {prefix}{name} counter", f"{prefix}{name} {value}"]
+      for name, value in sorted(self._gauges.items()):
+        lines += [f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {value}"]
+      for name, h in sorted(self._histograms.items()):
+        lines.append(f"# TYPE {prefix}{name} histogram")
+        for bound, count in zip(h.buckets + (math.inf,), h._cumulative()):
+          le = "+Inf" if math.isinf(bound) else repr(bound)
+          lines.append(f'{prefix}{name}_bucket{{le="{le}"}} {count}')
+        lines += [f"{prefix}{name}_sum {h.sum}", f"{prefix}{name}_count {h.count}"]
+    return "\n".join(lines) + "\n"
+
+# Evaluator wrapper that adds up the time spent in f and the number of x evaluated
+class _TimedEvaluator(object):
+  def __init__(self, evaluate):
+    self.evaluate = evaluate
+    self.seconds = 0.0
+    self.count = 0
+
+  def __call__(self, xs):
+    start = time.perf_counter()
+    try:
+      return self.evaluate(xs)
+    finally:
+      self.seconds += time.perf_counter() - start
+      self.count += xs.shape[0]
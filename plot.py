@@ -1,15 +1,32 @@
-import functools
 import math
+import time
 from collections import defaultdict
 from typing import Union, Optional, List, Tuple
 
 import numpy as np
-import scipy
 
-from .utils import exception_as_string
+from .utils import exception_as_string, finite_extent
+from .encoding import check_precision, encode_columns, dumps_spec
+from .decimation import DECIMATION_MODES, decimate, lttb
+from .ring_buffer import _RingBuffer
+from .binning import _Aggregate, _Samples, _SourceSamples
+from .datasource import _DataSource, stream_decimate
+from .lod import _MinMaxPyramid, _ArrayStore, LOD_MIN_POINTS
+from .static_export import write_html
+from .metrics import _TimedEvaluator, COUNT_BUCKETS
+from .sampling import (_Evaluator, _ProcessEvaluator, _EvaluationCache, _CachedEvaluator,
+                       adaptive_sample, code_hash)
+
+# viewport assumed for decimation budgets until the browser reports its size
+DEFAULT_VIEWPORT = (1920, 1080, 1)
+DEFAULT_STREAM_CAPACITY = 100000
+# _Plot._aggregate_key before the first binning
+_NOT_BINNED = object()
 
 class _Figure(object):
-  def __init__(self):
+  # id_ tells the frontend which chart on the page a message is for
+  def __init__(self, id_ : str = "0"):
+    self.id_ = id_
     self._options = {
       "animation": False,
       "responsive": True,
@@ -29,6 +46,10 @@ class _Figure(object):
     self._yaxes = [self._defaultYAxis]
     self._plots = []
     self._interactive_plot = None
+    self._viewport = DEFAULT_VIEWPORT
+    # what the frontend last received: dataset index -> (plot, version), and the options state
+    self._sent_datasets = {}
+    self._sent_options = None
     self.set_legend(display=False)
     self.set_title("", display=False)
 
@@ -54,7 +75,12 @@ class _Figure(object):
     self._plots.append(plot)
     return plot
 
-  def _get_data(self, blocking : bool = True):
+  def _get_all_plots(self):
+    if self._interactive_plot is not None:
+      return self._plots + [self._interactive_plot]
+    return self._plots
+
+  def _get_options(self):
     options = self._options
     if self._legend is not None:
       options["legend"] = self._legend._get_data()
@@ -62,26 +88,132 @@ class _Figure(object):
       options["title"] = self._title._get_data()
     options["scales"]["xAxes"] = [ax._get_data() for ax in self._xaxes]
     options["scales"]["yAxes"] = [ax._get_data() for ax in self._yaxes]
+    return options
+
+  # changes whenever anything that ends up in the options does
+  def _get_options_state(self):
+    parts = [self._title, self._legend] + self._xaxes + self._yaxes
+    return tuple((part, part._version) for part in parts if part is not None)
+
+  # aggregate plots re-bin and long lines re-query their min/max pyramid for the
+  # current axis ranges before anything is sent
+  def _sync_views(self):
+    for p in self._get_all_plots():
+      if p._aggregate is not None:
+        p._rebin()
+      else:
+        p._sync_lod()
 
-    if self._interactive_plot is not None:
-      all_plots = self._plots + [self._interactive_plot]
-    else:
-      all_plots = self._plots
+  # zoom/pan from get_graph_update params for figures without an interactive function
+  def _set_view(self, params):
+    if params.get("xmin") is not None and params.get("xmax") is not None:
+      if params["xmin"] < params["xmax"]:
+        self._defaultXAxis.set_lims(params["xmin"], params["xmax"])
+
+  def _get_data(self, blocking : bool = True):
+    self._sync_views()
     datasets = []
-    for i, p in enumerate(all_plots):
-      plot_data = p._get_data()
-      datasets.append(plot_data)
+    self._sent_datasets = {}
+    for i, p in enumerate(self._get_all_plots()):
+      datasets.append(p._get_data())
+      self._sent_datasets[i] = (p, p._version)
     data = {"datasets": datasets}
+    self._sent_options = self._get_options_state()
 
     return {
+      "id": self.id_,
       "data": data,
       "error": "",
+      "options": self._get_options(),
+      "interactive": self._interactive_plot is not None,
+      "defaultxmin": self._defaultXAxis.ax_min,
+      "defaultxmax": self._defaultXAxis.ax_max,
+    }
+
+  # only what changed since the last _get_data/_get_delta. datasets maps index -> dataset,
+  # count is the total number of datasets and options is None if unchanged.
+  def _get_delta(self):
+    self._sync_views()
+    all_plots = self._get_all_plots()
+    datasets = {}
+    for i, p in enumerate(all_plots):
+      sent_plot, sent_version = self._sent_datasets.get(i, (None, None))
+      if sent_plot is not p or sent_version != p._version:
+        datasets[i] = p._get_data()
+        self._sent_datasets[i] = (p, p._version)
+    for i in range(len(all_plots), len(self._sent_datasets)):
+      self._sent_datasets.pop(i, None)
+
+    options = None
+    options_state = self._get_options_state()
+    if options_state != self._sent_options:
+      options = self._get_options()
+      self._sent_options = options_state
+
+    return {
+      "id": self.id_,
+      "datasets": datasets,
+      "count": len(all_plots),
+      "error": "",
       "options": options,
       "interactive": self._interactive_plot is not None,
       "defaultxmin": self._defaultXAxis.ax_min,
       "defaultxmax": self._defaultXAxis.ax_max,
     }
 
+  # size of the chart in CSS px and the device pixel ratio, sets the decimation budget
+  def _set_viewport(self, width, height, pixel_ratio=1):
+    self._viewport = (width, height, pixel_ratio)
+    for p in self._plots:
+      if p._decimation is not None:
+        p._invalidate()
+
+  # like _get_delta, but streaming plots whose frontend copy is otherwise up to date only
+  # get their newly appended points, under appends (index -> points and a drop count).
+  # Decimated streams don't send every point, so they go out whole, re-decimated.
+  def _get_stream_delta(self):
+    appends = {}
+    for i, p in enumerate(self._get_all_plots()):
+      if p._stream is None or not p._stream_pending or p._decimation is not None:
+        continue
+      sent_plot, sent_version = self._sent_datasets.get(i, (None, None))
+      if sent_plot is p and sent_version == p._stream_base_version:
+        appends[i] = p._flush_stream()
+        self._sent_datasets[i] = (p, p._version)
+    delta = self._get_delta()
+    delta["appends"] = appends
+    return delta
+
+  # the figure as it is now, with every dataset as binary columns (precision for plots
+  # that don't set their own), for files that are rendered without the server
+  def _get_static_data(self, precision : str = "float64"):
+    check_precision(precision)
+    self._sync_views()
+    return {
+      "id": self.id_,
+      "data": {"datasets": [p._get_encoded_data(precision) for p in self._get_all_plots()]},
+      "error": "",
+      "options": self._get_options(),
+      "interactive": False,
+      "defaultxmin": self._defaultXAxis.ax_min,
+      "defaultxmax": self._defaultXAxis.ax_max,
+    }
+
+  # the full update as _get_data gives it, but with binary columns and without
+  # recording anything as sent: for pages that missed deltas the others got
+  def _get_snapshot(self):
+    data = self._get_static_data()
+    data["interactive"] = self._interactive_plot is not None
+    return data
+
+  # the figure as JSON, binary columns as base64 (see encoding.dumps_spec)
+  def to_json(self, precision : str = "float64"):
+    return dumps_spec(self._get_static_data(precision))
+
+  # write a standalone HTML page showing the figure, see static_export.py
+  def to_html(self, path : str, precision : str = "float64", title : Optional[str] = None):
+    write_html(self, path, precision, title)
+
   def set_title(self, *args, **kwargs):
     self._title = _Title(*args, **kwargs)
 
@@ -91,6 +223,10 @@ class _Figure(object):
     return self._legend
     
 
+# a figure outside of any session, e.g. for render_many
+def new_figure():
+  return _Figure()
+
 class _Plot(object):
   def __init__(self, fig, xax, yax, id_):
     self._xaxis = xax
@@ -123,34 +259,209 @@ class _Plot(object):
         "align": "right",
       },
     }
+    self._xdata = np.empty(0)
+    self._ydata = np.empty(0)
+    self._labels = None
+    self._points = None
+    self._columns = None
+    self._precision = None
+    self._decimation = None
+    self._visible = None
+    self._per_point = {}
+    self._xlims = (None, None)
+    self._ylims = (None, None)
+    self._stream = None
+    self._stream_pending = 0
+    self._stream_sent = 0
+    self._stream_base_version = None
+    # out-of-core data (datasource.py), _xdata/_ydata hold its decimation for _source_key
+    self._source = None
+    self._source_key = None
+    # hist/hist2d/hexbin samples, binned into _xdata/_ydata for _aggregate_key
+    self._aggregate = None
+    self._aggregate_key = _NOT_BINNED
+    # min/max pyramid of a long sorted line (lod.py), False if the data doesn't qualify,
+    # and the x range _visible was queried for
+    self._lod = None
+    self._lod_view = None
+    # bumped on every change, _get_data output is reused while it stays the same
+    self._version = 0
+    self._serialized_version = None
 
   def _get_data(self):
     data = self._dataset
-    data["xAxisID"] = self._xaxis.get_id()
-    data["yAxisID"] = self._yaxis.get_id()
+    if self._serialized_version == self._version:
+      return data
+    self._fill_dataset(data, self._precision)
+    self._serialized_version = self._version
+    if self._stream is not None:
+      # everything appended so far is part of this dataset
+      self._stream_pending = 0
+      self._stream_sent = len(self._stream)
     return data
 
-  def _normalize_array(self, arr):
-    res = []
-    for x in arr:
-      if 'numpy' in str(type(x)):
-        res.append(float(x))
-      else:
-        res.append(x)
-    return res
+  # copy of the dataset with the data as binary columns even if the plot sends JSON
+  # points, for static files. Doesn't count as sent to any page.
+  def _get_encoded_data(self, precision):
+    data = dict(self._dataset)
+    self._fill_dataset(data, self._precision or precision)
+    return data
 
-  def scatter(self, xvals: List[float], yvals : List[float],
+  # axis ids, data and per-point styles; JSON points if precision is None
+  def _fill_dataset(self, data, precision):
+    data["xAxisID"] = self._xaxis.get_id()
+    data["yAxisID"] = self._yaxis.get_id()
+    if precision is None:
+      data.pop("columns", None)
+      data["data"] = self._get_points()
+    else:
+      data["data"] = []
+      if precision == self._precision:
+        data["columns"] = self._get_columns()
+      else:
+        xdata, ydata, labels = self._get_visible_data()
+        data["columns"] = encode_columns(xdata, ydata, precision, labels)
+    idx = self._get_visible()
+    for key, values in self._per_point.items():
+      data[key] = values if idx is None else [values[i] for i in idx]
+
+  # (x, y) columns of all the data, streamed data is only copied out of the buffer here
+  def _get_raw_data(self):
+    if self._source is not None:
+      width, height, ratio = self.fig._viewport
+      key = (self._decimation, width * ratio, height * ratio)
+      if key != self._source_key:
+        self._xdata, self._ydata = stream_decimate(self._source, *key)
+        self._source_key = key
+      return self._xdata, self._ydata
+    if self._xdata is None:
+      self._xdata, self._ydata = self._stream.view()
+    return self._xdata, self._ydata
+
+  def _touch(self):
+    self._version += 1
+
+  def _invalidate(self):
+    self._points = None
+    self._columns = None
+    self._visible = None
+    self._lod_view = None
+    self._touch()
+
+  # indices of the points that are sent, or None when all of them are
+  def _get_visible(self):
+    # data sources are decimated as they are read
+    if self._decimation is None or self._source is not None:
+      return None
+    if self._visible is None:
+      width, height, ratio = self.fig._viewport
+      lod = self._get_lod()
+      if lod is not None:
+        self._visible = self._query_lod(lod, width * ratio)
+      else:
+        xdata, ydata = self._get_raw_data()
+        self._visible = decimate(xdata, ydata, self._decimation, width * ratio, height * ratio)
+    return self._visible
+
+  # the pyramid for lines decimated with "minmax" or "lttb" that are long enough and
+  # sorted by x, None otherwise. Streams extend theirs as points are appended.
+  def _get_lod(self):
+    if self._decimation not in ("minmax", "lttb") or self._aggregate is not None or (
+        self._source is not None):
+      return None
+    if self._stream is not None:
+      if len(self._stream) < LOD_MIN_POINTS or not self._stream._x_sorted:
+        return None
+      if self._lod is None:
+        self._lod = _MinMaxPyramid(self._stream)
+    elif self._lod is None:
+      x = self._xdata
+      self._lod = x.shape[0] >= LOD_MIN_POINTS and bool(np.all(x[1:] >= x[:-1])) and (
+        _MinMaxPyramid(_ArrayStore(self._xdata, self._ydata)))
+    return self._lod or None
+
+  # indices (into the buffer for streams) for the x axis range, the query only touches
+  # the tiles in view
+  def _query_lod(self, lod, n_px):
+    self._lod_view = (self._xaxis.ax_min, self._xaxis.ax_max)
+    idx = lod.query(*self._lod_view, n_px)
+    if self._decimation == "lttb":
+      x, y = lod.store.take(idx)
+      idx = idx[lttb(x, y, int(n_px))]
+    return idx - lod.store.first
+
+  # the axis range changed since _visible was queried from the pyramid
+  def _sync_lod(self):
+    if self._visible is None or self._lod_view is None:
+      return
+    if self._lod_view != (self._xaxis.ax_min, self._xaxis.ax_max) and self._get_lod() is not None:
+      self._invalidate()
+
+  def _get_visible_data(self):
+    idx = self._get_visible()
+    lod = self._get_lod() if idx is not None else None
+    if lod is not None:
+      # without copying the whole stream out of its buffer
+      xdata, ydata = lod.store.take(idx + lod.store.first)
+      return xdata, ydata, None if self._labels is None else [self._labels[i] for i in idx]
+    xdata, ydata = self._get_raw_data()
+    if idx is None:
+      return xdata, ydata, self._labels
+    labels = None if self._labels is None else [self._labels[i] for i in idx]
+    return xdata[idx], ydata[idx], labels
+
+  # binary form of the data, rebuilt into typed arrays by the frontend
+  def _get_columns(self):
+    if self._columns is None:
+      xdata, ydata, labels = self._get_visible_data()
+      self._columns = encode_columns(xdata, ydata, self._precision, labels)
+    return self._columns
+
+  # the per-point {"x": .., "y": ..} form is only built when it is actually sent
+  def _get_points(self):
+    if self._points is None:
+      self._points = _build_points(*self._get_visible_data())
+    return self._points
+
+  # xvals can also be a data source with (x, y) columns (see datasource.py, yvals is
+  # None then), which is read in chunks and always decimated, "density" by default
+  def scatter(self, xvals: Union[List[float], _DataSource], yvals : Optional[List[float]] = None,
               labels : Optional[List[str]] = None,
               label_size : Optional[float] = None,
               label_color : Optional[str] = "#000",
               size : Optional[Union[float, List[float]]] = None,
               color : Optional[Union[str, List[str]]] = None,
-              linecolor : str = "#000"):
-    self._xlims = min(xvals), max(xvals)
-    self._ylims = min(yvals), max(yvals)
-    xvals = self._normalize_array(xvals)
-    yvals = self._normalize_array(yvals)
-    self._dataset["data"] = [{"x": x, "y": y} for (x, y) in zip(xvals, yvals)]
+              linecolor : str = "#000",
+              precision : Optional[str] = None,
+              decimate : Optional[str] = None):
+    self._labels = labels
+    self._per_point = {}
+    self._stream = None
+    self._lod = None
+    self._clear_aggregate()
+    if isinstance(xvals, _DataSource):
+      _check_source(xvals, yvals, 2)
+      if labels is not None or not (size is None or np.isscalar(size)) or not (
+          color is None or isinstance(color, str)):
+        raise ValueError("labels and per-point sizes or colors can't be used with a data source")
+      self._source = xvals
+      self._source_key = None
+      decimate = decimate or "density"
+      self._xlims, self._ylims = xvals.extents()
+    else:
+      # keep the caller's arrays as columns, float64 ndarrays are used without copying
+      if yvals is None:
+        raise ValueError("yvals is needed unless xvals is a data source")
+      self._source = None
+      self._xdata = _as_column(xvals)
+      self._ydata = _as_column(yvals)
+      self._xlims = finite_extent(self._xdata)
+      self._ylims = finite_extent(self._ydata)
+    self._invalidate()
+    if precision is not None:
+      self.set_precision(precision)
+    if decimate is not None:
+      self.set_decimation(decimate)
     self._dataset["borderColor"] = linecolor
     self._dataset["pointHoverBackgroundColor"] = linecolor
     if labels is not None:
@@ -158,23 +469,189 @@ class _Plot(object):
       self._dataset["datalabels"]["font"] = {}
       self._dataset["datalabels"]["color"] = label_color
       self._dataset["datalabels"]["font"]["size"] = label_size
-      self._dataset["data"] = [{"x": x, "y": y, "label": l} for (x, y, l) in zip(xvals, yvals, labels)]
-    else:
-      self._dataset["data"] = [{"x": x, "y": y} for (x, y) in zip(xvals, yvals)]
     if size is not None:
-      self._dataset["pointRadius"] = size
+      self._set_point_style("pointRadius", size)
     if color is not None:
-      self._dataset["pointBackgroundColor"] = color
+      self._set_point_style("pointBackgroundColor", color)
     self._xaxis._update_data_lims(*self._xlims, self.id_)
     self._yaxis._update_data_lims(*self._ylims, self.id_)
     self.set_auto_lims()
 
-  # **kwargs passed to scatter() arguments
-  def plot(self, xvals : List[float], yvals : List[float], **kwargs):
+  # keep appended data in a ring buffer of capacity points. With window, only points
+  # with x within window of the newest one are kept (x has to be appended in order).
+  def set_stream(self, capacity : int = DEFAULT_STREAM_CAPACITY, window : Optional[float] = None):
+    self._clear_aggregate()
+    self._source = None
+    self._lod = None
+    self._stream = _RingBuffer(capacity, window)
+    self._stream_pending = 0
+    self._stream_sent = 0
+    self._xdata = None
+    self._labels = None
+    self._per_point = {}
+    self._invalidate()
+    self._update_stream_lims()
+
+  # add points to the end of a streaming plot. ChartSession.push() sends only these
+  # to the browser, and axis limits are updated from the buffer's running extents.
+  def append(self, xvals : List[float], yvals : List[float]):
+    if self._stream is None:
+      self.set_stream()
+    if not self._stream_pending:
+      self._stream_base_version = self._version
+    self._stream.extend(xvals, yvals)
+    self._stream_pending += len(xvals)
+    self._xdata = None
+    self._invalidate()
+    self._update_stream_lims()
+
+  def _update_stream_lims(self):
+    self._xlims = self._stream.xlims
+    self._ylims = self._stream.ylims
+    self._xaxis._update_data_lims(*self._xlims, self.id_)
+    self._yaxis._update_data_lims(*self._ylims, self.id_)
+    self.set_auto_lims()
+
+  # points appended since the frontend last got this dataset, and how many old points
+  # it has to drop from the front
+  def _flush_stream(self):
+    size = len(self._stream)
+    count = min(self._stream_pending, size)
+    drop = min(max(self._stream_sent + count - size, 0), self._stream_sent)
+    xs, ys = self._stream.tail(count)
+    self._stream_pending = 0
+    self._stream_sent += count - drop
+    if self._precision is None:
+      return {"drop": drop, "data": _build_points(xs, ys)}
+    return {"drop": drop, "data": [], "columns": encode_columns(xs, ys, self._precision)}
+
+  # per-point lists have to follow decimation, scalars go straight into the dataset
+  def _set_point_style(self, key, value):
+    if isinstance(value, np.generic):
+      # numpy scalars as the Python numbers JSON takes
+      value = value.item()
+    if isinstance(value, str) or np.isscalar(value):
+      self._dataset[key] = value
+    else:
+      self._per_point[key] = list(value)
+
+  # **kwargs passed to scatter() arguments. Data sources are decimated with "minmax".
+  def plot(self, xvals : Union[List[float], _DataSource], yvals : Optional[List[float]] = None,
+           **kwargs):
+    if isinstance(xvals, _DataSource):
+      kwargs.setdefault("decimate", "minmax")
     self.scatter(xvals, yvals, **kwargs)
     self._dataset["pointRadius"] = 2
     self._dataset["showLine"] = True
     self._dataset["pointRadius"] = 0
+    self._per_point.pop("pointRadius", None)
+
+  # histogram of values, sent as the bin edges and counts of a filled step line. The
+  # binning is done here in chunks, so values can be far more than could be sent, or
+  # a data source whose first column is binned in a pass over the file. With
+  # bins a count and no range, changing the x axis range re-bins what is visible.
+  def hist(self, values : Union[List[float], _DataSource], bins : Union[int, List[float]] = 10,
+           range : Optional[Tuple[float, float]] = None,
+           color : str = "rgba(54, 162, 235, 0.5)", linecolor : str = "rgba(54, 162, 235, 1)",
+           precision : Optional[str] = None):
+    self._set_aggregate(_Aggregate("hist", _samples(values, None, 1), bins, range), precision)
+    self._dataset.update({
+      "showLine": True,
+      "steppedLine": True,
+      "fill": "origin",
+      "borderWidth": 1,
+      "borderColor": linecolor,
+      "backgroundColor": color,
+      "pointRadius": 0,
+      "pointHoverRadius": 0,
+    })
+
+  # 2D histogram of the (x, y) samples as a heatmap of colored square cells, empty cells
+  # aren't sent. bins is a count, (x count, y count) or (x edges, y edges); None makes
+  # cells of about binning.CELL_PX px. cmap is one of binning.COLORMAPS, log scales
+  # colors by log(count). Bin counts with no range re-bin for the visible axis ranges.
+  # Like hist(), xvals can be a data source with (x, y) columns instead.
+  def hist2d(self, xvals : Union[List[float], _DataSource], yvals : Optional[List[float]] = None,
+             bins=None,
+             range : Optional[Tuple[Tuple[float, float], Tuple[float, float]]] = None,
+             cmap : str = "viridis", log : bool = False, precision : Optional[str] = None):
+    samples = _samples(xvals, yvals, 2)
+    self._set_aggregate(_Aggregate("hist2d", samples, bins, range, cmap, log), precision)
+    self._set_cell_style("rect")
+
+  def heatmap(self, *args, **kwargs):
+    self.hist2d(*args, **kwargs)
+
+  # like hist2d, with hexagonal cells (drawn as circles) of gridsize across the x range
+  def hexbin(self, xvals : Union[List[float], _DataSource], yvals : Optional[List[float]] = None,
+             gridsize : Optional[int] = None,
+             extent : Optional[Tuple[float, float, float, float]] = None,
+             cmap : str = "viridis", log : bool = False, precision : Optional[str] = None):
+    samples = _samples(xvals, yvals, 2)
+    bin_range = None if extent is None else (extent[:2], extent[2:])
+    self._set_aggregate(_Aggregate("hexbin", samples, gridsize, bin_range, cmap, log), precision)
+    self._set_cell_style("circle")
+
+  def _set_cell_style(self, style):
+    self._dataset.update({
+      "showLine": False,
+      "pointStyle": style,
+      "pointBorderWidth": 0,
+      "pointHoverBorderWidth": 0,
+    })
+
+  def _set_aggregate(self, aggregate, precision):
+    self._source = None
+    self._labels = None
+    self._per_point = {}
+    self._stream = None
+    self._decimation = None
+    self._aggregate = aggregate
+    self._aggregate_key = _NOT_BINNED
+    if precision is not None:
+      self.set_precision(precision)
+    self._dataset["datalabels"]["display"] = False
+    # axis limits from the data extent, not the bins of a view
+    self._xlims = aggregate.xlims or (None, None)
+    self._ylims = aggregate.ylims or (None, None)
+    self._xaxis._update_data_lims(*self._xlims, self.id_)
+    if aggregate.kind != "hist":
+      self._yaxis._update_data_lims(*self._ylims, self.id_)
+    self.set_auto_lims()
+    self._rebin()
+    self.set_auto_lims()
+
+  def _clear_aggregate(self):
+    if self._aggregate is None:
+      return
+    self._aggregate = None
+    self._aggregate_key = _NOT_BINNED
+    for key in ("steppedLine", "pointStyle", "pointHoverBorderWidth", "borderWidth"):
+      self._dataset.pop(key, None)
+    self._dataset.update({"fill": False, "pointBorderWidth": 1, "pointRadius": 4,
+                          "pointHoverRadius": 5, "backgroundColor": 'rgba(255, 255, 255, 0)'})
+
+  # bin for the current axis ranges and viewport if that isn't what _xdata holds
+  def _rebin(self):
+    width, height, _ = self.fig._viewport
+    xview = (self._xaxis.ax_min, self._xaxis.ax_max)
+    yview = (self._yaxis.ax_min, self._yaxis.ax_max)
+    key = self._aggregate.view_key(xview, yview, (width, height))
+    if key == self._aggregate_key:
+      return False
+    self._aggregate_key = key
+    x, y, colors, radius = self._aggregate.bin(xview, yview, (width, height))
+    self._xdata, self._ydata = x, y
+    self._per_point = {}
+    if colors is not None:
+      self._per_point["pointBackgroundColor"] = colors
+      self._set_point_style("pointRadius", radius if np.isscalar(radius) else radius.tolist())
+      self._set_point_style("pointHoverRadius", radius if np.isscalar(radius) else radius.tolist())
+    elif self._aggregate.kind == "hist":
+      # the largest count of this view sets the y range next time it is fitted
+      self._yaxis._update_data_lims(0.0, float(y.max()) if y.shape[0] else None, self.id_)
+    self._invalidate()
+    return True
 
   def get_xaxis(self):
     return self._xaxis
@@ -191,17 +668,35 @@ class _Plot(object):
     if xax is None:
       xax = self.fig._get_new_axis(True)
     self._xaxis = xax
-    return yax
+    self._touch()
+    return xax
 
   # if yax is None, creates a new one
   def set_yaxis(self, yax : Optional["_Axis"] = None):
     if yax is None:
       yax = self.fig._get_new_axis(False)
     self._yaxis = yax
+    self._touch()
     return yax
 
   def set_label(self, label : str):
     self._dataset["label"] = label
+    self._touch()
+
+  # reduce what is sent to what the viewport can show: "lttb" or "minmax" for lines,
+  # "density" for scatter, None to send every point
+  def set_decimation(self, mode : Optional[str]):
+    if mode is not None and mode not in DECIMATION_MODES:
+      raise ValueError(f"decimation mode must be one of {DECIMATION_MODES} or None, got {mode!r}")
+    if mode is None and self._source is not None:
+      raise ValueError("data sources are always decimated")
+    self._decimation = mode
+    self._invalidate()
+
+  # send data as "float32" or "float64" binary buffers instead of JSON points, None for JSON
+  def set_precision(self, precision : Optional[str]):
+    self._precision = check_precision(precision)
+    self._invalidate()
 
 
 
@@ -213,56 +708,68 @@ class _InteractivePlot(_Plot):
       return x
     self.f = f
     self.func_params = None
-
+    self.step_count_init = self.STEP_COUNT_INIT
+    self.max_iterations = self.MAX_ITERATIONS
+    self.pixel_tolerance = self.PIXEL_TOLERANCE
+    # samples of f survive between requests, so slider revisits and pans are cheap
+    self._code = None
+    self._code_hash = None
+    self._eval_cache = _EvaluationCache(self.EVAL_CACHE_POINTS)
+
+  # defaults for set_sampling()
   STEP_COUNT_INIT = 275
-  INC_TOL = 20  # must be even!
+  MAX_ITERATIONS = 8
+  PIXEL_TOLERANCE = 0.5
+  EVAL_CACHE_POINTS = 2000000
+
+  # how get_result samples f: step_count_init even steps to start with, at most
+  # max_iterations refinement passes, until lines are within pixel_tolerance px of f
+  def set_sampling(self, step_count_init : Optional[int] = None,
+                   max_iterations : Optional[int] = None,
+                   pixel_tolerance : Optional[float] = None):
+    if step_count_init is not None:
+      self.step_count_init = step_count_init
+    if max_iterations is not None:
+      self.max_iterations = max_iterations
+    if pixel_tolerance is not None:
+      self.pixel_tolerance = pixel_tolerance
 
   # The big challenge here is to figure out how many points we need in each 
-  # part of the graph to make it smooth.
-  def get_result(self, params):
+  # part of the graph to make it smooth. See sampling.adaptive_sample.
+  # Doesn't change the plot, so it can run off the event loop. f is evaluated in
+  # process_pool if given, and setting cancel stops it between batches. With metrics
+  # (a metrics._Metrics), the time spent in f and the number of points are recorded.
+  def get_result(self, params, cancel=None, process_pool=None, metrics=None):
     if not self.func_params:
-      return [], []
-    f_wrapped = functools.lru_cache(maxsize=40000)(self.f)
+      return np.empty(0), np.empty(0)
+    start = time.perf_counter()
     args = [params["parameters"][s] for s in self.func_params]
-
-    step = (params["xmax"] - params["xmin"]) / self.STEP_COUNT_INIT
-
-    xi = np.arange(params["xmin"], params["xmax"] + step, step)  # +step for fencepost
-    step_sizes = [step for _ in range(xi.shape[0])]
-    it = 0
-    while True:
-      # get y values
-      yi = [f_wrapped(x, *args) for x in xi]
-      max_allowed_dy = (np.max(yi) - np.min(yi)) / 120
-      dy = np.gradient(yi)
-      # check gradient
-      inc = dy > max_allowed_dy 
-      if not (it < 3 and np.any(inc)): break
-      # flag all the spots where the gradient is too big and areas nearby
-      padded = np.pad(inc, self.INC_TOL//2, "constant")
-      big = np.repeat(padded[None], self.INC_TOL, axis=0)
-      for ix, j in enumerate(range(-self.INC_TOL//2, self.INC_TOL//2)):
-        big[ix] = np.roll(big[ix], j)
-      inc = np.max(big, axis=0)[self.INC_TOL//2: -self.INC_TOL//2]
-      # recalculate x values and save step sizes for each
-      new_xi = []
-      new_step_sizes = []
-      for i, v in enumerate(xi):
-        ss = step_sizes[i]
-        if inc[i]:
-          new_xi.append(v - ss/3)
-          new_step_sizes.append(ss/3)
-          new_xi.append(v)
-          new_step_sizes.append(ss/3)
-          new_xi.append(v + ss/3)
-          new_step_sizes.append(ss/3)
-        else:
-          new_xi.append(v) 
-          new_step_sizes.append(ss)
-      xi = new_xi
-      step_sizes = new_step_sizes
-      it += 1
-    return list(xi), yi
+    width, height, _ = self.fig._viewport
+    ylims = (params["ymin"], params["ymax"]) if params.get("ymin") is not None else None
+    if process_pool is None:
+      evaluator = _Evaluator(self.f, args)
+    else:
+      evaluator = _ProcessEvaluator(process_pool, self._code_hash, self._code, args, cancel)
+    # only evaluations that miss the cache reach f
+    evaluator = _TimedEvaluator(evaluator)
+    evaluate = _CachedEvaluator(evaluator, self._eval_cache, (self._code_hash, tuple(args)))
+    xs, ys = adaptive_sample(evaluate, params["xmin"], params["xmax"],
+                             self.step_count_init, self.max_iterations, self.pixel_tolerance,
+                             width, height, ylims, cancel)
+    if metrics is not None:
+      metrics.observe("sampling_seconds", time.perf_counter() - start)
+      metrics.observe("f_seconds", evaluator.seconds)
+      metrics.observe("f_evaluations", evaluator.count, COUNT_BUCKETS)
+      metrics.observe("samples", xs.shape[0], COUNT_BUCKETS)
+    return xs, ys
+
+  # set f from Python source defining f(x, ...), like the code box on the page does.
+  # Returns the names of the parameters after x.
+  def set_function(self, code : str):
+    info = self._get_function_info({"code": code})
+    if info["error"]:
+      raise ValueError("".join(info["error"]))
+    return info["params"]
 
   def _get_function_info(self, params):
     try:
@@ -271,23 +778,39 @@ class _InteractivePlot(_Plot):
       func_params_temp = list(f.__code__.co_varnames)[:f.__code__.co_argcount]
       if func_params_temp[0] != "x":
         raise ValueError("x not first argument of f.")
-      self.func_params = func_params_temp[1:]
-      self.f = f
+      self._set_code(params["code"], func_params_temp[1:], f)
       return {"params": self.func_params, "error": None}
     except Exception as e:
       return {"error": exception_as_string(e), "params": []}
 
+  # f with parameters func_params defined by code. f is None when the code was only
+  # compiled in a worker process (see sampling._code_params), get_result then needs
+  # a process pool.
+  def _set_code(self, code, func_params, f=None):
+    self.func_params = func_params
+    self.f = f
+    self._code = code
+    self._code_hash = code_hash(code)
+    self._eval_cache.clear()
+
   def _update_plot(self, params):
     try:
       xi, yi = self.get_result(params)
+      return self._apply_result(params, xi, yi)
+    except Exception as e:
+      return {"error": exception_as_string(e)}
+
+  # put the result of get_result into the plot and set the axes for it
+  def _apply_result(self, params, xi, yi):
+    try:
       self.plot(xi, yi)
-      if not xi:
+      if not len(xi):
         return {"error": None}
       self._xaxis.set_lims(params["xmin"], params["xmax"])
       if "ymin" in params:
         self._yaxis.set_lims(params["ymin"], params["ymax"])
       else:
-        self._yaxis._update_data_lims(min(yi), max(yi), self.id_)
+        self._yaxis._update_data_lims(*self._ylims, self.id_)
         self._yaxis.set_auto_lims()
 
       return {"error": None}
@@ -295,6 +818,39 @@ class _InteractivePlot(_Plot):
       # print (exception_as_string(e))
       return {"error": exception_as_string(e)}
 
+# float64 view of array-likes, no copy for float64 ndarrays
+def _as_column(vals):
+  return np.asarray(vals, dtype=np.float64).ravel()
+
+def _check_source(source, yvals, width):
+  if yvals is not None:
+    raise ValueError("the y values of a data source come from its columns, leave yvals out")
+  if source.width < width:
+    raise ValueError(f"this needs a data source with {width} columns, it has {source.width}")
+
+# samples to bin, in memory or read from a data source
+def _samples(xvals, yvals, width):
+  if isinstance(xvals, _DataSource):
+    _check_source(xvals, yvals, width)
+    return _SourceSamples(xvals)
+  if width > 1 and yvals is None:
+    raise ValueError("yvals is needed unless xvals is a data source")
+  return _Samples(_as_column(xvals), None if yvals is None else _as_column(yvals))
+
+# JSON can't carry NaN/inf, Chart.js treats null as a gap
+def _json_floats(arr):
+  finite = np.isfinite(arr)
+  if finite.all():
+    return arr.tolist()
+  return np.where(finite, arr, None).tolist()
+
+def _build_points(xdata, ydata, labels=None):
+  xs = _json_floats(xdata)
+  ys = _json_floats(ydata)
+  if labels is None:
+    return [{"x": x, "y": y} for (x, y) in zip(xs, ys)]
+  return [{"x": x, "y": y, "label": l} for (x, y, l) in zip(xs, ys, labels)]
+
 def round_to_n(x, n):
   return round(x, -int(math.floor(math.log10(abs(x)))) + (n - 1))
 
@@ -314,6 +870,9 @@ class _Axis(object):
     self.data_mins = {}
     self.data_maxes = {}
     self.step = None
+    self.ax_min = None
+    self.ax_max = None
+    self._version = 0
 
   def get_id(self):
     return self.data["id"]
@@ -324,14 +883,25 @@ class _Axis(object):
 
     self.ax_min = new_min
     self.ax_max = new_max
+    self._version += 1
 
   def set_auto_lims(self):
+    # no finite data on this axis yet, leave the limits alone
+    if not self.data_maxes:
+      return
     data_max = max(self.data_maxes.values())
     data_min = min(self.data_mins.values())
     spread = data_max - data_min
+    if spread == 0:
+      spread = abs(data_max) or 1.0
     self.set_lims(data_min - spread*0.1, data_max + spread*0.1)
 
+  # extents of None (no finite values) drop the dataset from the axis limits
   def _update_data_lims(self, new_min, new_max, dataset_id):
+    if new_min is None or new_max is None:
+      self.data_mins.pop(dataset_id, None)
+      self.data_maxes.pop(dataset_id, None)
+      return
     self.data_mins[dataset_id] = new_min
     self.data_maxes[dataset_id] = new_max
 
@@ -349,10 +919,12 @@ class _Legend(object):
       "display": display,
       "position": position
     }
+    self._version = 0
   def _get_data(self):
     return self._data
   def set_display(self, val : bool = True):
     self._data["display"] = val
+    self._version += 1
 
 class _Title(object):
   def __init__(self,
@@ -376,5 +948,6 @@ class _Title(object):
       "line_height": line_height,
       "position": position,
     }
+    self._version = 0
   def _get_data(self):
     return self._data
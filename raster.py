@@ -0,0 +1,552 @@
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from .encoding import PRECISIONS
+
+# Draws figure specs (what _Figure._get_data() sends to the page) straight into an RGB
+# array and writes it as PNG, so figures can be saved without Chromium. Covers what
+# the frontend draws: linear axes with grid lines and tick labels, lines, points,
+# point labels, the title and the legend, approximating Chart.js' default look.
+# Everything proportional to the data is done in whole-array passes.
+
+# 5x7 bitmap font for ASCII 32-126, 5 column bytes per glyph, bit 0 is the top row
+_FONT = (
+  "000000000000005f00000007000700147f147f14242a7f2a12231308646236495522500005030000"
+  "001c2241000041221c0014083e081408083e08080050300000080808080800606000002010080402"
+  "3e5149453e00427f400042615149462141454b311814127f1027454545393c4a4949300171090503"
+  "3649494936064949291e003636000000563600000814224100141414141400412214080201510906"
+  "324979413e7e1111117e7f494949363e414141227f4141221c7f494949417f090901013e41415132"
+  "7f0808087f00417f41002040413f017f081422417f404040407f0204027f7f0408107f3e4141413e"
+  "7f090909063e4151215e7f09192946464949493101017f01013f4040403f1f2040201f7f2018207f"
+  "631408146303047804036151494543007f41410002040810200041417f0004020102044040404040"
+  "000102040020545454787f484444383844444420384444487f3854545418087e0901020c5252523e"
+  "7f0804047800447d40002040443d007f1028440000417f40007c041804787c080404783844444438"
+  "7c14141408081414187c7c080404084854545420043f4440203c4040207c1c2040201c3c4030403c"
+  "44281028440c5050503c4464544c44000836410000007f000000413608000804081008"
+)
+_FONT_COLUMNS = np.frombuffer(bytes.fromhex(_FONT), dtype=np.uint8).reshape(95, 5)
+# (glyph, row, column) with a blank row and column after each glyph for spacing
+_GLYPHS = np.zeros((95, 8, 6), dtype=bool)
+_GLYPHS[:, :7, :5] = (_FONT_COLUMNS[:, None, :] >> np.arange(7)[None, :, None]) & 1
+
+_NAMED_COLORS = {
+  "black": (0, 0, 0), "white": (255, 255, 255), "red": (255, 0, 0), "green": (0, 128, 0),
+  "blue": (0, 0, 255), "yellow": (255, 255, 0), "orange": (255, 165, 0),
+  "purple": (128, 0, 128), "cyan": (0, 255, 255), "magenta": (255, 0, 255),
+  "gray": (128, 128, 128), "grey": (128, 128, 128), "darkgray": (169, 169, 169),
+  "darkgrey": (169, 169, 169), "lightgray": (211, 211, 211), "lightgrey": (211, 211, 211),
+}
+
+# Chart.js 2 defaults the frontend doesn't override
+FONT_SIZE = 12
+TICK_MARK_LENGTH = 10
+LINE_WIDTH = 3
+LEGEND_BOX_WIDTH = 40
+LEGEND_PADDING = 10
+# zlib level, above 3 files barely get smaller but take about twice as long
+PNG_COMPRESSION = 3
+
+# (r, g, b, alpha) for CSS colors: #rgb, #rrggbb, rgb(), rgba() and a few names
+def parse_color(color):
+  if color is None:
+    return (0, 0, 0, 0.0)
+  color = str(color).strip().lower()
+  if color in _NAMED_COLORS:
+    return _NAMED_COLORS[color] + (1.0,)
+  if color == "transparent":
+    return (0, 0, 0, 0.0)
+  if color.startswith("#"):
+    digits = color[1:]
+    if len(digits) in (3, 4):
+      digits = "".join(c * 2 for c in digits)
+    if len(digits) in (6, 8):
+      alpha = int(digits[6:8], 16) / 255 if len(digits) == 8 else 1.0
+      return (int(digits[0:2], 16), int(digits[2:4], 16), int(digits[4:6], 16), alpha)
+  if color.startswith("rgb"):
+    parts = [p.strip() for p in color[color.find("(") + 1:color.rfind(")")].split(",")]
+    if len(parts) in (3, 4):
+      alpha = float(parts[3]) if len(parts) == 4 else 1.0
+      return tuple(int(float(p)) for p in parts[:3]) + (alpha,)
+  return (0, 0, 0, 1.0)
+
+def _paint(img, mask, color):
+  r, g, b, alpha = color
+  if alpha <= 0:
+    return
+  if alpha >= 1:
+    img[mask] = (r, g, b)
+  else:
+    img[mask] = (img[mask] * (1 - alpha) + np.array((r, g, b)) * alpha).astype(np.uint8)
+
+def _fill_rect(img, x0, y0, x1, y1, color):
+  h, w, _ = img.shape
+  x0, x1 = max(int(x0), 0), min(int(x1), w)
+  y0, y1 = max(int(y0), 0), min(int(y1), h)
+  if x0 < x1 and y0 < y1:
+    _paint(img[y0:y1, x0:x1], slice(None), color)
+
+# text
+
+def _text_bitmap(text, size, bold=False):
+  codes = np.frombuffer(text.encode("ascii", "replace"), dtype=np.uint8).astype(np.int64) - 32
+  codes[(codes < 0) | (codes >= 95)] = ord("?") - 32
+  bitmap = _GLYPHS[codes].transpose(1, 0, 2).reshape(8, -1)[:, :-1]
+  if bold:
+    bitmap = bitmap | np.roll(bitmap, 1, axis=1)
+  return np.repeat(np.repeat(bitmap, size, axis=0), size, axis=1)
+
+# integer glyph scale for a font size in device px
+def _text_scale(font_px):
+  return max(1, int(round(font_px / 8)))
+
+def _text_width(text, size):
+  return max(0, 6 * len(text) - 1) * size
+
+# draws text with its anchor ("left", "center" or "right") at x and its top at y
+def _draw_text(img, text, x, y, color, size, anchor="left", bold=False):
+  if not text:
+    return
+  bitmap = _text_bitmap(text, size, bold)
+  th, tw = bitmap.shape
+  if anchor == "center":
+    x -= tw // 2
+  elif anchor == "right":
+    x -= tw
+  x, y = int(x), int(y)
+  h, w, _ = img.shape
+  cx0, cy0 = max(x, 0), max(y, 0)
+  cx1, cy1 = min(x + tw, w), min(y + th, h)
+  if cx0 >= cx1 or cy0 >= cy1:
+    return
+  mask = bitmap[cy0 - y:cy1 - y, cx0 - x:cx1 - x]
+  _paint(img[cy0:cy1, cx0:cx1], mask, color)
+
+# disks
+
+# pixel offsets covered by a point of radius, "rect" is Chart.js' square of side
+# radius * sqrt(2), anything else a disk
+def _disk_offsets(radius, style="circle"):
+  r = int(math.ceil(radius))
+  dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+  if style == "rect":
+    half = radius / math.sqrt(2) + 1e-9
+    inside = (np.abs(dx) <= half) & (np.abs(dy) <= half)
+  else:
+    inside = dx * dx + dy * dy <= radius * radius + 1e-9
+  return dy[inside], dx[inside]
+
+# mask of the union of disks of radius around the given centers, inside clip
+# (x0, y0, x1, y1). Stamps each center for few centers, otherwise grows the mask
+# of centers row by row, whichever touches fewer pixels.
+def _disk_coverage(shape, iy, ix, radius, clip, style="circle"):
+  h, w = shape
+  x0, y0, x1, y1 = clip
+  mask = np.zeros(shape, dtype=bool)
+  if iy.shape[0] == 0:
+    return mask
+  dy, dx = _disk_offsets(radius, style)
+  if iy.shape[0] * dy.shape[0] <= 4 * h * w:
+    py = (iy[:, None] + dy[None, :]).ravel()
+    px = (ix[:, None] + dx[None, :]).ravel()
+    keep = (py >= y0) & (py < y1) & (px >= x0) & (px < x1)
+    mask[py[keep], px[keep]] = True
+    return mask
+  # only the clip box matters, work in it with a margin of the radius around it
+  r = int(math.ceil(radius))
+  bx0, by0 = max(x0, 0), max(y0, 0)
+  bx1, by1 = min(x1, w), min(y1, h)
+  if bx0 >= bx1 or by0 >= by1:
+    return mask
+  bw, bh = bx1 - bx0, by1 - by0
+  cy = iy - (by0 - r)
+  cx = ix - (bx0 - r)
+  inside = (cy >= 0) & (cy < bh + 2 * r) & (cx >= 0) & (cx < bw + 2 * r)
+  centers = np.zeros((bh + 2 * r, bw + 2 * r + 1), dtype=np.int32)
+  centers[cy[inside], cx[inside] + 1] = 1
+  # counts[:, j] is the number of centers left of column j
+  counts = np.cumsum(centers, axis=1)
+  box = mask[by0:by1, bx0:bx1]
+  for offset in np.unique(dy):
+    half = int(dx[dy == offset].max())
+    # any center within half columns to the left or right, offset rows away
+    rows = slice(r + offset, r + offset + bh)
+    box |= (counts[rows, r + half + 1:r + half + 1 + bw] - counts[rows, r - half:r - half + bw]) > 0
+  return mask
+
+# lines
+
+# Liang-Barsky against the box, for all segments at once
+def _clip_segments(x0, y0, x1, y1, box):
+  xmin, ymin, xmax, ymax = box
+  dx, dy = x1 - x0, y1 - y0
+  t0 = np.zeros(x0.shape[0])
+  t1 = np.ones(x0.shape[0])
+  keep = np.ones(x0.shape[0], dtype=bool)
+  with np.errstate(divide="ignore", invalid="ignore"):
+    for p, q in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+      keep &= ~((p == 0) & (q < 0))
+      r = q / p
+      t0 = np.where(p < 0, np.maximum(t0, r), t0)
+      t1 = np.where(p > 0, np.minimum(t1, r), t1)
+  keep &= t0 <= t1
+  return (x0 + t0 * dx)[keep], (y0 + t0 * dy)[keep], (x0 + t1 * dx)[keep], (y0 + t1 * dy)[keep]
+
+# 1px coverage of the segments as vertical spans, one per pixel column a segment
+# crosses. Lines sorted by x cross each column about once, so this is
+# O(segments + image) however steep or noisy the line is.
+def _line_coverage(shape, x0, y0, x1, y1):
+  h, w = shape
+  swap = x1 < x0
+  x0, x1 = np.where(swap, x1, x0), np.where(swap, x0, x1)
+  y0, y1 = np.where(swap, y1, y0), np.where(swap, y0, y1)
+  c0 = np.clip(np.floor(x0).astype(np.int64), 0, w - 1)
+  c1 = np.clip(np.floor(x1).astype(np.int64), 0, w - 1)
+  ncols = c1 - c0 + 1
+  seg = np.repeat(np.arange(x0.shape[0]), ncols)
+  col = c0[seg] + np.arange(seg.shape[0]) - np.repeat(np.cumsum(ncols) - ncols, ncols)
+  dx = x1 - x0
+  with np.errstate(divide="ignore", invalid="ignore"):
+    slope = np.where(dx > 0, (y1 - y0) / dx, 0.0)
+  xa = np.maximum(col, x0[seg])
+  xb = np.minimum(col + 1, x1[seg])
+  vertical = dx[seg] == 0
+  ya = np.where(vertical, y0[seg], y0[seg] + (xa - x0[seg]) * slope[seg])
+  yb = np.where(vertical, y1[seg], y0[seg] + (xb - x0[seg]) * slope[seg])
+  lo = np.clip(np.floor(np.minimum(ya, yb)).astype(np.int64), 0, h - 1)
+  hi = np.clip(np.floor(np.maximum(ya, yb)).astype(np.int64), 0, h - 1)
+  size = (h + 1) * w
+  diff = (np.bincount(lo * w + col, minlength=size)
+          - np.bincount((hi + 1) * w + col, minlength=size)).astype(np.int32).reshape(h + 1, w)
+  return np.cumsum(diff, axis=0)[:h] > 0
+
+def _draw_line(img, px, py, color, width, area):
+  finite = np.isfinite(px) & np.isfinite(py)
+  # gaps at non-finite points, like Chart.js with spanGaps off
+  ok = finite[:-1] & finite[1:]
+  if not ok.any():
+    return
+  x0, y0, x1, y1 = _clip_segments(px[:-1][ok], py[:-1][ok], px[1:][ok], py[1:][ok], area)
+  if x0.shape[0] == 0:
+    return
+  # spans are only needed inside the chart area
+  clip = (int(area[0]), int(area[1]), int(area[2]) + 1, int(area[3]) + 1)
+  thin = _line_coverage((clip[3] - clip[1], clip[2] - clip[0]),
+                        x0 - clip[0], y0 - clip[1], x1 - clip[0], y1 - clip[1])
+  iy, ix = np.nonzero(thin)
+  iy += clip[1]
+  ix += clip[0]
+  _paint(img, _disk_coverage(img.shape[:2], iy, ix, max(width - 1, 0) / 2, clip), color)
+
+# Chart.js' steppedLine: True/"before" holds each y until the next x, "after" jumps first
+def _steps(px, py, stepped):
+  if px.shape[0] < 2:
+    return px, py
+  sx = np.empty(2 * px.shape[0] - 1)
+  sy = np.empty_like(sx)
+  sx[0::2], sy[0::2] = px, py
+  if stepped == "after":
+    sx[1::2], sy[1::2] = px[:-1], py[1:]
+  else:
+    sx[1::2], sy[1::2] = px[1:], py[:-1]
+  return sx, sy
+
+# fill between a line with increasing x and the row base, column by column
+def _fill_area(img, px, py, base, color, area):
+  finite = np.isfinite(px) & np.isfinite(py)
+  px, py = px[finite], py[finite]
+  if px.shape[0] < 2:
+    return
+  left, top, right, bottom = (int(round(v)) for v in area)
+  x0, x1 = max(int(math.ceil(px[0])), left), min(int(math.floor(px[-1])), right)
+  if x1 < x0:
+    return
+  cols = np.arange(x0, x1 + 1)
+  line = np.interp(cols, px, py)
+  rows = np.arange(top, bottom + 1)[:, None]
+  lo = np.clip(np.minimum(line, base), top, bottom)
+  hi = np.clip(np.maximum(line, base), top, bottom)
+  mask = np.zeros(img.shape[:2], dtype=bool)
+  mask[top:bottom + 1, x0:x1 + 1] = (rows >= np.round(lo)) & (rows <= np.round(hi))
+  _paint(img, mask, color)
+
+# points
+
+def _per_point(value, count):
+  if isinstance(value, (list, tuple)):
+    return list(value)[:count] + [value[-1] if value else None] * (count - len(value))
+  return None
+
+def _draw_points(img, px, py, dataset, scale, area):
+  count = px.shape[0]
+  radii = _per_point(dataset.get("pointRadius"), count)
+  fills = _per_point(dataset.get("pointBackgroundColor"), count)
+  if radii is None:
+    # lines from plot() have no points
+    if dataset.get("pointRadius", 3) <= 0:
+      return
+    radius = np.full(count, dataset.get("pointRadius", 3) * scale, dtype=np.float64)
+  else:
+    radius = np.array(radii, dtype=np.float64) * scale
+  border = parse_color(dataset.get("pointBorderColor"))
+  border_width = dataset.get("pointBorderWidth", 1) * scale
+  style = dataset.get("pointStyle", "circle")
+  visible = np.isfinite(px) & np.isfinite(py) & (radius > 0)
+  if not visible.any():
+    return
+  iy = np.round(py).astype(np.int64)
+  ix = np.round(px).astype(np.int64)
+  shape = img.shape[:2]
+  # one pass per (radius, color) group, colors are usually few even when per point
+  if fills is None:
+    names = np.array([str(dataset.get("pointBackgroundColor"))])
+    color_index = np.zeros(count, dtype=np.int64)
+  else:
+    names, color_index = np.unique(np.array([str(c) for c in fills]), return_inverse=True)
+  radii_unique, radius_index = np.unique(radius, return_inverse=True)
+  groups = radius_index * names.shape[0] + color_index
+  for group in np.unique(groups[visible]):
+    members = visible & (groups == group)
+    r = radii_unique[group // names.shape[0]]
+    color = parse_color(names[group % names.shape[0]])
+    # points at the edge of the chart area show, the ones outside don't
+    grow = int(math.ceil(r + border_width))
+    clip = (int(area[0]) - grow, int(area[1]) - grow, int(area[2]) + grow + 1, int(area[3]) + grow + 1)
+    if border_width > 0:
+      _paint(img, _disk_coverage(shape, iy[members], ix[members], r + border_width / 2, clip, style),
+             border)
+    _paint(img, _disk_coverage(shape, iy[members], ix[members], max(r - border_width / 2, 0), clip,
+                               style), color)
+
+def _point_radius(dataset, i):
+  radius = dataset.get("pointRadius", 3)
+  if isinstance(radius, (list, tuple)):
+    return radius[min(i, len(radius) - 1)] if radius else 0
+  return radius
+
+# spec parsing
+
+def _dataset_xy(dataset):
+  columns = dataset.get("columns")
+  if columns:
+    dtype = PRECISIONS[columns["dtype"]]
+    x = np.frombuffer(columns["x"], dtype=dtype, count=columns["length"]).astype(np.float64)
+    y = np.frombuffer(columns["y"], dtype=dtype, count=columns["length"]).astype(np.float64)
+    return x, y, columns.get("labels")
+  points = dataset.get("data") or []
+  x = np.array([np.nan if p.get("x") is None else p["x"] for p in points], dtype=np.float64)
+  y = np.array([np.nan if p.get("y") is None else p["y"] for p in points], dtype=np.float64)
+  labels = [p.get("label") for p in points] if points and "label" in points[0] else None
+  return x, y, labels
+
+def _axis_range(axis, values):
+  ticks = axis.get("ticks", {}) if axis else {}
+  lo, hi = ticks.get("min"), ticks.get("max")
+  if lo is None or hi is None:
+    finite = [v[np.isfinite(v)] for v in values]
+    finite = np.concatenate(finite) if finite else np.empty(0)
+    if finite.size:
+      lo, hi = float(finite.min()), float(finite.max())
+    else:
+      lo, hi = 0.0, 1.0
+  if hi <= lo:
+    lo, hi = lo - 0.5, hi + 0.5
+  step = ticks.get("stepSize")
+  if not step:
+    step = 10 ** math.floor(math.log10((hi - lo) / 5))
+  return lo, hi, step
+
+# tick values the way Chart.js 2 makes them for a fixed min, max and step: the min,
+# the multiples of step in between and the max
+def _ticks(lo, hi, step):
+  nice_lo = math.floor(lo / step) * step
+  spaces = int(round((math.ceil(hi / step) * step - nice_lo) / step))
+  inner = [nice_lo + j * step for j in range(1, spaces)]
+  return [lo] + [t for t in inner if lo < t < hi] + [hi]
+
+def _tick_label(value, step):
+  if value != 0 and (abs(value) >= 1e6 or abs(value) < 1e-4):
+    return f"{value:.1e}"
+  decimals = max(0, -int(math.floor(math.log10(step)))) if step > 0 else 0
+  label = f"{value:.{decimals}f}"
+  return "0" if label.strip("-0.") == "" else label
+
+# RGB image (height * scale, width * scale, 3) of the figure spec, width and height in CSS px
+def render(spec, width, height, scale=1):
+  w, h = int(width * scale), int(height * scale)
+  img = np.full((h, w, 3), 255, dtype=np.uint8)
+  options = spec.get("options", {})
+  datasets = spec.get("data", {}).get("datasets", [])
+  font = _text_scale(FONT_SIZE * scale)
+  text_h = 8 * font
+  pad = int(round(5 * scale))
+  top = pad
+
+  title = options.get("title") or {}
+  if title.get("display") and title.get("text"):
+    padding = int(round(title.get("padding", 10) * scale))
+    size = _text_scale(title.get("fontSize", 24) * scale)
+    top += padding
+    _draw_text(img, str(title["text"]), w // 2, top, parse_color(title.get("fontColor", "#000")),
+               size, "center", bold=title.get("fontStyle") == "bold")
+    top += 8 * size + padding
+
+  legend = options.get("legend") or {}
+  if legend.get("display") and datasets:
+    top = _draw_legend(img, datasets, top, font, scale)
+
+  scales = options.get("scales", {})
+  xaxes = {a.get("id"): a for a in scales.get("xAxes", [])}
+  yaxes = {a.get("id"): a for a in scales.get("yAxes", [])}
+  decoded = [_dataset_xy(ds) for ds in datasets]
+  xaxis = next(iter(xaxes.values()), None)
+  yaxis = next(iter(yaxes.values()), None)
+
+  def ranges(axes, key, which):
+    return {axis_id: _axis_range(axis, [xy[which] for ds, xy in zip(datasets, decoded)
+                                        if ds.get(key) == axis_id])
+            for axis_id, axis in axes.items()}
+  xranges = ranges(xaxes, "xAxisID", 0)
+  yranges = ranges(yaxes, "yAxisID", 1)
+  default_x = _axis_range(xaxis, [xy[0] for xy in decoded])
+  default_y = _axis_range(yaxis, [xy[1] for xy in decoded])
+  xlo, xhi, xstep = xranges.get(xaxis.get("id")) if xaxis else default_x
+  ylo, yhi, ystep = yranges.get(yaxis.get("id")) if yaxis else default_y
+  xticks = _ticks(xlo, xhi, xstep)
+  yticks = _ticks(ylo, yhi, ystep)
+  xlabels = [_tick_label(t, xstep) for t in xticks]
+  ylabels = [_tick_label(t, ystep) for t in yticks]
+
+  tick_len = int(round(TICK_MARK_LENGTH * scale))
+  top += text_h // 2
+  left = max(pad + max(_text_width(l, font) for l in ylabels) + tick_len + pad,
+             pad + _text_width(xlabels[0], font) // 2)
+  right = w - pad - _text_width(xlabels[-1], font) // 2 - 1
+  bottom = h - pad - text_h - tick_len
+  if right <= left or bottom <= top:
+    return img
+  area = (left, top, right, bottom)
+
+  def to_px(v, lo, hi):
+    return left + (v - lo) * ((right - left) / (hi - lo))
+  def to_py(v, lo, hi):
+    return bottom - (v - lo) * ((bottom - top) / (hi - lo))
+
+  _draw_grid(img, area, xaxis, yaxis, xticks, yticks, xlabels, ylabels, xlo, xhi, ylo, yhi,
+             to_px, to_py, font, tick_len, scale)
+
+  # like Chart.js, the first dataset ends up on top
+  for dataset, (x, y, labels) in reversed(list(zip(datasets, decoded))):
+    dxlo, dxhi, _ = xranges.get(dataset.get("xAxisID"), (xlo, xhi, xstep))
+    dylo, dyhi, _ = yranges.get(dataset.get("yAxisID"), (ylo, yhi, ystep))
+    px = to_px(x, dxlo, dxhi)
+    py = to_py(y, dylo, dyhi)
+    if dataset.get("showLine"):
+      lx, ly = px, py
+      if dataset.get("steppedLine"):
+        lx, ly = _steps(px, py, dataset["steppedLine"])
+      # hist() fills down to 0, or to the edge of the chart if 0 isn't in range
+      if dataset.get("fill") in (True, "origin"):
+        _fill_area(img, lx, ly, to_py(min(max(0.0, dylo), dyhi), dylo, dyhi),
+                   parse_color(dataset.get("backgroundColor")), area)
+      _draw_line(img, lx, ly, parse_color(dataset.get("borderColor", "#000")),
+                 dataset.get("borderWidth", LINE_WIDTH) * scale, area)
+    _draw_points(img, px, py, dataset, scale, area)
+    datalabels = dataset.get("datalabels") or {}
+    if datalabels.get("display") and labels:
+      size = _text_scale(((datalabels.get("font") or {}).get("size") or FONT_SIZE) * scale)
+      color = parse_color(datalabels.get("color", "black"))
+      for i in np.flatnonzero(np.isfinite(px) & np.isfinite(py)):
+        if labels[i] is not None:
+          offset = _point_radius(dataset, i) * scale + 4 * scale
+          _draw_text(img, str(labels[i]), px[i] + offset, py[i] - 4 * size, color, size)
+  return img
+
+def _draw_legend(img, datasets, top, font, scale):
+  w = img.shape[1]
+  box_w = int(round(LEGEND_BOX_WIDTH * scale))
+  padding = int(round(LEGEND_PADDING * scale))
+  text_h = 8 * font
+  items = [(ds, str(ds.get("label", ""))) for ds in datasets]
+  widths = [box_w + padding // 2 + _text_width(label, font) for _, label in items]
+  rows, row, row_w = [], [], 0
+  for item, item_w in zip(items, widths):
+    if row and row_w + item_w > w - 2 * padding:
+      rows.append((row, row_w))
+      row, row_w = [], 0
+    row.append((item, item_w))
+    row_w += item_w + padding
+  rows.append((row, row_w))
+  top += padding
+  for row, row_w in rows:
+    x = (w - (row_w - padding)) // 2
+    for (dataset, label), item_w in row:
+      line = max(int(round(dataset.get("borderWidth", LINE_WIDTH) * scale)), 1)
+      border = parse_color(dataset.get("borderColor", "#000"))
+      _fill_rect(img, x, top, x + box_w, top + text_h, parse_color(dataset.get("backgroundColor")))
+      for x0, y0, x1, y1 in ((x, top, x + box_w, top + line),
+                             (x, top + text_h - line, x + box_w, top + text_h),
+                             (x, top, x + line, top + text_h),
+                             (x + box_w - line, top, x + box_w, top + text_h)):
+        _fill_rect(img, x0, y0, x1, y1, border)
+      _draw_text(img, label, x + box_w + padding // 2, top, (102, 102, 102, 1.0), font)
+      x += item_w + padding
+    top += text_h + padding
+  return top
+
+def _draw_grid(img, area, xaxis, yaxis, xticks, yticks, xlabels, ylabels, xlo, xhi, ylo, yhi,
+               to_px, to_py, font, tick_len, scale):
+  left, top, right, bottom = area
+  line = max(int(round(scale)), 1)
+  text_h = 8 * font
+  label_color = (102, 102, 102, 1.0)
+  def grid_colors(axis):
+    grid = (axis or {}).get("gridLines", {})
+    return (parse_color(grid.get("color", "rgba(0, 0, 0, 0.1)")),
+            parse_color(grid.get("zeroLineColor", "rgba(0, 0, 0, 0.25)")))
+  xcolor, xzero = grid_colors(xaxis)
+  ycolor, yzero = grid_colors(yaxis)
+  last_end = -np.inf
+  for i, (t, label) in enumerate(zip(xticks, xlabels)):
+    x = int(round(to_px(t, xlo, xhi)))
+    color = xzero if t == 0 and i > 0 else xcolor
+    _fill_rect(img, x, top, x + line, bottom + tick_len, color)
+    label_w = _text_width(label, font)
+    # Chart.js skips labels that would overlap
+    if x - label_w // 2 > last_end + 2 * font:
+      _draw_text(img, label, x, bottom + tick_len + line, label_color, font, "center")
+      last_end = x + label_w // 2
+  last_top = np.inf
+  for i, (t, label) in enumerate(zip(yticks, ylabels)):
+    y = int(round(to_py(t, ylo, yhi)))
+    color = yzero if t == 0 and i > 0 else ycolor
+    _fill_rect(img, left - tick_len, y, right + line, y + line, color)
+    if y + text_h // 2 < last_top:
+      _draw_text(img, label, left - tick_len - 3 * line, y - text_h // 2, label_color, font, "right")
+      last_top = y - text_h // 2
+
+def write_png(path, pixels, compression=PNG_COMPRESSION):
+  h, w, _ = pixels.shape
+  raw = np.empty((h, w * 3 + 1), dtype=np.uint8)
+  raw[:, 0] = 0  # no filter
+  raw[:, 1:] = pixels.reshape(h, w * 3)
+  def chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+  with open(path, "wb") as f:
+    f.write(b"\x89PNG\r\n\x1a\n")
+    f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)))
+    f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)))
+    f.write(chunk(b"IEND", b""))
+
+# save figure as a png of its viewport size (see _Figure._set_viewport) or the given one
+def save_png(figure, path, width=None, height=None, scale=None):
+  vw, vh, vscale = figure._viewport
+  save_spec_png(figure._get_static_data("float64"), path, width or vw, height or vh, scale or vscale)
+
+# the same from a spec of _Figure._get_static_data, e.g. taken earlier on another
+# thread, returns path
+def save_spec_png(spec, path, width, height, scale=1):
+  write_png(path, render(spec, width, height, scale))
+  return path
@@ -0,0 +1,168 @@
+import numpy as np
+
+from .utils import finite_extent
+
+# Fixed-capacity x/y buffer for streamed data. Appending is O(new points), the
+# oldest points are dropped once the buffer is full or fall out of the time window.
+# Extents are kept up to date incrementally, the whole buffer is only rescanned
+# when an evicted point was one of the extremes.
+class _RingBuffer(object):
+  def __init__(self, capacity : int, window : float = None):
+    if capacity < 1:
+      raise ValueError("capacity must be at least 1")
+    self.capacity = capacity
+    # keep only points with x >= newest x - window. Needs x to be appended in order.
+    self.window = window
+    self._x = np.empty(capacity)
+    self._y = np.empty(capacity)
+    self._start = 0
+    self._size = 0
+    # points evicted so far, the absolute index of the oldest point
+    self._dropped = 0
+    # while x only grows, its extent is just the oldest and newest point
+    self._x_sorted = True
+    self.xlims = (None, None)
+    self.ylims = (None, None)
+
+  def __len__(self):
+    return self._size
+
+  # (start, stop) slices of the storage for the logical range [first, first + count)
+  def _segments(self, first, count):
+    begin = (self._start + first) % self.capacity
+    end = begin + count
+    if end <= self.capacity:
+      return [(begin, end)]
+    return [(begin, self.capacity), (0, end - self.capacity)]
+
+  def _read(self, first, count):
+    segments = self._segments(first, count)
+    if len(segments) == 1:
+      (a, b), = segments
+      return self._x[a:b].copy(), self._y[a:b].copy()
+    return (np.concatenate([self._x[a:b] for a, b in segments]),
+            np.concatenate([self._y[a:b] for a, b in segments]))
+
+  # Absolute indexing for lod._MinMaxPyramid: point i is the i-th ever appended,
+  # valid for first <= i < stop
+  @property
+  def first(self):
+    return self._dropped
+
+  @property
+  def stop(self):
+    return self._dropped + self._size
+
+  def take(self, idx):
+    pos = (self._start + np.asarray(idx) - self._dropped) % self.capacity
+    return self._x[pos], self._y[pos]
+
+  def read(self, start, stop):
+    return self._read(start - self._dropped, stop - start)
+
+  # absolute index where value would be inserted, for sorted x
+  def searchsorted(self, value, side="left"):
+    return self._dropped + self._count_before(value, side)
+
+  # ordered copy of everything in the buffer
+  def view(self):
+    return self._read(0, self._size)
+
+  # ordered copy of the newest count points
+  def tail(self, count):
+    count = min(count, self._size)
+    return self._read(self._size - count, count)
+
+  def _extent(self, arr_segments):
+    lo, hi = None, None
+    for arr in arr_segments:
+      seg_lo, seg_hi = finite_extent(arr)
+      if seg_lo is None:
+        continue
+      lo = seg_lo if lo is None else min(lo, seg_lo)
+      hi = seg_hi if hi is None else max(hi, seg_hi)
+    return lo, hi
+
+  def _rescan(self):
+    segments = self._segments(0, self._size) if self._size else []
+    self.xlims = self._extent([self._x[a:b] for a, b in segments])
+    self.ylims = self._extent([self._y[a:b] for a, b in segments])
+
+  # drops count points from the front, returns whether the extents need a rescan
+  def _evict(self, count):
+    if count <= 0:
+      return False
+    segments = self._segments(0, count)
+    stale = False
+    checks = [(self._y, self.ylims)]
+    if not self._x_sorted:
+      checks.append((self._x, self.xlims))
+    for data, (lo, hi) in checks:
+      ev_lo, ev_hi = self._extent([data[a:b] for a, b in segments])
+      # unset extents (nothing finite seen yet) can't tell, rescan
+      if ev_lo is not None and (lo is None or ev_lo <= lo or ev_hi >= hi):
+        stale = True
+    self._start = (self._start + count) % self.capacity
+    self._size -= count
+    self._dropped += count
+    return stale
+
+  def _grow_extents(self, xs, ys):
+    for name, arr in (("xlims", xs), ("ylims", ys)):
+      lo, hi = getattr(self, name)
+      new_lo, new_hi = finite_extent(arr)
+      if new_lo is None:
+        continue
+      setattr(self, name, (new_lo if lo is None else min(lo, new_lo),
+                           new_hi if hi is None else max(hi, new_hi)))
+
+  # append points, returns how many old points were dropped
+  def extend(self, xs, ys):
+    xs = np.asarray(xs, dtype=np.float64).ravel()
+    ys = np.asarray(ys, dtype=np.float64).ravel()
+    if xs.shape != ys.shape:
+      raise ValueError("x and y must have the same length")
+    if xs.shape[0] > self.capacity:
+      xs = xs[-self.capacity:]
+      ys = ys[-self.capacity:]
+    n = xs.shape[0]
+    if n == 0:
+      return 0
+
+    if self._x_sorted:
+      last = self._x[(self._start + self._size - 1) % self.capacity] if self._size else -np.inf
+      self._x_sorted = bool(xs[0] >= last and np.all(xs[1:] >= xs[:-1]))
+
+    size_before = self._size
+    stale = self._evict(self._size + n - self.capacity)
+    first = 0
+    for a, b in self._segments(self._size, n):
+      self._x[a:b] = xs[first:first + b - a]
+      self._y[a:b] = ys[first:first + b - a]
+      first += b - a
+    self._size += n
+    # the extents cover the new points before the window can evict some of them again
+    if not stale:
+      self._grow_extents(xs, ys)
+
+    if self.window is not None and self._x_sorted:
+      oldest_kept = xs[-1] - self.window
+      stale = self._evict(self._count_before(oldest_kept)) or stale
+
+    if stale:
+      self._rescan()
+    elif self._x_sorted:
+      self.xlims = (float(self._x[self._start]),
+                    float(self._x[(self._start + self._size - 1) % self.capacity]))
+    return size_before + n - self._size
+
+  # number of leading points with x < value (<= for side="right"), for sorted x
+  def _count_before(self, value, side="left"):
+    count = 0
+    for a, b in self._segments(0, self._size):
+      seg = self._x[a:b]
+      i = int(np.searchsorted(seg, value, side=side))
+      count += i
+      if i < b - a:
+        break
+    return count
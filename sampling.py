@@ -0,0 +1,218 @@
+import hashlib
+import math
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+import numpy as np
+
+# Calls the user's f(x, *args) on whole arrays of x. f is first tried on the array
+# itself (works for anything written with numpy ufuncs), and if that fails or
+# doesn't give one y per x, it falls back to calling f once per x from then on.
+class _Evaluator(object):
+  def __init__(self, f, args):
+    self.f = f
+    self.args = args
+    self.vectorized = None
+    # number of x values f has been evaluated at, for benchmarks and metrics
+    self.count = 0
+
+  def __call__(self, xs):
+    self.count += xs.shape[0]
+    if self.vectorized is not False:
+      try:
+        # nan/inf from outside f's domain are expected and just become gaps
+        with np.errstate(all="ignore"):
+          ys = np.asarray(self.f(xs, *self.args), dtype=np.float64)
+        if ys.shape == xs.shape:
+          self.vectorized = True
+          return ys
+      except Exception:
+        if self.vectorized:
+          raise
+      self.vectorized = False
+    return np.array([self.f(x, *self.args) for x in xs], dtype=np.float64)
+
+# key for compiled functions and cached samples of f defined by code
+def code_hash(code):
+  return hashlib.sha1(code.encode()).hexdigest()
+
+# f compiled from source in a worker process, by code hash, each piece of code in a
+# namespace of its own. Worker processes are reused, so code is only exec'd once per
+# process while it is among the COMPILED_FUNCTIONS most recently used.
+COMPILED_FUNCTIONS = 256
+_compiled_functions = OrderedDict()
+
+def _compile_code(code_hash, code):
+  f = _compiled_functions.get(code_hash)
+  if f is not None:
+    _compiled_functions.move_to_end(code_hash)
+    return f
+  namespace = {"np": np, "math": math}
+  exec(code, namespace)
+  if not callable(namespace.get("f")):
+    raise ValueError("The code doesn't define a function f.")
+  f = _compiled_functions[code_hash] = namespace["f"]
+  if len(_compiled_functions) > COMPILED_FUNCTIONS:
+    _compiled_functions.popitem(last=False)
+  return f
+
+def _evaluate_code(code_hash, code, args, xs):
+  return _Evaluator(_compile_code(code_hash, code), args)(xs)
+
+# names of the parameters of f after x, compiling it in the worker like _evaluate_code
+def _code_params(code_hash, code):
+  f = _compile_code(code_hash, code)
+  names = list(f.__code__.co_varnames)[:f.__code__.co_argcount]
+  if not names or names[0] != "x":
+    raise ValueError("x not first argument of f.")
+  return names[1:]
+
+# Evaluates f in a process pool (workers._WorkerPool). Functions from exec can't be
+# pickled, so the source is sent instead and compiled on the other side. A batch still
+# running when cancel is set is stopped by killing its worker, f may never return.
+class _ProcessEvaluator(object):
+  POLL_INTERVAL = 0.05
+
+  def __init__(self, pool, code_hash, code, args, cancel=None):
+    self.pool = pool
+    self.code_hash = code_hash
+    self.code = code
+    self.args = args
+    self.cancel = cancel
+    self.count = 0
+
+  def __call__(self, xs):
+    self.count += xs.shape[0]
+    future = self.pool.submit(_evaluate_code, self.code_hash, self.code, self.args, xs)
+    while True:
+      done, _ = concurrent.futures.wait([future], timeout=self.POLL_INTERVAL)
+      if done:
+        return future.result()
+      if self.cancel is not None and self.cancel.is_set():
+        self.pool.kill(future)
+        raise concurrent.futures.CancelledError()
+
+# Evaluated (x, y) samples of one function with one set of parameters, kept across
+# get_result calls. Entries are keyed by (code hash, parameter values) and evicted
+# least recently used first once more than max_points samples are stored.
+class _EvaluationCache(object):
+  def __init__(self, max_points : int = 2000000):
+    self.max_points = max_points
+    self._entries = OrderedDict()
+    self._size = 0
+    # get_result can run on several worker threads at once
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return self._size
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._size = 0
+
+  # (hit mask, ys) for xs, ys is only meaningful where hit is True
+  def get(self, key, xs):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return np.zeros(xs.shape[0], dtype=bool), np.empty(xs.shape[0])
+      self._entries.move_to_end(key)
+    cached_xs, cached_ys = entry
+    pos = np.minimum(np.searchsorted(cached_xs, xs), cached_xs.shape[0] - 1)
+    return cached_xs[pos] == xs, cached_ys[pos]
+
+  def put(self, key, xs, ys):
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self._size -= entry[0].shape[0]
+        xs = np.concatenate([entry[0], xs])
+        ys = np.concatenate([entry[1], ys])
+      xs, first = np.unique(xs, return_index=True)
+      self._entries[key] = (xs, ys[first])
+      self._size += xs.shape[0]
+      while self._size > self.max_points and len(self._entries) > 1:
+        _, (old_xs, _) = self._entries.popitem(last=False)
+        self._size -= old_xs.shape[0]
+
+# Evaluator that only calls the wrapped one for x values not in the cache yet
+class _CachedEvaluator(object):
+  def __init__(self, evaluate, cache, key):
+    self.evaluate = evaluate
+    self.cache = cache
+    self.key = key
+
+  def __call__(self, xs):
+    hit, ys = self.cache.get(self.key, xs)
+    if hit.all():
+      return ys
+    miss = ~hit
+    ys[miss] = self.evaluate(xs[miss])
+    self.cache.put(self.key, xs[miss], ys[miss])
+    return ys
+
+# Initial samples on the lattice k * step with step a power of two, covering [xmin, xmax].
+# Panning or zooming lands on the same lattice (or a refinement of it), and midpoints
+# of lattice points are exact, so earlier samples can be found in the cache again.
+def _initial_samples(xmin, xmax, init_count):
+  step = 2.0 ** np.floor(np.log2((xmax - xmin) / init_count))
+  return np.arange(np.floor(xmin / step), np.ceil(xmax / step) + 1) * step
+
+# how far each interior sample is from the chord between its two neighbours
+def _chord_deviation(xs, ys):
+  h1 = xs[1:-1] - xs[:-2]
+  h2 = xs[2:] - xs[1:-1]
+  chord = ys[:-2] + (ys[2:] - ys[:-2]) * (h1 / (h1 + h2))
+  return np.abs(ys[1:-1] - chord)
+
+# Sample evaluate() on [xmin, xmax] for a plot of width_px x height_px so that drawing
+# straight lines between the samples is off by at most pixel_tolerance px. Starts from
+# at least init_count even steps (see _initial_samples), then each iteration adds the midpoints of every interval next
+# to a sample that is too far from its neighbours' chord, or at the edge of a
+# non-finite region, all in one evaluate() call. Intervals narrower than a pixel are
+# left alone. ylims fixes the y range the tolerance is measured against. Setting the
+# cancel event stops sampling with CancelledError before the next batch.
+def adaptive_sample(evaluate, xmin, xmax, init_count, max_iterations, pixel_tolerance,
+                    width_px, height_px, ylims=None, cancel=None):
+  xs = _initial_samples(xmin, xmax, init_count)
+  ys = evaluate(xs)
+  min_step = (xmax - xmin) / width_px
+  for _ in range(max_iterations):
+    if cancel is not None and cancel.is_set():
+      raise concurrent.futures.CancelledError()
+    tolerance = pixel_tolerance_to_y(ys, height_px, pixel_tolerance, ylims)
+    finite = np.isfinite(ys)
+    refine = np.zeros(xs.shape[0] - 1, dtype=bool)
+    if xs.shape[0] > 2:
+      both = finite[:-2] & finite[1:-1] & finite[2:]
+      with np.errstate(invalid="ignore"):
+        bad = both & (_chord_deviation(xs, ys) > tolerance)
+      # a bad sample refines the intervals on both sides of it
+      refine[:-1] |= bad
+      refine[1:] |= bad
+    # edges of gaps (asymptotes, sqrt of negatives, ...)
+    refine |= finite[:-1] != finite[1:]
+    refine &= np.diff(xs) > min_step
+    if not refine.any():
+      break
+    idx = np.flatnonzero(refine)
+    new_xs = (xs[idx] + xs[idx + 1]) / 2
+    new_ys = evaluate(new_xs)
+    xs = np.insert(xs, idx + 1, new_xs)
+    ys = np.insert(ys, idx + 1, new_ys)
+  return xs, ys
+
+# tolerance in y units for pixel_tolerance px, from the y range that will be shown
+def pixel_tolerance_to_y(ys, height_px, pixel_tolerance, ylims=None):
+  if ylims is not None:
+    lo, hi = ylims
+  else:
+    finite = ys[np.isfinite(ys)]
+    if finite.size == 0:
+      return np.inf
+    lo, hi = finite.min(), finite.max()
+  if hi <= lo:
+    return np.inf
+  return pixel_tolerance * (hi - lo) / height_px
@@ -0,0 +1,61 @@
+import asyncio
+
+from .utils import exception_as_string
+
+# Runs run(key, params) for each key, at most one at a time per key. Requests that
+# arrive while one is running replace each other, so when it finishes only the newest
+# is run and the ones in between are dropped.
+class _LatestWinsScheduler(object):
+  def __init__(self, run):
+    self._run = run
+    self._pending = {}
+    self._running = set()
+    self._tasks = set()
+    self.submitted = 0
+    self.dropped = 0
+    self.completed = 0
+
+  def submit(self, key, params):
+    self.submitted += 1
+    if key in self._pending:
+      self.dropped += 1
+    self._pending[key] = params
+    if key not in self._running:
+      self._running.add(key)
+      task = asyncio.ensure_future(self._drain(key))
+      self._tasks.add(task)
+      task.add_done_callback(self._tasks.discard)
+
+  # forget a key's pending request, e.g. when the client is gone
+  def discard(self, key):
+    if self._pending.pop(key, None) is not None:
+      self.dropped += 1
+
+  # cancel pending and running requests, e.g. when the server stops
+  async def close(self):
+    self._pending.clear()
+    tasks = list(self._tasks)
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+  async def _drain(self, key):
+    try:
+      while key in self._pending:
+        params = self._pending.pop(key)
+        try:
+          await self._run(key, params)
+        except Exception as e:
+          print (''.join(exception_as_string(e)))
+        self.completed += 1
+    finally:
+      self._running.discard(key)
+
+  def stats(self):
+    return {
+      "submitted": self.submitted,
+      "dropped": self.dropped,
+      "completed": self.completed,
+      "pending": len(self._pending),
+      "in_flight": len(self._running),
+    }
@@ -1,130 +1,347 @@
-import socketio
-import aiohttp.web
-
-import numpy as np
-import scipy
-import math
-import functools
-import traceback
-
-app = aiohttp.web.Application()
-sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins="*")
-sio.attach(app)
-
-HOST = "localhost"
-PORT = 15555
-
-func_params = ()
-
-def f(x):
-  return x
-
-def exception_as_string(e):
-  return traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
-
-STEP_COUNT_INIT = 275
-INC_TOL = 20  # must be even!
-
-# @functools.lru_cache(maxsize=1024)
-def get_result(params):
-  f_wrapped = functools.lru_cache(maxsize=40000)(f)
-  args = [params["parameters"][s] for s in func_params]
-
-  step = (params["xmax"] - params["xmin"]) / STEP_COUNT_INIT
-
-  xi = np.arange(params["xmin"], params["xmax"] + step, step)  # +step for fencepost
-  step_sizes = [step for _ in range(xi.shape[0])]
-  it = 0
-  while True:
-    # get y values
-    yi = [f_wrapped(x, *args) for x in xi]
-    max_allowed_dy = (np.max(yi) - np.min(yi)) / 120
-    dy = np.gradient(yi)
-    # check gradient
-    inc = dy > max_allowed_dy 
-    if not (it < 3 and np.any(inc)): break
-    # flag all the spots where the gradient is too big and areas nearby
-    padded = np.pad(inc, INC_TOL//2, "constant")
-    big = np.repeat(padded[None], INC_TOL, axis=0)
-    for ix, j in enumerate(range(-INC_TOL//2, INC_TOL//2)):
-      big[ix] = np.roll(big[ix], j)
-    inc = np.max(big, axis=0)[INC_TOL//2: -INC_TOL//2]
-    # recalculate x values and save step sizes for each
-    new_xi = []
-    new_step_sizes = []
-    for i, v in enumerate(xi):
-      ss = step_sizes[i]
-      if inc[i]:
-        new_xi.append(v - ss/3)
-        new_step_sizes.append(ss/3)
-        new_xi.append(v)
-        new_step_sizes.append(ss/3)
-        new_xi.append(v + ss/3)
-        new_step_sizes.append(ss/3)
-      else:
-        new_xi.append(v) 
-        new_step_sizes.append(ss)
-    xi = new_xi
-    step_sizes = new_step_sizes
-    it += 1
-  
-  return {"labels": list(xi), "data": yi, "error": None}
-
-@sio.on('get_graph_update')
-async def get_data(sid, params):
-  try:
-    result = get_result(params)
-    await sio.emit('update_graph', result)
-    return "OK"
-  except Exception as e:
-    await sio.emit('update_graph', {"error": exception_as_string(e), "labels": [], "data": []})
-    return "ERROR"
+import argparse
+import asyncio
+import contextlib
+import concurrent.futures
+import os
+import sys
+import threading
+import time
+
+from .chart_session import DEFAULT_HOST, DEFAULT_PORT, STATIC_FILES, RENDER_TIMEOUT, EVAL_TIMEOUT, DISCONNECT_TIMEOUT
+from .plot import _Figure
+from .sampling import _EvaluationCache, _code_params, code_hash
+from .workers import _WorkerPool
+from .scheduler import _LatestWinsScheduler
+from .metrics import _Metrics
+from .utils import exception_as_string, wait_with_timeout, cancel_pending_tasks, job_cancelled
+
+# Hosted server for many independent interactive sessions: every page that connects
+# gets a session of its own, with its own figure, function and cached samples.
+# Functions from the pages are only ever exec'd in the worker processes, never in the
+# server.
+#
+#   python -m <package>.server --port 15555 --workers 8
+#
+# Sessions share a bounded pool of worker processes (workers.py), but a process only
+# ever runs the code of one session: when another session needs it, it's replaced by
+# a fresh one forked from the forkserver. So code that patches np, math or this
+# package, or leaves anything else behind in its process, can't change what other
+# sessions get. A session that times out has only the process running its call killed
+# and replaced, evaluations of other sessions carry on. Processes idle for
+# WORKER_IDLE_TIMEOUT seconds are stopped.
+#
+# This isn't a sandbox: code from the pages runs with the privileges of the server,
+# it can read and write files, open connections and start processes as the server's
+# user. Run the server as an unprivileged user in a container or VM that holds
+# nothing else, and only open it to people you'd give a shell there.
+#
+# Admission control: connections beyond max_sessions are refused, and once
+# max_pending evaluations are admitted,
+# further requests are answered with a "busy" error right away instead of queueing.
+# Each session has at most one evaluation running, newer requests replace older
+# pending ones. Sessions idle for session_idle_timeout seconds are disconnected.
+
+MAX_SESSIONS = 5000
+# evaluations admitted at once, per worker process
+PENDING_PER_WORKER = 8
+SESSION_IDLE_TIMEOUT = 15 * 60
+WORKER_IDLE_TIMEOUT = 60
+JANITOR_INTERVAL = 5
+# samples of f cached per session, a ChartSession keeps far more
+SESSION_CACHE_POINTS = 20000
+MAX_CODE_LENGTH = 1 << 16
+# viewport sampling is tuned for, pages don't send their size
+DEFAULT_VIEWPORT = (1200, 700)
 
-@sio.on('get_function_update')
-async def get_data(sid, params):
-  global func_params
+# get_result on the session's own workers, which are kept for it until it returns
+def _get_result(ipl, params, cancel, pool, metrics):
   try:
-    # exec string throws error or sets f as global
-    exec(params["code"], globals())
-    func_params_temp = list(f.__code__.co_varnames)[:f.__code__.co_argcount]
-    if func_params_temp[0] != "x":
-      raise ValueError("x not first argument of f.")
-    func_params = func_params_temp[1:]
-    await sio.emit('update_function', {"params": func_params, "error": None})
-  except Exception as e:
-    await sio.emit('update_function', {"error": exception_as_string(e), "params": []})
+    return ipl.get_result(params, cancel, pool, metrics)
+  finally:
+    pool.release()
 
-routes = aiohttp.web.RouteTableDef()
+# what the server keeps for one page
+class _HostedSession(object):
+  def __init__(self, sid):
+    self.sid = sid
+    self.figure = _Figure()
+    self.figure._set_viewport(*DEFAULT_VIEWPORT)
+    self.ipl = self.figure.add_interactive_plot()
+    self.ipl._eval_cache = _EvaluationCache(SESSION_CACHE_POINTS)
+    self.sent_full = False
+    # set when the page acks a render
+    self.rendered = asyncio.Event()
+    # set to cancel the evaluation in flight
+    self.cancel = None
+    self.closed = False
+    self.last_active = time.monotonic()
 
-@routes.get('/')
-async def hello(request):
-  return aiohttp.web.Response(text="This is the Python endpoint, not the chart app!")
+class _HostedServer(object):
+  def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None,
+               max_sessions=MAX_SESSIONS, max_pending=None,
+               session_idle_timeout=SESSION_IDLE_TIMEOUT, eval_timeout=EVAL_TIMEOUT):
+    self.host = host
+    self.port = port
+    workers = workers or os.cpu_count() or 1
+    self.max_sessions = max_sessions
+    self.max_pending = max_pending or PENDING_PER_WORKER * workers
+    self.session_idle_timeout = session_idle_timeout
+    self.eval_timeout = eval_timeout
+    self._workers = _WorkerPool(workers, isolate=True)
+    # get_result runs here and sends batches of x to the worker processes
+    self._thread_pool = concurrent.futures.ThreadPoolExecutor(self.max_pending)
+    self._sessions = {}  # sid -> _HostedSession
+    self._in_flight = 0
+    self._metrics = _Metrics()
 
-app.add_routes(routes)
+  async def start(self):
+    import aiohttp.web
+    import socketio
+    self._stopped = asyncio.Event()
+    self._scheduler = _LatestWinsScheduler(self._update)
+    self.app = aiohttp.web.Application()
+    self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins="*")
+    self.sio.attach(self.app)
+    self.sio.on("connect", self._record_connection)
+    self.sio.on("disconnect", self._remove_connection)
+    self.sio.on("get_graph_update", self._schedule_update)
+    self.sio.on("get_function_update", self._function_update)
+    self.sio.on("graph_updated", self._graph_updated)
+    self.app.router.add_get("/metrics", self._metrics_handler)
+    # without a frontend build, the server still answers socket.io clients
+    if os.path.isdir(STATIC_FILES):
+      self.app.router.add_static("/", STATIC_FILES)
+    self.runner = aiohttp.web.AppRunner(self.app)
+    await self.runner.setup()
+    site = aiohttp.web.TCPSite(self.runner, self.host, self.port)
+    await site.start()
+    self.port = self.runner.addresses[0][1]
+    self._janitor_task = asyncio.ensure_future(self._janitor())
 
-if __name__ == '__main__':
-  aiohttp.web.run_app(app, path=HOST, port=PORT)
+  async def stop(self):
+    self._janitor_task.cancel()
+    for session in self._sessions.values():
+      if session.cancel is not None:
+        session.cancel.set()
+    await self._scheduler.close()
+    with contextlib.suppress(Exception):
+      # disconnects the pages still there and stops engine.io's service task
+      if hasattr(self.sio, "shutdown"):
+        await asyncio.wait_for(self.sio.shutdown(), DISCONNECT_TIMEOUT)
+      await asyncio.wait_for(self.runner.cleanup(), DISCONNECT_TIMEOUT)
+    self._thread_pool.shutdown(wait=False)
+    self._workers.shutdown()
 
-##############################################
-# goals for Python library:
-# with chartpy.session() as session:
-#   graph = session.scatter(x, y **kwargs)  # builds/controls data JSONs to send
-#   graph.setTitle("my title")
-#   graph.show(blocking=True)  # throw the graph up on the page
-#   graph.block()  # manually block
-#   graph.save("filename.png")  # saves to downloads
-#   graph.generateHTML()  # not sure how this would work
-#   session.scatter(x, y, multi_y=True, blocking=True)
-#
-# with chartpy.session() as session:
-#   session.interactive()
-# High priority:
-# scatter, line, scatter w labels, bar
-# multiple types on same graph
-# multiple graphs in interactive mode
-# entire interactive mode while graph is displayed
-
-# Other features
-# draggable bar between parameters and graph
-# click and drag, scroll on graph
-# turn animation on/off
+  async def run(self):
+    await self.start()
+    print (f"Serving on http://{self.host}:{self.port}")
+    try:
+      await self._stopped.wait()
+    finally:
+      await self.stop()
+
+  async def _janitor(self):
+    while True:
+      await asyncio.sleep(JANITOR_INTERVAL)
+      now = time.monotonic()
+      idle = [sid for sid, session in self._sessions.items()
+              if session.cancel is None and now - session.last_active > self.session_idle_timeout]
+      for sid in idle:
+        self._metrics.increment("sessions_evicted")
+        with contextlib.suppress(Exception):
+          await self.sio.disconnect(sid)
+      evicted = self._workers.evict_idle(WORKER_IDLE_TIMEOUT)
+      if evicted:
+        self._metrics.increment("workers_evicted", evicted)
+
+  async def _record_connection(self, sid, environ, auth=None):
+    if len(self._sessions) >= self.max_sessions:
+      from socketio.exceptions import ConnectionRefusedError
+      self._metrics.increment("sessions_refused")
+      raise ConnectionRefusedError("The server is full, try again later.")
+    self._sessions[sid] = _HostedSession(sid)
+    self._metrics.increment("connects")
+    self._metrics.set_gauge("sessions", len(self._sessions))
+    # the page shows the figure with the code box and sliders once it has it
+    self._scheduler.submit(sid, None)
+
+  async def _remove_connection(self, sid):
+    session = self._sessions.pop(sid, None)
+    if session is None:
+      return
+    session.closed = True
+    if session.cancel is not None:
+      session.cancel.set()
+    self._scheduler.discard(sid)
+    self._metrics.increment("disconnects")
+    self._metrics.set_gauge("sessions", len(self._sessions))
+
+  def _get_session(self, sid):
+    session = self._sessions.get(sid)
+    if session is not None:
+      session.last_active = time.monotonic()
+    return session
+
+  async def _graph_updated(self, sid, params=None):
+    session = self._sessions.get(sid)
+    if session is not None:
+      session.rendered.set()
+
+  async def _schedule_update(self, sid, params):
+    if self._get_session(sid) is not None:
+      self._scheduler.submit(sid, params)
+
+  # admit an evaluation, False if max_pending are already admitted
+  def _admit(self):
+    if self._in_flight >= self.max_pending:
+      self._metrics.increment("requests_rejected")
+      return False
+    self._in_flight += 1
+    self._metrics.set_gauge("in_flight", self._in_flight)
+    return True
+
+  def _finish(self):
+    self._in_flight -= 1
+    self._metrics.set_gauge("in_flight", self._in_flight)
+
+  async def _function_update(self, sid, params):
+    session = self._get_session(sid)
+    if session is None:
+      return
+    code = (params or {}).get("code") or ""
+    if len(code) > MAX_CODE_LENGTH:
+      res = {"error": [f"The code is longer than {MAX_CODE_LENGTH} characters."], "params": []}
+    elif not self._admit():
+      res = {"error": ["The server is busy, try again."], "params": []}
+    else:
+      res = await self._compile(session, code)
+    res["figure"] = session.figure.id_
+    await self.sio.emit("update_function", res, to=sid)
+
+  # check code in one of the session's worker processes and get the names of f's
+  # parameters from there
+  async def _compile(self, session, code):
+    future = self._workers.submit(_code_params, code_hash(code), code, owner=session.sid)
+    try:
+      with self._metrics.time("function_info_seconds"):
+        names = await asyncio.wait_for(asyncio.wrap_future(future), self.eval_timeout)
+      session.ipl._set_code(code, names)
+      return {"params": names, "error": None}
+    except asyncio.TimeoutError:
+      self._metrics.increment("eval_timeouts")
+      # the code may be stuck at its top level
+      self._workers.kill(future)
+      return {"error": [f"Running the code took longer than {self.eval_timeout}s, gave up."], "params": []}
+    except Exception as e:
+      return {"error": exception_as_string(e), "params": []}
+    finally:
+      self._finish()
+
+  async def _update(self, sid, params):
+    session = self._sessions.get(sid)
+    if session is None:
+      return False
+    start = time.perf_counter()
+    error = None
+    if params:
+      if not self._admit():
+        error = ["The server is busy, try again."]
+      else:
+        error = await self._evaluate(session, params)
+      if session.closed:
+        self._metrics.increment("updates_abandoned")
+        return False
+    figure = session.figure
+    if session.sent_full:
+      event, data = "update_graph_delta", figure._get_delta()
+    else:
+      event, data = "update_graph", figure._get_data()
+      session.sent_full = True
+    if error:
+      data["error"] = error
+    session.rendered.clear()
+    await self.sio.emit(event, data, to=sid)
+    # one frame at a time per page, without holding up any other session
+    rendered = await wait_with_timeout(session.rendered, RENDER_TIMEOUT)
+    if not rendered:
+      self._metrics.increment("render_timeouts")
+    self._metrics.observe("update_seconds", time.perf_counter() - start)
+    return rendered
+
+  # sample the session's f in its worker processes and put the result in its figure,
+  # returns the error to show on the page, if any
+  async def _evaluate(self, session, params):
+    loop = asyncio.get_event_loop()
+    cancel = session.cancel = threading.Event()
+    future = loop.run_in_executor(self._thread_pool, _get_result, session.ipl, params, cancel,
+                                  self._workers.owned_by(session.sid), self._metrics)
+    try:
+      with self._metrics.time("evaluate_seconds"):
+        xi, yi = await asyncio.wait_for(future, self.eval_timeout)
+    except asyncio.TimeoutError:
+      # get_result then kills the worker f may be stuck in, and only that one
+      cancel.set()
+      self._metrics.increment("eval_timeouts")
+      return [f"Evaluating f took longer than {self.eval_timeout}s, gave up."]
+    except (asyncio.CancelledError, concurrent.futures.CancelledError):
+      if not job_cancelled(future):
+        # the update task is cancelled (scheduler.close(), shutdown), stop f too
+        cancel.set()
+        raise
+      self._metrics.increment("evals_cancelled")
+      return None
+    except Exception as e:
+      self._metrics.increment("eval_errors")
+      return exception_as_string(e)
+    finally:
+      session.cancel = None
+      self._finish()
+    if session.closed:
+      return None
+    with self._metrics.time("apply_seconds"):
+      return session.ipl._apply_result(params, xi, yi)["error"]
+
+  async def _metrics_handler(self, request):
+    import aiohttp.web
+    if request.query.get("format") == "prometheus":
+      return aiohttp.web.Response(text=self._metrics.to_prometheus(),
+                                  content_type="text/plain")
+    return aiohttp.web.json_response(self.get_metrics())
+
+  # like ChartSession.get_metrics(), plus the worker pool
+  def get_metrics(self):
+    metrics = self._metrics.snapshot()
+    metrics["scheduler"] = self._scheduler.stats()
+    metrics["workers"] = self._workers.stats()
+    return metrics
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Hosted server for many independent interactive chart sessions.")
+  parser.add_argument("--host", default=DEFAULT_HOST)
+  parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+  parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+  parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+  parser.add_argument("--max-pending", type=int, default=None,
+                      help=f"evaluations admitted at once (default: {PENDING_PER_WORKER} per worker)")
+  parser.add_argument("--session-idle-timeout", type=float, default=SESSION_IDLE_TIMEOUT)
+  parser.add_argument("--eval-timeout", type=float, default=EVAL_TIMEOUT)
+  args = parser.parse_args(argv)
+  server = _HostedServer(args.host, args.port, args.workers, args.max_sessions, args.max_pending,
+                         args.session_idle_timeout, args.eval_timeout)
+  loop = asyncio.new_event_loop()
+  try:
+    loop.run_until_complete(server.run())
+  except KeyboardInterrupt:
+    with contextlib.suppress(Exception):
+      loop.run_until_complete(server.stop())
+  except Exception as e:
+    print (''.join(exception_as_string(e)))
+    return 1
+  finally:
+    # engine.io's per-socket tasks outlive the server
+    loop.run_until_complete(cancel_pending_tasks())
+    loop.close()
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,6 +1,7 @@
 import React from 'react';
 import './App.css';
 
+import PropTypes from 'prop-types';
 import { ThemeProvider } from '@material-ui/styles';
 
 import { Scatter } from 'react-chartjs-2';
@@ -9,6 +10,9 @@ import 'chartjs-plugin-datalabels';
 import Chart from 'chart.js';
 import {
   subscribeToGraphUpdates,
+  subscribeToGraphDeltas,
+  subscribeToGraphAppends,
+  subscribeToGraphClears,
   requestGraphUpdate,
   unsubscribeToUpdates,
   setImageDataHandler,
@@ -16,66 +20,59 @@ import {
   sendImageData,
   fireGraphUpdated,
 } from './api';
+import { decodeData, mergeDelta, appendPoints } from './transport';
 import PythonArea from './PythonArea';
 import FunctionParameters from './FunctionParameters';
 import ChartControls from './ChartControls';
 import theme from './theme';
 
+// Chart.js instances drawn inside the container of one figure
+function chartsOf(figureId) {
+  const container = document.getElementById(`chart-${figureId}`);
+  if (!container) {
+    return [];
+  }
+  return Object.keys(Chart.instances)
+    .map((id) => Chart.instances[id])
+    .filter((chart) => container.contains(chart.canvas));
+}
+
+// columns and rows for count figures, the same as grid_shape in utils.py
+function gridShape(count) {
+  const cols = Math.max(1, Math.ceil(Math.sqrt(count)));
+  return { cols, rows: Math.max(1, Math.ceil(count / cols)) };
+}
 
+// One figure: the chart and, for interactive figures, the controls for it
 class ChartView extends React.Component {
   constructor(props) {
     super(props);
-    subscribeToGraphUpdates(async (res) => {
-      await this.setState({
-        plotData: res.data,
-        error: res.error,
-        options: res.options,
-        interactive: res.interactive,
-        defaultxmin: res.defaultxmin,
-        plotExtrema: {
-          xmin: res.defaultxmin,
-          xmax: res.defaultxmax,
-        },
-        defaultxmax: res.defaultxmax,
-      });
-      console.log (res);
-      fireGraphUpdated();
-    });
-    setImageDataHandler(() => {
-      // loop for good measure, there should only be one
-      const ids = Object.keys(Chart.instances);
-      for (let i = 0; i < ids.length; i += 1) {
-        const imageData = Chart.instances[ids[i]].toBase64Image();
-        sendImageData(imageData);
-        break;
-      }
-    });
     this.state = {
       plotExtrema: {
-        xmin: -5,
-        xmax: 5,
+        xmin: props.figure.defaultxmin,
+        xmax: props.figure.defaultxmax,
         ymin: undefined,
         ymax: undefined,
       },
       parameterNames: [],
       params: {},
-      plotData: { datasets: [] },
     };
   }
 
-  componentDidUpdate() {
-    const ids = Object.keys(Chart.instances);
-    for (let i = 0; i < ids.length; i += 1) {
-      Chart.instances[ids[i]].resize();
+  componentDidUpdate(prevProps) {
+    const { figure, figureId } = this.props;
+    if (prevProps.figure.defaultxmin !== figure.defaultxmin
+        || prevProps.figure.defaultxmax !== figure.defaultxmax) {
+      // eslint-disable-next-line react/no-did-update-set-state
+      this.setState(({ plotExtrema }) => ({
+        plotExtrema: { ...plotExtrema, xmin: figure.defaultxmin, xmax: figure.defaultxmax },
+      }));
     }
-  }
-
-  componentWillUnmount() {
-    unsubscribeImageDataHandler();
-    unsubscribeToUpdates();
+    chartsOf(figureId).forEach((chart) => chart.resize());
   }
 
   updateData() {
+    const { figureId } = this.props;
     const {
       params,
       plotExtrema: {
@@ -83,6 +80,7 @@ class ChartView extends React.Component {
       },
     } = this.state;
     const paramsForPython = {
+      figure: figureId,
       xmin,
       xmax,
       ymin: ymin === '' ? undefined : ymin,
@@ -102,9 +100,11 @@ class ChartView extends React.Component {
   }
 
   render() {
+    const { figure, figureId } = this.props;
     const {
-      error, parameterNames, options, plotData, interactive, defaultxmin, defaultxmax,
-    } = this.state;
+      error, options, plotData, interactive, defaultxmin, defaultxmax,
+    } = figure;
+    const { parameterNames } = this.state;
     const pythonError = error || '';
     let controls;
     if (interactive) {
@@ -115,6 +115,7 @@ class ChartView extends React.Component {
             onChange={(params) => this.update({ plotExtrema: params })}
           />
           <PythonArea
+            figureId={figureId}
             handleFunctionUpdate={(res) => this.update({ parameterNames: res })}
             errorOverrideData={pythonError}
           />
@@ -137,8 +138,107 @@ class ChartView extends React.Component {
   }
 }
 
+ChartView.propTypes = {
+  figureId: PropTypes.string.isRequired,
+  figure: PropTypes.shape({
+    plotData: PropTypes.object,
+    options: PropTypes.object,
+    error: PropTypes.oneOfType([PropTypes.string, PropTypes.arrayOf(PropTypes.string)]),
+    interactive: PropTypes.bool,
+    defaultxmin: PropTypes.number,
+    defaultxmax: PropTypes.number,
+  }).isRequired,
+};
+
+// All figures of the session, in a grid. Messages from the server carry the id of
+// the figure they are for.
+class FigureGrid extends React.Component {
+  constructor(props) {
+    super(props);
+    subscribeToGraphUpdates((res) => {
+      this.setFigure(res, () => ({
+        plotData: decodeData(res.data),
+        error: res.error,
+        options: res.options,
+        interactive: res.interactive,
+        defaultxmin: res.defaultxmin,
+        defaultxmax: res.defaultxmax,
+      }));
+    });
+    subscribeToGraphDeltas((res) => {
+      this.setFigure(res, (figure) => ({
+        plotData: mergeDelta(figure.plotData, res),
+        error: res.error,
+        options: res.options || figure.options,
+        interactive: res.interactive,
+        defaultxmin: res.defaultxmin,
+        defaultxmax: res.defaultxmax,
+      }));
+    });
+    subscribeToGraphAppends((res) => {
+      const { figures } = this.state;
+      const figure = figures[res.id];
+      const { plotData } = figure;
+      const changed = Object.keys(res.datasets).length > 0 || res.count !== plotData.datasets.length;
+      const nextData = changed ? mergeDelta(plotData, res) : plotData;
+      appendPoints(nextData, res.appends);
+      const redraw = () => {
+        chartsOf(res.id).forEach((chart) => chart.update());
+        fireGraphUpdated(res.id, res.render);
+      };
+      if (changed || res.options) {
+        this.setFigure(res, () => ({
+          ...figure, plotData: nextData, options: res.options || figure.options,
+        }), redraw);
+      } else {
+        redraw();
+      }
+    });
+    subscribeToGraphClears(() => this.setState({ figures: {}, order: [] }));
+    // params.id tells the server which of its pending saves this is for
+    setImageDataHandler((params) => {
+      const [chart] = chartsOf(params.figure);
+      sendImageData(params.figure, params.id, chart ? chart.toBase64Image() : null);
+    });
+    this.state = {
+      figures: {},
+      // ids in the order the figures first arrived
+      order: [],
+    };
+  }
+
+  componentWillUnmount() {
+    unsubscribeImageDataHandler();
+    unsubscribeToUpdates();
+  }
+
+  // replace figure res.id with makeFigure(current figure), then ack the render of res
+  setFigure(res, makeFigure, done = () => fireGraphUpdated(res.id, res.render)) {
+    const { id } = res;
+    this.setState(({ figures, order }) => ({
+      figures: { ...figures, [id]: makeFigure(figures[id]) },
+      order: order.includes(id) ? order : [...order, id],
+    }), done);
+  }
+
+  render() {
+    const { figures, order } = this.state;
+    const { cols, rows } = gridShape(order.length);
+    const size = { width: `${100 / cols}%`, height: `${100 / rows}vh` };
+    return (
+      <div className="figures-container">
+        {order.map((id) => (
+          <div key={id} id={`chart-${id}`} className="figure-container" style={size}>
+            <ChartView figureId={id} figure={figures[id]} />
+          </div>
+        ))}
+      </div>
+    );
+  }
+}
+
 function App() {
-  return <ThemeProvider theme={theme}><ChartView /></ThemeProvider>;
+  return <ThemeProvider theme={theme}><FigureGrid /></ThemeProvider>;
 }
 
 export default App;
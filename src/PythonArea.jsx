@@ -30,17 +30,22 @@ class PythonArea extends React.Component {
   }
 
   componentDidMount() {
-    requestFunctionUpdate({ code: this.contents });
+    const { figureId } = this.props;
+    requestFunctionUpdate({ code: this.contents, figure: figureId });
   }
 
-  // eslint-disable-next-line class-methods-use-this
   onChange(event) {
+    const { figureId } = this.props;
     const contents = event.target.value;
-    requestFunctionUpdate({ code: contents });
+    requestFunctionUpdate({ code: contents, figure: figureId });
   }
 
   processFunctionResult(res) {
-    const { handleFunctionUpdate } = this.props;
+    const { handleFunctionUpdate, figureId } = this.props;
+    // updates for the other figures on the page
+    if (res.figure !== undefined && res.figure !== figureId) {
+      return;
+    }
     this.setState({ errortext: res.error === null ? '' : res.error }, () => {
       handleFunctionUpdate(res.params);
     });
@@ -83,6 +88,7 @@ class PythonArea extends React.Component {
 }
 
 PythonArea.propTypes = {
+  figureId: PropTypes.string,
   handleFunctionUpdate: PropTypes.func.isRequired,
   errorOverrideData: PropTypes.oneOfType([
     PropTypes.string,
@@ -91,4 +97,8 @@ PythonArea.propTypes = {
   ]).isRequired,
 };
 
+PythonArea.defaultProps = {
+  figureId: '0',
+};
+
 export default PythonArea;
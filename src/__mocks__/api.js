@@ -6,6 +6,18 @@ function subscribeToGraphUpdates(cb) {
   listeners.update_graph = cb;
 }
 
+function subscribeToGraphDeltas(cb) {
+  listeners.update_graph_delta = cb;
+}
+
+function subscribeToGraphAppends(cb) {
+  listeners.append_graph_data = cb;
+}
+
+function subscribeToGraphClears(cb) {
+  listeners.clear_graphs = cb;
+}
+
 function requestGraphUpdate() {
   listeners.update_graph(graphUpdateResponse);
 }
@@ -16,6 +28,9 @@ function setGraphUpdateResponse(response) {
 
 function unsubscribeToUpdates() {
   listeners.update_graph = undefined;
+  listeners.update_graph_delta = undefined;
+  listeners.append_graph_data = undefined;
+  listeners.clear_graphs = undefined;
 }
 
 function subscribeToFunctionUpdates(cb) {
@@ -32,6 +47,9 @@ function requestFunctionUpdate() {
 
 export {
   subscribeToGraphUpdates,
+  subscribeToGraphDeltas,
+  subscribeToGraphAppends,
+  subscribeToGraphClears,
   requestGraphUpdate,
   unsubscribeToUpdates,
   subscribeToFunctionUpdates,
@@ -1,17 +1,42 @@
 import openSocket from 'socket.io-client';
 
-const socket = openSocket('http://localhost:15555');
+// The Python server serves the built app itself, on whatever port it was started on.
+// Only the dev server (npm start) runs elsewhere and needs the default port.
+// Pages of the daemon pass on the token in their URL, which tells the daemon which of
+// its pages this connection is.
+const page = new URLSearchParams(window.location.search).get('page');
+const socket = openSocket(
+  process.env.NODE_ENV === 'development' ? 'http://localhost:15555' : window.location.origin,
+  page ? { query: { page } } : {},
+);
 
 function subscribeToGraphUpdates(cb) {
   socket.on('update_graph', (data) => cb(data));
 }
 
+function subscribeToGraphDeltas(cb) {
+  socket.on('update_graph_delta', (data) => cb(data));
+}
+
+function subscribeToGraphAppends(cb) {
+  socket.on('append_graph_data', (data) => cb(data));
+}
+
+// a reused page (daemon mode) drops the figures of its previous session
+function subscribeToGraphClears(cb) {
+  socket.on('clear_graphs', () => cb());
+}
+
+// params.figure is the id of the figure to update
 function requestGraphUpdate(params) {
   socket.emit('get_graph_update', params);
 }
 
 function unsubscribeToUpdates() {
   socket.off('update_graph');
+  socket.off('update_graph_delta');
+  socket.off('append_graph_data');
+  socket.off('clear_graphs');
 }
 
 function subscribeToFunctionUpdates(cb) {
@@ -26,20 +51,25 @@ function setImageDataHandler(cb) {
   socket.on('request_image_data', cb);
 }
 
-function sendImageData(imageData) {
-  socket.emit('send_image_data', imageData);
+// imageData is a PNG data URL, or null if there is no chart for figureId
+function sendImageData(figureId, requestId, imageData) {
+  socket.emit('send_image_data', { figure: figureId, id: requestId, data: imageData });
 }
 
 function unsubscribeImageDataHandler() {
   socket.off('request_image_data');
 }
 
-function fireGraphUpdated() {
-  socket.emit('graph_updated');
+// render is the id of the update drawn, if the server gave it one
+function fireGraphUpdated(figureId, render) {
+  socket.emit('graph_updated', { figure: figureId, render });
 }
 
 export {
   subscribeToGraphUpdates,
+  subscribeToGraphDeltas,
+  subscribeToGraphAppends,
+  subscribeToGraphClears,
   requestGraphUpdate,
   unsubscribeToUpdates,
   subscribeToFunctionUpdates,
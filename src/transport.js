@@ -0,0 +1,59 @@
+const TYPED_ARRAYS = {
+  float32: Float32Array,
+  float64: Float64Array,
+};
+
+// Datasets sent in binary mode carry their coordinates as raw buffers in `columns`
+// instead of a list of points. Chart.js wants point objects, so rebuild them here
+// straight from the typed arrays.
+function decodeDataset(dataset) {
+  const { columns, ...rest } = dataset;
+  if (!columns) {
+    return dataset;
+  }
+  const ArrayType = TYPED_ARRAYS[columns.dtype];
+  const xs = new ArrayType(columns.x, 0, columns.length);
+  const ys = new ArrayType(columns.y, 0, columns.length);
+  const { labels } = columns;
+  const data = new Array(columns.length);
+  for (let i = 0; i < columns.length; i += 1) {
+    data[i] = labels ? { x: xs[i], y: ys[i], label: labels[i] } : { x: xs[i], y: ys[i] };
+  }
+  return { ...rest, data };
+}
+
+function decodeData(data) {
+  return { ...data, datasets: data.datasets.map(decodeDataset) };
+}
+
+// Apply an update_graph_delta message to the current data. Only changed datasets are
+// in the message (keyed by index); the others keep their objects, so the chart can
+// tell they didn't change without comparing points.
+function mergeDelta(data, delta) {
+  const datasets = data.datasets.slice(0, delta.count);
+  Object.keys(delta.datasets).forEach((i) => {
+    datasets[Number(i)] = decodeDataset(delta.datasets[i]);
+  });
+  return { ...data, datasets };
+}
+
+// Apply the appends of an append_graph_data message in place: drop points from the
+// front, push the new ones on the end. The arrays are shared with the Chart.js
+// instance, so nothing proportional to the existing data is copied.
+function appendPoints(data, appends) {
+  Object.keys(appends).forEach((i) => {
+    const dataset = data.datasets[Number(i)];
+    const { drop, ...rest } = appends[i];
+    const points = decodeDataset(rest).data;
+    if (drop > 0) {
+      dataset.data.splice(0, drop);
+    }
+    for (let j = 0; j < points.length; j += 1) {
+      dataset.data.push(points[j]);
+    }
+  });
+}
+
+export {
+  decodeDataset, decodeData, mergeDelta, appendPoints,
+};
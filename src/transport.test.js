@@ -0,0 +1,59 @@
+/* eslint no-undef: 0 */
+import {
+  decodeDataset, decodeData, mergeDelta, appendPoints,
+} from './transport';
+
+test('Datasets without columns are passed through', () => {
+  const dataset = { label: 'a', data: [{ x: 1, y: 2 }] };
+  expect(decodeDataset(dataset)).toBe(dataset);
+});
+
+test('Float64 columns are rebuilt into points', () => {
+  const dataset = {
+    label: 'a',
+    data: [],
+    columns: {
+      dtype: 'float64',
+      length: 2,
+      x: new Float64Array([1, 2]).buffer,
+      y: new Float64Array([3, 4]).buffer,
+      labels: null,
+    },
+  };
+  const decoded = decodeDataset(dataset);
+  expect(decoded.data).toEqual([{ x: 1, y: 3 }, { x: 2, y: 4 }]);
+  expect(decoded.columns).toBeUndefined();
+});
+
+test('Float32 columns keep point labels', () => {
+  const data = {
+    datasets: [{
+      data: [],
+      columns: {
+        dtype: 'float32',
+        length: 1,
+        x: new Float32Array([0.5]).buffer,
+        y: new Float32Array([1.5]).buffer,
+        labels: ['p'],
+      },
+    }],
+  };
+  expect(decodeData(data).datasets[0].data).toEqual([{ x: 0.5, y: 1.5, label: 'p' }]);
+});
+
+test('Deltas replace changed datasets and keep the others', () => {
+  const unchanged = { label: 'a', data: [{ x: 1, y: 1 }] };
+  const data = { datasets: [unchanged, { label: 'b', data: [] }, { label: 'c', data: [] }] };
+  const merged = mergeDelta(data, { count: 2, datasets: { 1: { label: 'b2', data: [] } } });
+  expect(merged.datasets).toHaveLength(2);
+  expect(merged.datasets[0]).toBe(unchanged);
+  expect(merged.datasets[1].label).toBe('b2');
+});
+
+test('Appends drop old points and push new ones in place', () => {
+  const points = [{ x: 1, y: 1 }, { x: 2, y: 2 }];
+  const data = { datasets: [{ data: points }] };
+  appendPoints(data, { 0: { drop: 1, data: [{ x: 3, y: 3 }] } });
+  expect(data.datasets[0].data).toBe(points);
+  expect(points).toEqual([{ x: 2, y: 2 }, { x: 3, y: 3 }]);
+});
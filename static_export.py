@@ -0,0 +1,97 @@
+import html
+import os
+
+from .encoding import dumps_spec
+
+# Standalone HTML pages for figures: Chart.js, the datalabels plugin and the figure
+# spec are inlined, so the file can be opened anywhere without the server or network.
+# Writing one is just string building, no browser involved.
+
+NODE_MODULES = os.path.join(os.path.dirname(__file__), "node_modules")
+# UMD builds of what the app bundles, the plugin registers itself with the global Chart
+SCRIPTS = [
+  os.path.join("chart.js", "dist", "Chart.bundle.min.js"),
+  os.path.join("chartjs-plugin-datalabels", "dist", "chartjs-plugin-datalabels.min.js"),
+]
+
+# Turns the base64 columns back into typed arrays and points, like transport.js does
+# for socket.io messages, then draws the chart.
+RENDER_SCRIPT = """
+(function () {
+  var TYPED_ARRAYS = { float32: Float32Array, float64: Float64Array };
+  function toBuffer(encoded) {
+    var raw = atob(encoded.__bytes__);
+    var bytes = new Uint8Array(raw.length);
+    for (var i = 0; i < raw.length; i += 1) {
+      bytes[i] = raw.charCodeAt(i);
+    }
+    return bytes.buffer;
+  }
+  var spec = JSON.parse(document.getElementById('figure-spec').textContent);
+  spec.data.datasets.forEach(function (dataset) {
+    var columns = dataset.columns;
+    if (!columns) {
+      return;
+    }
+    delete dataset.columns;
+    var ArrayType = TYPED_ARRAYS[columns.dtype];
+    var xs = new ArrayType(toBuffer(columns.x), 0, columns.length);
+    var ys = new ArrayType(toBuffer(columns.y), 0, columns.length);
+    var data = new Array(columns.length);
+    for (var i = 0; i < columns.length; i += 1) {
+      data[i] = columns.labels ? { x: xs[i], y: ys[i], label: columns.labels[i] } : { x: xs[i], y: ys[i] };
+    }
+    dataset.data = data;
+  });
+  var canvas = document.getElementById('chart-' + spec.id).getElementsByTagName('canvas')[0];
+  new Chart(canvas.getContext('2d'), { type: 'scatter', data: spec.data, options: spec.options });
+})();
+"""
+
+_scripts = None
+
+# the library scripts, read once per process since reports tend to come in bulk
+def _library_scripts():
+  global _scripts
+  if _scripts is None:
+    contents = []
+    for script in SCRIPTS:
+      path = os.path.join(NODE_MODULES, script)
+      if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, run npm install first")
+      with open(path, encoding="utf-8") as f:
+        contents.append(f.read())
+    _scripts = contents
+  return _scripts
+
+def _inline_script(source):
+  # a literal </script> would end the element early
+  return "<script>" + source.replace("</script", "<\\/script") + "</script>"
+
+def figure_to_html(figure, precision="float64", title=None):
+  spec = figure._get_static_data(precision)
+  if title is None:
+    title = figure._title._get_data().get("text") or "Figure"
+  # "</" is valid JSON as "<\/" and can't close the element
+  spec_json = dumps_spec(spec).replace("</", "<\\/")
+  return "\n".join([
+    "<!DOCTYPE html>",
+    "<html lang=\"en\">",
+    "<head>",
+    "<meta charset=\"utf-8\" />",
+    f"<title>{html.escape(title)}</title>",
+    "<style>body { margin: 0; } .chart-container { position: relative; height: 100vh; width: 100%; }</style>",
+    "</head>",
+    "<body>",
+    f"<div class=\"chart-container\" id=\"chart-{html.escape(spec['id'])}\"><canvas></canvas></div>",
+    f"<script type=\"application/json\" id=\"figure-spec\">{spec_json}</script>",
+  ] + [_inline_script(source) for source in _library_scripts()] + [
+    _inline_script(RENDER_SCRIPT),
+    "</body>",
+    "</html>",
+  ])
+
+def write_html(figure, path, precision="float64", title=None):
+  page = figure_to_html(figure, precision, title)
+  with open(path, "w", encoding="utf-8") as f:
+    f.write(page)
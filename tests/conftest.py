@@ -0,0 +1,58 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# the repository itself is the package, import it by the name of its directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(ROOT))
+PACKAGE = os.path.basename(ROOT)
+
+# pkg("plot") is the package's plot module
+@pytest.fixture
+def pkg():
+  return lambda name: importlib.import_module(f"{PACKAGE}.{name}")
+
+# socket.io as pages see it, for a session without a server: the packets _FanOut writes
+# to engine.io and sio.emit calls, decoded into (sid, event, data) in the order they
+# were queued. on_message(sid, event, data) plays the page.
+class Wire(object):
+  def __init__(self, on_message=None):
+    self.messages = []
+    self.on_message = on_message
+    self.manager = self
+    self.eio = self
+    self._partial = {}
+
+  def eio_sid_from_sid(self, sid, namespace):
+    return sid
+
+  # engine.io: one packet at a time, binary attachments after the packet they belong to
+  async def send(self, sid, encoded):
+    from socketio import packet
+    pkt = self._partial.pop(sid, None)
+    if pkt is None:
+      pkt = packet.Packet(encoded_packet=encoded)
+      if pkt.attachment_count:
+        self._partial[sid] = pkt
+        return
+    elif not pkt.add_attachment(encoded):
+      self._partial[sid] = pkt
+      return
+    self._receive(sid, *pkt.data)
+
+  async def emit(self, event, data=None, to=None, room=None):
+    self._receive(to or room, event, data)
+
+  def _receive(self, sid, event, data):
+    self.messages.append((sid, event, data))
+    if self.on_message is not None:
+      self.on_message(sid, event, data)
+
+  def events(self, sid=None):
+    return [event for to, event, _ in self.messages if sid is None or to == sid]
+
+@pytest.fixture
+def wire():
+  return Wire
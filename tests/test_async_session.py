@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+import pytest
+
+# the page: acks every update once it's "drawn" a little later
+def _page(session, wire):
+  def on_message(sid, event, data):
+    if event in ("update_graph", "update_graph_delta", "append_graph_data"):
+      async def draw():
+        await asyncio.sleep(0.01)
+        await session._graph_updated(sid, {"figure": data["id"]})
+      asyncio.ensure_future(draw())
+  return wire(on_message)
+
+def test_raster_saves_run_together(pkg, tmp_path):
+  async def run():
+    async with pkg("async_session").AsyncChartSession(renderer="raster") as session:
+      figures = [session.get_figure(), session.new_figure()]
+      for i, figure in enumerate(figures):
+        figure.get_new_plot().plot([0, 1, 2], [i, 2 * i, i])
+      names = await asyncio.gather(
+        session.save(str(tmp_path / "all.png"), figures),
+        session.save(str(tmp_path / "first.png")))
+      with pytest.raises(RuntimeError):
+        await session.show()
+      return names
+
+  names = asyncio.run(run())
+  assert names == [[str(tmp_path / "all_0.png"), str(tmp_path / "all_1.png")],
+                   [str(tmp_path / "first.png")]]
+  assert all(os.path.getsize(name) > 0 for group in names for name in group)
+
+def test_only_async_with(pkg):
+  async_session = pkg("async_session")
+  with pytest.raises(ValueError):
+    async_session.AsyncChartSession(daemon=True)
+  session = async_session.AsyncChartSession(renderer="raster")
+  with pytest.raises(TypeError):
+    with session:
+      pass
+
+def test_updates_go_out_one_at_a_time(pkg, wire):
+  async def run():
+    session = pkg("async_session").AsyncChartSession()
+    try:
+      session.sio = _page(session, wire)
+      session._fanout = pkg("fanout")._FanOut(session.sio, session._metrics)
+      await session._fanout.add("page", [])
+      plot = session.get_figure().get_new_plot()
+      plot.scatter([0, 1], [0, 1])
+      await session.show()
+      shows = []
+      for i in range(3):
+        plot.scatter([0, 1], [i, i + 1])
+        shows.append(asyncio.ensure_future(session.show()))
+        await asyncio.sleep(0)
+      await asyncio.gather(*shows)
+      return session.sio.messages, session._fanout.stats()["page"]
+    finally:
+      session._thread_pool.shutdown(wait=False)
+
+  messages, stats = asyncio.run(run())
+  assert [event for _, event, _ in messages] == ["update_graph"] + ["update_graph_delta"] * 3
+  # each delta is taken once the previous one was drawn: the second carries the
+  # latest data and leaves nothing for the third, and no page skips a frame
+  deltas = [data["datasets"] for _, _, data in messages[1:]]
+  assert deltas[0]["0"]["data"][0]["y"] == 0.0
+  assert deltas[1]["0"]["data"][0]["y"] == 2.0 and deltas[2] == {}
+  assert stats["frames_acked"] == 4 and stats["frames_skipped"] == 0
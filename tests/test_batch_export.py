@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+# a pool page: draws what it's sent, answer(page, sid, data) acks it, and records the
+# figures it holds and the renders acked so far when a canvas is looked up
+class _Page(object):
+  def __init__(self, renderer, answer):
+    self.renderer = renderer
+    self.answer = answer
+    self.figures = []
+    self.shots = []
+    self.acks = []
+
+  def on_message(self, sid, event, data):
+    if event == "clear_graphs":
+      self.figures = []
+    elif event == "update_graph":
+      if data["id"] not in self.figures:
+        self.figures.append(data["id"])
+      self.answer(self, sid, data)
+
+  async def ack(self, sid, data, delay=0):
+    await asyncio.sleep(delay)
+    self.acks.append(data["render"])
+    await self.renderer._graph_updated(sid, {"figure": data["id"], "render": data["render"]})
+
+  async def querySelector(self, selector):
+    self.shots.append((selector, list(self.figures), list(self.acks)))
+    return self
+
+  async def screenshot(self, params):
+    pass
+
+def _ack_now(page, sid, data):
+  asyncio.ensure_future(page.ack(sid, data))
+
+def _renderer(pkg, wire, answer=_ack_now):
+  renderer = pkg("batch_export")._BatchRenderer(1, 400, 300, 1)
+  page = _Page(renderer, answer)
+  renderer.sio = wire(page.on_message)
+  return renderer, page
+
+def test_each_figure_is_shot_alone(pkg, wire):
+  plot = pkg("plot")
+  figures = [plot.new_figure() for _ in range(3)]
+  figures[1].id_, figures[2].id_ = "1", "2"
+  for figure in figures:
+    figure.get_new_plot().scatter([0, 1], [0, 1])
+
+  async def run():
+    renderer, page = _renderer(pkg, wire)
+    for i, figure in enumerate(figures + figures[:1]):
+      await renderer.render(page, "p", figure, f"{i}.png")
+    return page.shots
+  shots = [(selector, figures) for selector, figures, _ in asyncio.run(run())]
+  assert shots == [("#chart-0 canvas", ["0"]), ("#chart-1 canvas", ["1"]),
+                   ("#chart-2 canvas", ["2"]), ("#chart-0 canvas", ["0"])]
+
+def test_late_ack_is_not_taken_for_the_next_render(pkg, wire, monkeypatch):
+  monkeypatch.setattr(pkg("batch_export"), "RENDER_TIMEOUT", 0.2)
+  figure = pkg("plot").new_figure()
+  figure.get_new_plot().scatter([0, 1], [0, 1])
+  sent = []
+  # the first render is acked only once the next one has been sent, the next one a bit later
+  def answer(page, sid, data):
+    sent.append(data)
+    if len(sent) == 2:
+      asyncio.ensure_future(page.ack(sid, sent[0]))
+      asyncio.ensure_future(page.ack(sid, sent[1], delay=0.05))
+
+  async def run():
+    renderer, page = _renderer(pkg, wire, answer)
+    with pytest.raises(asyncio.TimeoutError):
+      await renderer.render(page, "p", figure, "0.png")
+    await renderer.render(page, "p", figure, "1.png")
+    return page.shots
+  shots = asyncio.run(run())
+  assert shots == [("#chart-0 canvas", ["0"], [sent[0]["render"], sent[1]["render"]])]
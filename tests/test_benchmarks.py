@@ -0,0 +1,33 @@
+import asyncio
+import json
+
+# the suites on the smallest sizes, for their output rather than their timings
+def test_suites_report_per_size(pkg):
+  benchmarks = pkg("benchmarks")
+  ingestion = benchmarks.bench_ingestion([1000, 2000], 1)
+  assert [r["points"] for r in ingestion] == [1000, 2000]
+  assert all(0 <= r["min_s"] <= r["median_s"] for r in ingestion)
+  serialization = {r["precision"]: r for r in benchmarks.bench_serialization([1000], 1)}
+  assert sorted(serialization) == ["float32", "float64", "json"]
+  assert serialization["float32"]["bytes"] < serialization["float64"]["bytes"] < serialization["json"]["bytes"]
+  zoom = benchmarks.bench_zoom([1000, benchmarks.LOD_MIN_POINTS], 2)
+  assert [r["points"] for r in zoom] == [benchmarks.LOD_MIN_POINTS]
+  assert 0 < zoom[0]["sent_points"] < benchmarks.LOD_MIN_POINTS / 10
+
+def test_sampling_warm_runs_dont_evaluate(pkg):
+  sampling = pkg("benchmarks").bench_sampling(1)
+  assert [r["function"] for r in sampling] == list(pkg("benchmarks").FUNCTIONS)
+  assert all(r["evaluations"] >= r["samples"] > 0 and r["warm_evaluations"] == 0 for r in sampling)
+
+def test_roundtrip_through_the_server(pkg):
+  loop = asyncio.new_event_loop()
+  try:
+    results = loop.run_until_complete(pkg("benchmarks").bench_roundtrip([1000], 1))
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+      task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+  finally:
+    loop.close()
+  assert {(r["precision"], r["message"]) for r in results} >= {("json", "full"), ("json", "delta")}
+  json.dumps(results)
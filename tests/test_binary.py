@@ -0,0 +1,37 @@
+import numpy as np
+
+import pytest
+
+def _columns(data):
+  columns = data["columns"]
+  dtype = {"float32": "<f4", "float64": "<f8"}[columns["dtype"]]
+  return np.frombuffer(columns["x"], dtype), np.frombuffer(columns["y"], dtype)
+
+def test_binary_columns_carry_the_data(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  x, y = np.linspace(0, 1, 101), np.sin(np.linspace(0, 1, 101))
+  plot.plot(x, y, precision="float64")
+  data = plot._get_data()
+  assert data["data"] == [] and data["columns"]["length"] == 101
+  xs, ys = _columns(data)
+  assert np.array_equal(xs, x) and np.array_equal(ys, y)
+  plot.set_precision("float32")
+  xs, ys = _columns(plot._get_data())
+  assert xs.dtype == np.float32 and np.allclose(ys, y, atol=1e-7)
+
+def test_back_to_json_points(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  plot.scatter([1, 2], [3, 4], precision="float32")
+  plot.set_precision(None)
+  data = plot._get_data()
+  assert "columns" not in data and data["data"] == [{"x": 1.0, "y": 3.0}, {"x": 2.0, "y": 4.0}]
+
+def test_unknown_precision_is_refused(pkg):
+  with pytest.raises(ValueError):
+    pkg("plot").new_figure().get_new_plot().scatter([1], [2], precision="float16")
+
+def test_binary_columns_are_socketio_attachments(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  plot.scatter(np.arange(1000.0), np.arange(1000.0), precision="float32")
+  packets = pkg("fanout").encode_event("update_graph", plot.fig._get_data())
+  assert [len(p) for p in packets[1:]] == [4000, 4000]
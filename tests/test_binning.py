@@ -0,0 +1,66 @@
+import numpy as np
+
+def _samples(n=50000, seed=0):
+  rng = np.random.default_rng(seed)
+  return rng.normal(size=n), rng.normal(size=n) * 2 + 1
+
+def test_histogram_matches_numpy(pkg, monkeypatch):
+  binning = pkg("binning")
+  # several chunks
+  monkeypatch.setattr(binning, "CHUNK_SIZE", 4096)
+  x, _ = _samples()
+  x[:3] = [np.nan, np.inf, -np.inf]
+  for edges in [np.linspace(-2, 2, 33), np.array([-3, -1, 0, 0.1, 0.5, 4.0])]:
+    expected, _ = np.histogram(x[3:], edges)
+    assert np.array_equal(binning.histogram(x, edges), expected)
+    assert np.array_equal(binning.histogram_sorted(np.sort(x[3:]), edges), expected)
+  # the last bin includes its right edge
+  assert binning.histogram(np.array([0.0, 1.0, 2.0]), np.array([0.0, 1.0, 2.0])).tolist() == [1, 2]
+
+def test_histogram2d_matches_numpy(pkg, monkeypatch):
+  binning = pkg("binning")
+  monkeypatch.setattr(binning, "CHUNK_SIZE", 4096)
+  x, y = _samples()
+  xedges, yedges = np.linspace(-2, 2, 21), np.array([-5, -1, 0, 2, 3, 7.0])
+  expected, _, _ = np.histogram2d(x, y, [xedges, yedges])
+  assert np.array_equal(binning.histogram2d(x, y, xedges, yedges), expected)
+
+def test_hexbin_counts_every_sample_once(pkg):
+  binning = pkg("binning")
+  x, y = _samples(20000)
+  extent = (-1.0, 1.0, -1.0, 3.0)
+  inside = (x >= -1) & (x <= 1) & (y >= -1) & (y <= 3)
+  cx, cy, counts, _ = binning.hexbin(x, y, extent, 12)
+  assert counts.sum() == inside.sum() and (counts > 0).all()
+  assert cx.min() >= -1 and cx.max() <= 1 and cy.min() >= -1 and cy.max() <= 3
+
+def test_hist_plot_is_the_step_line_of_the_counts(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  x, _ = _samples()
+  plot.hist(x, bins=20)
+  counts, edges = np.histogram(x, 20)
+  assert np.allclose(plot._xdata, np.r_[edges[0], edges[:-1], edges[-1], edges[-1]])
+  assert np.array_equal(plot._ydata, np.r_[0, counts, counts[-1], 0])
+  assert plot.get_yaxis().ax_max > counts.max()
+
+def test_hist_rebins_the_visible_range(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  x, _ = _samples()
+  plot.hist(x, bins=20)
+  plot.get_xaxis().set_lims(0, 1)
+  assert plot._rebin()
+  counts, _ = np.histogram(x, 20, range=(0, 1))
+  assert np.array_equal(plot._ydata[1:-2], counts)
+  # same view, nothing to do
+  assert not plot._rebin()
+
+def test_hist2d_cells_hold_the_counts(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  x, y = _samples()
+  plot.hist2d(x, y, bins=(10, 8), range=((-2, 2), (-3, 5)))
+  expected, xedges, yedges = np.histogram2d(x, y, (10, 8), range=((-2, 2), (-3, 5)))
+  assert plot._xdata.shape[0] == np.count_nonzero(expected)
+  ix = np.searchsorted(xedges, plot._xdata) - 1
+  iy = np.searchsorted(yedges, plot._ydata) - 1
+  assert (expected[ix, iy] > 0).all()
+  assert len(plot._per_point["pointBackgroundColor"]) == plot._xdata.shape[0]
@@ -0,0 +1,33 @@
+import numpy as np
+
+def _plot(pkg):
+  return pkg("plot").new_figure().get_new_plot()
+
+def test_float64_data_is_kept_without_copying(pkg):
+  plot = _plot(pkg)
+  x, y = np.arange(5.0), np.arange(5.0) ** 2
+  plot.scatter(x, y)
+  assert np.shares_memory(plot._xdata, x) and np.shares_memory(plot._ydata, y)
+  plot.scatter([0, 1, 2], np.arange(3, dtype=np.int32))
+  assert plot._xdata.dtype == np.float64 and plot._ydata.dtype == np.float64
+
+def test_extents_skip_non_finite_values(pkg):
+  plot = _plot(pkg)
+  plot.scatter([0, 1, np.inf, 3], [np.nan, -2, 5, 4])
+  assert plot._xlims == (0, 3) and plot._ylims == (-2, 5)
+  xax = plot.get_xaxis()
+  assert np.isfinite([xax.ax_min, xax.ax_max]).all() and xax.ax_min < 0 and xax.ax_max > 3
+  # gaps for Chart.js
+  assert plot._get_data()["data"][0] == {"x": 0.0, "y": None}
+  assert plot._get_data()["data"][2] == {"x": None, "y": 5.0}
+
+def test_data_without_spread_or_finite_values(pkg):
+  plot = _plot(pkg)
+  plot.scatter([2, 2], [7, 7])
+  yax = plot.get_yaxis()
+  assert yax.ax_min < 7 < yax.ax_max
+  other = plot.fig.get_new_plot()
+  other.scatter([np.nan], [np.nan])
+  assert other._xlims == (None, None)
+  # the empty dataset doesn't move the limits
+  assert (yax.ax_min, yax.ax_max) == (plot.get_yaxis().ax_min, plot.get_yaxis().ax_max)
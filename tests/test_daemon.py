@@ -0,0 +1,99 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+@pytest.fixture
+def daemon(pkg, tmp_path, monkeypatch):
+  monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+  return pkg("daemon")
+
+def test_state_is_private(daemon):
+  daemon._write_state({"pid": 1, "port": 2, "token": "t"})
+  assert stat.S_IMODE(os.stat(daemon.state_dir()).st_mode) == 0o700
+  assert stat.S_IMODE(os.stat(daemon.state_file()).st_mode) == 0o600
+  assert daemon._read_state()["token"] == "t"
+  # a file left behind by a daemon that died is replaced
+  daemon._write_state({"pid": 1, "port": 3, "token": "u"})
+  assert daemon._read_state()["port"] == 3
+
+def test_readable_state_is_ignored(daemon):
+  daemon._write_state({"pid": 1, "port": 2, "token": "t"})
+  os.chmod(daemon.state_file(), 0o644)
+  with pytest.raises(ValueError):
+    daemon._read_state()
+  assert daemon._DaemonClient.find() is None
+
+def test_symlinked_state_is_ignored(daemon, tmp_path):
+  target = tmp_path / "elsewhere.json"
+  target.write_text('{"pid": 1, "port": 2, "token": "t"}')
+  os.chmod(target, 0o600)
+  os.symlink(target, daemon.state_file())
+  with pytest.raises(OSError):
+    daemon._read_state()
+  # writing doesn't go through the link either
+  daemon._write_state({"pid": 1, "port": 3, "token": "u"})
+  assert target.read_text() == '{"pid": 1, "port": 2, "token": "t"}'
+
+def test_shared_state_dir_is_refused(daemon, tmp_path):
+  os.makedirs(tmp_path / "chartjs-python", mode=0o777)
+  os.chmod(tmp_path / "chartjs-python", 0o777)
+  with pytest.raises(RuntimeError):
+    daemon.state_dir()
+
+class _Request(object):
+  def __init__(self, session=None, body="{}"):
+    self.match_info = {"session": session}
+    self._body = body
+
+  async def text(self):
+    return self._body
+
+# a daemon with one page of a session, without browser or server. Its page acks
+# every update_graph, as the page does once it's drawn.
+def _paired(daemon, wire):
+  chart_daemon = daemon._ChartDaemon()
+  def on_message(sid, event, data):
+    if event == "update_graph":
+      asyncio.ensure_future(chart_daemon._graph_updated(sid, {"figure": data["id"]}))
+  chart_daemon.sio = wire(on_message)
+  page = daemon._DaemonPage(None)
+  chart_daemon._pages[page.token] = page
+  chart_daemon._sessions["s"] = page
+  return chart_daemon, page
+
+def _environ(token):
+  return {"QUERY_STRING": f"EIO=3&transport=websocket&page={token}"}
+
+def test_stray_clients_are_refused(daemon, wire):
+  from socketio.exceptions import ConnectionRefusedError
+  async def run():
+    chart_daemon, page = _paired(daemon, wire)
+    for environ in [{"QUERY_STRING": "EIO=3"}, _environ("other")]:
+      with pytest.raises(ConnectionRefusedError):
+        await chart_daemon._record_connection("stray", environ)
+    assert page.sid is None
+    await chart_daemon._record_connection("mine", _environ(page.token))
+    return page.sid
+
+  assert asyncio.run(run()) == "mine"
+
+def test_show_follows_a_reconnected_page(daemon, wire):
+  async def run():
+    chart_daemon, page = _paired(daemon, wire)
+    await chart_daemon._record_connection("first", _environ(page.token))
+    assert (await chart_daemon._show(_Request("s", '{"id": 0}'))).status == 200
+    await chart_daemon._remove_connection("first")
+    # the page comes back while the next show waits for it
+    show = asyncio.ensure_future(chart_daemon._show(_Request("s", '{"id": 0}')))
+    await asyncio.sleep(0.05)
+    await chart_daemon._record_connection("second", _environ(page.token))
+    assert (await show).status == 200
+    # a late disconnect of the old connection doesn't unpair it
+    await chart_daemon._remove_connection("first")
+    assert (await chart_daemon._show(_Request("s", '{"id": 0}'))).status == 200
+    return chart_daemon.sio.messages
+
+  messages = asyncio.run(run())
+  assert [sid for sid, _, _ in messages] == ["first", "second", "second"]
@@ -0,0 +1,80 @@
+import numpy as np
+
+import pytest
+
+def _data(n=20000, seed=0):
+  rng = np.random.default_rng(seed)
+  x = np.sort(rng.uniform(0, 100, n))
+  return x, np.cumsum(rng.normal(size=n))
+
+def _read(source):
+  return [np.concatenate(c) for c in zip(*source.chunks())]
+
+def test_npy_columns_and_files(pkg, tmp_path):
+  datasource = pkg("datasource")
+  x, y = _data(1000)
+  np.save(tmp_path / "xy.npy", np.c_[y, x])
+  source = datasource.NpySource(str(tmp_path / "xy.npy"), columns=(1, 0), chunk_rows=300)
+  assert [c[0].shape[0] for c in source.chunks()] == [300, 300, 300, 100]
+  xs, ys = _read(source)
+  assert np.array_equal(xs, x) and np.array_equal(ys, y)
+  np.save(tmp_path / "x.npy", x.astype(np.float32))
+  np.save(tmp_path / "y.npy", y)
+  xs, ys = _read(datasource.NpySource(str(tmp_path / "x.npy"), y_path=str(tmp_path / "y.npy")))
+  assert xs.dtype == np.float64 and np.array_equal(xs, x.astype(np.float32))
+  np.save(tmp_path / "short.npy", y[:10])
+  with pytest.raises(ValueError):
+    datasource.NpySource(str(tmp_path / "x.npy"), y_path=str(tmp_path / "short.npy"))
+
+def test_raw_rows(pkg, tmp_path):
+  x, y = _data(1000)
+  rows = np.c_[x, y, -y].astype("<f4")
+  (tmp_path / "rows.bin").write_bytes(b"head" + rows.tobytes())
+  source = pkg("datasource").RawSource(str(tmp_path / "rows.bin"), dtype="<f4", row_width=3,
+                                       columns=(0, 2), offset=4, chunk_rows=128)
+  xs, ys = _read(source)
+  assert np.array_equal(xs, rows[:, 0]) and np.array_equal(ys, rows[:, 2])
+
+def test_csv_by_name_with_missing_values(pkg, tmp_path):
+  (tmp_path / "d.csv").write_text('"t",value,other\n0,1.5,x\n1,,y\n\n2,-3,z\n3,4,w\n')
+  source = pkg("datasource").CsvSource(str(tmp_path / "d.csv"), columns=("t", "value"),
+                                       chunk_rows=2)
+  xs, ys = _read(source)
+  assert xs.tolist() == [0, 1, 2, 3]
+  assert np.isnan(ys[1]) and ys[[0, 2, 3]].tolist() == [1.5, -3, 4]
+  assert source.extents() == [(0.0, 3.0), (-3.0, 4.0)]
+  with pytest.raises(ValueError):
+    pkg("datasource").CsvSource(str(tmp_path / "d.csv"), columns=("t", "missing"))
+
+def test_streaming_decimation_doesnt_depend_on_chunks(pkg, tmp_path):
+  datasource = pkg("datasource")
+  x, y = _data()
+  y[5] = np.nan
+  np.save(tmp_path / "xy.npy", np.c_[x, y])
+  whole = datasource.NpySource(str(tmp_path / "xy.npy"))
+  chunked = datasource.NpySource(str(tmp_path / "xy.npy"), chunk_rows=999)
+  for mode in ("minmax", "lttb", "density"):
+    a = datasource.stream_decimate(whole, mode, 200, 100)
+    b = datasource.stream_decimate(chunked, mode, 200, 100)
+    assert np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+  xs, ys = datasource.stream_minmax(chunked, 200)
+  finite = np.isfinite(y)
+  assert ys.min() == y[finite].min() and ys.max() == y[finite].max()
+  assert np.all(np.diff(xs) >= 0)
+
+def test_plots_from_sources(pkg, tmp_path):
+  x, y = _data()
+  np.save(tmp_path / "xy.npy", np.c_[x, y])
+  source = pkg("datasource").NpySource(str(tmp_path / "xy.npy"), chunk_rows=4096)
+  figure = pkg("plot").new_figure()
+  figure._set_viewport(400, 300)
+  line = figure.get_new_plot()
+  line.plot(source)
+  assert line._xlims == (x.min(), x.max())
+  assert 0 < len(figure._get_data()["data"]["datasets"][0]["data"]) <= 2 * 400
+  hist = figure.get_new_plot()
+  hist.hist(pkg("datasource").NpySource(str(tmp_path / "xy.npy"), columns=(1,)), bins=16)
+  counts, _ = np.histogram(y, 16)
+  assert np.array_equal(hist._ydata[1:-2], counts)
+  with pytest.raises(ValueError):
+    figure.get_new_plot().plot(source, y)
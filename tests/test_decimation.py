@@ -0,0 +1,60 @@
+import numpy as np
+
+def _line(n=20000, seed=0):
+  rng = np.random.default_rng(seed)
+  x = np.sort(rng.uniform(0, 100, n))
+  y = np.cumsum(rng.normal(size=n))
+  return x, y
+
+def test_lttb_keeps_ends_and_size(pkg):
+  x, y = _line()
+  idx = pkg("decimation").lttb(x, y, 500)
+  assert idx.shape[0] == 500
+  assert idx[0] == 0 and idx[-1] == x.shape[0] - 1
+  assert np.all(np.diff(idx) > 0)
+
+def test_minmax_keeps_ends_and_extrema(pkg):
+  decimation = pkg("decimation")
+  x, y = _line()
+  idx = decimation.minmax(x, y, 300)
+  assert idx[0] == 0 and idx[-1] == x.shape[0] - 1
+  assert np.argmin(y) in idx and np.argmax(y) in idx
+  # the envelope of every pixel column is kept
+  bucket = np.minimum(((x - x.min()) * (300 / (x.max() - x.min()))).astype(np.int64), 299)
+  for b in np.unique(bucket):
+    column = bucket == b
+    kept = idx[bucket[idx] == b]
+    assert y[kept].min() == y[column].min() and y[kept].max() == y[column].max()
+
+def test_density_keeps_outliers(pkg):
+  rng = np.random.default_rng(1)
+  x = np.r_[rng.normal(size=100000), 50.0]
+  y = np.r_[rng.normal(size=100000), -50.0]
+  idx = pkg("decimation").density(x, y, 200, 100)
+  assert idx.shape[0] <= 200 * 100
+  assert x.shape[0] - 1 in idx
+
+def test_decimate_skips_non_finite(pkg):
+  x, y = _line(5000)
+  y[10] = np.nan
+  x[20] = np.inf
+  idx = pkg("decimation").decimate(x, y, "minmax", 100, 100)
+  assert 10 not in idx and 20 not in idx
+  assert np.isfinite(y[idx]).all() and np.isfinite(x[idx]).all()
+
+def test_decimated_plot_sends_budget(pkg):
+  figure = pkg("plot").new_figure()
+  figure._set_viewport(400, 300)
+  plot = figure.get_new_plot()
+  x, y = _line()
+  plot.plot(x, y, decimate="lttb")
+  assert len(figure._get_data()["data"]["datasets"][0]["data"]) == 400
+
+def test_scatter_takes_numpy_scalar_styles(pkg):
+  plot = pkg("plot").new_figure().get_new_plot()
+  plot.scatter([0, 1], [0, 1], size=np.int64(3), color="red")
+  assert plot._dataset["pointRadius"] == 3 and type(plot._dataset["pointRadius"]) is int
+  plot.scatter([0, 1], [0, 1], size=np.float32(2.5))
+  assert plot._dataset["pointRadius"] == 2.5
+  plot.scatter([0, 1], [0, 1], size=np.array([1, 2]))
+  assert plot._get_data()["pointRadius"] == [1, 2]
@@ -0,0 +1,39 @@
+def _figure(pkg, n=3):
+  figure = pkg("plot").new_figure()
+  plots = [figure.get_new_plot() for _ in range(n)]
+  for i, plot in enumerate(plots):
+    plot.scatter([0, 1, 2], [i, i + 1, i + 2])
+  return figure, plots
+
+def test_delta_resends_only_touched_datasets(pkg):
+  figure, plots = _figure(pkg)
+  assert len(figure._get_data()["data"]["datasets"]) == 3
+  delta = figure._get_delta()
+  assert delta["datasets"] == {} and delta["options"] is None
+  plots[1].scatter([5, 6], [7, 8])
+  plots[2].set_label("two")
+  delta = figure._get_delta()
+  assert sorted(delta["datasets"]) == [1, 2]
+  assert delta["datasets"][1]["data"] == [{"x": 5.0, "y": 7.0}, {"x": 6.0, "y": 8.0}]
+  assert delta["count"] == 3
+  assert figure._get_delta()["datasets"] == {}
+
+def test_delta_sends_new_plots_and_options(pkg):
+  figure, plots = _figure(pkg, 1)
+  figure._get_data()
+  figure.get_new_plot().scatter([1], [1])
+  figure.set_title("new", display=True)
+  delta = figure._get_delta()
+  assert list(delta["datasets"]) == [1] and delta["count"] == 2
+  assert delta["options"]["title"]["text"] == "new"
+
+def test_set_axis_returns_the_new_axis(pkg):
+  figure, (plot,) = _figure(pkg, 1)
+  figure._get_data()
+  xax = plot.set_xaxis()
+  assert plot.get_xaxis() is xax
+  yax = plot.set_yaxis()
+  assert plot.get_yaxis() is yax
+  delta = figure._get_delta()
+  assert delta["datasets"][0]["xAxisID"] == xax.get_id()
+  assert delta["datasets"][0]["yAxisID"] == yax.get_id()
@@ -0,0 +1,60 @@
+import numpy as np
+
+PARAMS = {"xmin": 0, "xmax": 8, "parameters": {"a": 2}}
+
+def _interactive(pkg):
+  figure = pkg("plot").new_figure()
+  figure._set_viewport(400, 300)
+  ipl = figure.add_interactive_plot()
+  ipl.set_function("def f(x, a):\n  return np.sin(a * x)\n")
+  return ipl
+
+# points of f evaluated by get_result, cache misses only
+def _evaluations(pkg, ipl, params):
+  metrics = pkg("metrics")._Metrics()
+  ipl.get_result(params, metrics=metrics)
+  return metrics.snapshot()["histograms"]["f_evaluations"]["sum"]
+
+def test_same_view_again_doesnt_evaluate(pkg):
+  ipl = _interactive(pkg)
+  assert _evaluations(pkg, ipl, PARAMS) > 0
+  assert _evaluations(pkg, ipl, PARAMS) == 0
+
+def test_zoom_and_pan_reuse_samples(pkg):
+  ipl = _interactive(pkg)
+  first = _evaluations(pkg, ipl, PARAMS)
+  # zooming in by 2 refines the same lattice, panning by a lattice step lands on it
+  zoomed = _evaluations(pkg, ipl, dict(PARAMS, xmin=2, xmax=6))
+  xs, _ = ipl.get_result(dict(PARAMS, xmin=2, xmax=6))
+  assert zoomed < xs.shape[0] / 2
+  assert _evaluations(pkg, ipl, dict(PARAMS, xmin=1, xmax=9)) < first / 2
+
+def test_cached_samples_are_the_values_of_f(pkg):
+  ipl = _interactive(pkg)
+  ipl.get_result(PARAMS)
+  xs, ys = ipl.get_result(dict(PARAMS, xmin=2, xmax=6))
+  assert np.array_equal(ys, np.sin(2 * xs))
+
+def test_parameters_and_code_are_part_of_the_key(pkg):
+  ipl = _interactive(pkg)
+  ipl.get_result(PARAMS)
+  other = dict(PARAMS, parameters={"a": 3})
+  assert _evaluations(pkg, ipl, other) > 0
+  xs, ys = ipl.get_result(other)
+  assert np.array_equal(ys, np.sin(3 * xs))
+  ipl.set_function("def f(x, a):\n  return a * x\n")
+  assert len(ipl._eval_cache) == 0
+  xs, ys = ipl.get_result(PARAMS)
+  assert np.array_equal(ys, 2 * xs)
+
+def test_least_recently_used_entries_are_evicted(pkg):
+  cache = pkg("sampling")._EvaluationCache(max_points=250)
+  xs = np.arange(100.0)
+  for key in "abc":
+    cache.put(key, xs, xs)
+  assert len(cache) == 200
+  assert not cache.get("a", xs)[0].any()
+  # b was used last, so c goes next
+  assert cache.get("b", xs)[0].all()
+  cache.put("d", xs, xs)
+  assert cache.get("b", xs)[0].all() and not cache.get("c", xs)[0].any()
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+PARAMS = {"xmin": 0, "xmax": 1, "parameters": {"a": 2}}
+
+def _session(pkg, executor, code):
+  session = pkg("chart_session").ChartSession(executor=executor, workers=1, eval_timeout=1)
+  figure = session.get_figure()
+  figure._set_viewport(400, 300)
+  ipl = figure.add_interactive_plot()
+  ipl.set_function(code)
+  return session, ipl
+
+def _compute(session, ipl):
+  return asyncio.run(session._compute_plot(ipl, PARAMS, threading.Event()))
+
+def test_process_worker_stuck_in_f_is_replaced(pkg):
+  session, ipl = _session(pkg, "process", "def f(x, a):\n  while True: pass\n")
+  try:
+    assert "longer than" in "".join(_compute(session, ipl)["error"])
+    ipl.set_function("def f(x, a):\n  return a * x\n")
+    # the only worker was stuck, this gets a new one
+    assert _compute(session, ipl)["error"] is None
+    assert ipl._ylims[1] == 2
+    assert session.get_metrics()["workers"]["killed"] == 1
+  finally:
+    session._process_pool.shutdown()
+
+def test_thread_stuck_in_f_is_written_off(pkg):
+  session, ipl = _session(pkg, "thread", "import time\ndef f(x, a):\n  time.sleep(3)\n  return x\n")
+  assert "longer than" in "".join(_compute(session, ipl)["error"])
+  ipl.set_function("def f(x, a):\n  return a * x\n")
+  start = time.perf_counter()
+  assert _compute(session, ipl)["error"] is None
+  # didn't wait for the sleeping thread
+  assert time.perf_counter() - start < 1
+  assert session.get_metrics()["counters"]["workers_lost"] == 1
+
+SLOW = "import time\ndef f(x, a):\n  time.sleep(0.2)\n  return a * x\n"
+
+def test_cancel_event_is_not_an_error(pkg):
+  session, ipl = _session(pkg, "thread", SLOW)
+  async def run():
+    cancel = threading.Event()
+    task = asyncio.ensure_future(session._compute_plot(ipl, PARAMS, cancel))
+    await asyncio.sleep(0.05)
+    cancel.set()
+    return await task
+  assert asyncio.run(run()) == {"error": None}
+  assert session.get_metrics()["counters"]["evals_cancelled"] == 1
+
+def test_cancelling_the_task_propagates(pkg):
+  session, ipl = _session(pkg, "thread", SLOW)
+  cancel = threading.Event()
+  async def run():
+    task = asyncio.ensure_future(session._compute_plot(ipl, PARAMS, cancel))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await task
+  with pytest.raises(asyncio.CancelledError):
+    asyncio.run(run())
+  # f is told to stop as well
+  assert cancel.is_set()
+  assert "evals_cancelled" not in session.get_metrics()["counters"]
@@ -0,0 +1,141 @@
+import asyncio
+
+import numpy as np
+
+# what a page holds for each dataset after the updates it got, like src/transport.js
+def _decode(dataset):
+  columns = dataset.get("columns")
+  if columns is None:
+    return [(p["x"], p["y"]) for p in dataset["data"]]
+  xs = np.frombuffer(columns["x"], dtype=columns["dtype"])[:columns["length"]]
+  ys = np.frombuffer(columns["y"], dtype=columns["dtype"])[:columns["length"]]
+  return list(zip(xs.tolist(), ys.tolist()))
+
+def _draw(page, event, data):
+  if event == "update_graph":
+    page.clear()
+    page.update(enumerate(_decode(d) for d in data["data"]["datasets"]))
+    return
+  for i, dataset in data["datasets"].items():
+    page[int(i)] = _decode(dataset)
+  for i, append in data.get("appends", {}).items():
+    del page[int(i)][:append["drop"]]
+    page[int(i)] += _decode(append)
+
+# a session whose page "a" draws and acks every frame straight away, other pages only
+# draw, and ack when the test says so
+class _Pages(object):
+  def __init__(self, pkg, wire):
+    self.session = pkg("chart_session").ChartSession()
+    self.pages = {}
+    self.unacked = {}
+    self.session.sio = wire(self._on_message)
+    self.session._fanout = pkg("fanout")._FanOut(self.session.sio, self.session._metrics)
+
+  def _on_message(self, sid, event, data):
+    _draw(self.pages.setdefault(sid, {}), event, data)
+    if sid == "a":
+      asyncio.ensure_future(self.session._graph_updated(sid, {"figure": data["id"]}))
+    else:
+      self.unacked[sid] = data["id"]
+
+  async def connect(self, sid):
+    self.session._sio_connecting = asyncio.Event()
+    await self.session._record_connection(sid, {})
+
+  async def ack(self, sid):
+    await self.session._graph_updated(sid, {"figure": self.unacked.pop(sid)})
+
+  async def push(self, stream=True):
+    figure = self.session.get_figure()
+    assert await self.session._emit_all([self.session._get_figure_update(figure, stream)])
+
+  def events(self, sid):
+    return self.session.sio.events(sid)
+
+def _stream(pages):
+  plot = pages.session.get_figure().get_new_plot()
+  plot.set_stream(1000)
+  return plot
+
+def test_every_page_gets_each_frame(pkg, wire):
+  async def run():
+    pages = _Pages(pkg, wire)
+    for sid in "abc":
+      await pages.connect(sid)
+    plot = _stream(pages)
+    plot.append([0, 1], [0, 1])
+    await pages.push()
+    for sid in "bc":
+      await pages.ack(sid)
+    plot.append([2], [4])
+    await pages.push()
+    return pages
+  pages = asyncio.run(run())
+  for sid in "abc":
+    assert pages.events(sid) == ["update_graph", "append_graph_data"]
+    assert pages.pages[sid][0] == [(0.0, 0.0), (1.0, 1.0), (2.0, 4.0)]
+
+def test_slow_page_skips_frames_and_catches_up(pkg, wire):
+  async def run():
+    pages = _Pages(pkg, wire)
+    await pages.connect("a")
+    await pages.connect("b")
+    plot = _stream(pages)
+    plot.append([0], [0])
+    await pages.push()
+    # b is still drawing the first frame
+    for x in range(1, 4):
+      plot.append([x], [x])
+      await pages.push()
+    skipped = list(pages.events("b"))
+    # appended but not pushed, no page may see these yet
+    plot.append([10, 11], [10, 11])
+    await pages.ack("b")
+    acked = list(pages.events("b"))
+    # this frame comes with the full figure for b
+    plot.append([12], [12])
+    await pages.push()
+    await pages.ack("b")
+    plot.append([13], [13])
+    await pages.push()
+    return pages, plot, skipped, acked
+  pages, plot, skipped, acked = asyncio.run(run())
+  assert skipped == ["update_graph"]
+  # nothing to catch up from that was built while the figure could be changing
+  assert acked == skipped
+  assert pages.events("b")[1:] == ["update_graph", "append_graph_data"]
+  xs, ys = plot._stream.view()
+  for sid in "ab":
+    # no point twice, none missing
+    assert pages.pages[sid][0] == list(zip(xs.tolist(), ys.tolist()))
+  assert pages.session.get_metrics()["counters"]["frames_skipped"] == 3
+
+def test_snapshot_only_while_a_page_waits(pkg, wire):
+  async def run():
+    pages = _Pages(pkg, wire)
+    await pages.connect("a")
+    plot = _stream(pages)
+    plot.append([0], [0])
+    await pages.push()
+    figure = pages.session.get_figure()
+    plot.append([1], [1])
+    quiet = pages.session._get_figure_update(figure, True)
+    # a late page gets the figure with the next frame, it was last sent as a delta
+    await pages.session._emit(*quiet)
+    await pages.connect("b")
+    joined = list(pages.events("b"))
+    plot.append([2], [2])
+    waiting = pages.session._get_figure_update(figure, True)
+    await pages.session._emit(*waiting)
+    await pages.ack("b")
+    # the last frame came with a snapshot, later pages get that straight away
+    await pages.connect("c")
+    return pages, quiet[2], joined, waiting[2]
+  pages, quiet, joined, snapshot = asyncio.run(run())
+  assert quiet is None and joined == []
+  assert snapshot is not None
+  assert pages.events("b") == ["update_graph"]
+  assert pages.pages["b"] == pages.pages["a"]
+  assert pages.events("c") == ["update_graph"]
+  assert pages.pages["c"] == pages.pages["a"]
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+# in a fresh interpreter: import the package, build a figure and save it without a
+# browser, then list the server side modules that got imported along the way
+SCRIPT = """
+import json, sys
+import {package}
+from {package}.chart_session import ChartSession
+from {package}.plot import new_figure
+figure = new_figure()
+figure.get_new_plot().scatter([0, 1, 2], [1, 0, 1])
+figure.to_json()
+with ChartSession(renderer="raster") as session:
+  session.get_figure().get_new_plot().plot([0, 1], [0, 1])
+  session.save({path!r})
+print (json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+def test_server_dependencies_are_imported_lazily(pkg, tmp_path):
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  package = os.path.basename(root)
+  script = SCRIPT.format(package=package, path=str(tmp_path / "plot.png"),
+                         heavy=pkg("benchmarks").HEAVY_MODULES)
+  output = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(root),
+                          check=True, capture_output=True, text=True).stdout
+  assert json.loads(output.strip().splitlines()[-1]) == []
+  assert (tmp_path / "plot.png").exists()
@@ -0,0 +1,74 @@
+import numpy as np
+
+def _line(n=300000, seed=0):
+  rng = np.random.default_rng(seed)
+  x = np.cumsum(rng.uniform(0.5, 1.5, n))
+  return x, np.cumsum(rng.normal(size=n))
+
+def _pyramid(pkg, x, y):
+  lod = pkg("lod")
+  return lod._MinMaxPyramid(lod._ArrayStore(x, y))
+
+# the range query() covers: one point either side of [xlo, xhi]
+def _in_view(x, xlo, xhi):
+  lo = max(np.searchsorted(x, xlo, "left") - 1, 0)
+  hi = min(np.searchsorted(x, xhi, "right") + 1, x.shape[0])
+  return lo, hi
+
+def test_query_keeps_the_extremes_of_the_view(pkg):
+  x, y = _line()
+  pyramid = _pyramid(pkg, x, y)
+  rng = np.random.default_rng(1)
+  for _ in range(50):
+    xlo, xhi = np.sort(rng.uniform(x[0], x[-1], 2))
+    n_px = int(rng.integers(50, 2000))
+    idx = pyramid.query(xlo, xhi, n_px)
+    lo, hi = _in_view(x, xlo, xhi)
+    assert np.all(np.diff(idx) > 0) and idx[0] == lo and idx[-1] == hi - 1
+    assert y[idx].min() == y[lo:hi].min() and y[idx].max() == y[lo:hi].max()
+    # a few points per pixel column, however many are in view
+    assert idx.shape[0] <= 8 * n_px + 4 * pkg("lod").BLOCK
+
+def test_each_tile_keeps_its_envelope(pkg):
+  lod = pkg("lod")
+  x, y = _line()
+  idx = _pyramid(pkg, x, y).query(None, None, 100)
+  # the tiles of the level the query used are whole blocks of BLOCK << depth points
+  size = lod.BLOCK << int(np.log2(x.shape[0] / (2 * lod.BLOCK * 100)))
+  for start in range(0, x.shape[0] - size + 1, size):
+    kept = idx[(idx >= start) & (idx < start + size)]
+    assert y[kept].min() == y[start:start + size].min()
+    assert y[kept].max() == y[start:start + size].max()
+
+def test_non_finite_points_are_left_out(pkg):
+  x, y = _line()
+  y[1000:5000] = np.nan
+  y[200000] = np.inf
+  idx = _pyramid(pkg, x, y).query(None, None, 500)
+  assert np.isfinite(y[idx]).all()
+  finite = np.isfinite(y)
+  assert y[idx].max() == y[finite].max() and y[idx].min() == y[finite].min()
+
+def test_small_views_are_the_points_themselves(pkg):
+  x, y = _line()
+  idx = _pyramid(pkg, x, y).query(x[100], x[150], 400)
+  assert np.array_equal(idx, np.arange(99, 152))
+
+def test_stream_pyramid_follows_appends(pkg):
+  x, y = _line()
+  figure = pkg("plot").new_figure()
+  figure._set_viewport(500, 300)
+  plot = figure.get_new_plot()
+  plot.set_stream(capacity=200000)
+  plot.set_decimation("minmax")
+  for start in range(0, x.shape[0], 25000):
+    plot.append(x[start:start + 25000], y[start:start + 25000])
+    plot.get_xaxis().set_lims(x[max(0, start - 50000)], x[start + 24999])
+    xs, ys, _ = plot._get_visible_data()
+    # the last capacity points are in the buffer
+    kept = slice(max(0, start + 25000 - 200000), start + 25000)
+    kept_x, kept_y = x[kept], y[kept]
+    lo, hi = _in_view(kept_x, x[max(0, start - 50000)], x[start + 24999])
+    assert ys.max() == kept_y[lo:hi].max() and ys.min() == kept_y[lo:hi].min()
+    assert np.all(np.isin(xs, kept_x[lo:hi]))
+  assert plot._lod is not None
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+
+def test_histogram_buckets_and_quantiles(pkg):
+  metrics = pkg("metrics")._Metrics()
+  for value in (0.001, 0.002, 0.002, 0.3, 7):
+    metrics.observe("phase_seconds", value)
+  metrics.increment("timeouts")
+  metrics.increment("timeouts", 2)
+  metrics.set_gauge("connections", 3)
+  snapshot = metrics.snapshot()
+  histogram = snapshot["histograms"]["phase_seconds"]
+  assert histogram["count"] == 5 and histogram["min"] == 0.001 and histogram["max"] == 7
+  assert histogram["p50"] == 0.0025 and histogram["p99"] == 7
+  assert histogram["buckets"]["0.001"] == 1 and histogram["buckets"]["+Inf"] == 5
+  assert snapshot["counters"] == {"timeouts": 3}
+  assert snapshot["gauges"] == {"connections": 3}
+
+def test_prometheus_text(pkg):
+  metrics = pkg("metrics")._Metrics()
+  metrics.observe("phase_seconds", 0.2)
+  metrics.increment("timeouts")
+  lines = metrics.to_prometheus().splitlines()
+  assert "# TYPE chartjs_timeouts counter" in lines and "chartjs_timeouts 1" in lines
+  assert 'chartjs_phase_seconds_bucket{le="0.25"} 1' in lines
+  assert 'chartjs_phase_seconds_bucket{le="0.1"} 0' in lines
+  assert "chartjs_phase_seconds_count 1" in lines
+
+def test_message_sizes_are_bytes_sent(pkg, wire):
+  session = pkg("chart_session").ChartSession()
+  plot = session.get_figure().get_new_plot()
+  plot.scatter(np.arange(1000.0), np.arange(1000.0), precision="float32")
+
+  async def run():
+    session.sio = wire(lambda sid, event, data: asyncio.ensure_future(
+      session._graph_updated(sid, {"figure": data["id"]})))
+    session._fanout = pkg("fanout")._FanOut(session.sio, session._metrics)
+    session._sio_connecting = asyncio.Event()
+    await session._record_connection("page", {})
+    update = session._get_figure_update(session.get_figure())
+    expected = sum(len(p) for p in pkg("fanout").encode_event(*update[:2]))
+    assert await session._emit(*update)
+    return expected
+
+  expected = asyncio.run(run())
+  sizes = session.get_metrics()["histograms"]["update_graph_bytes"]
+  assert sizes["count"] == 1 and sizes["sum"] == expected
+  # both float32 columns go as binary attachments
+  assert expected > 2 * 4 * 1000
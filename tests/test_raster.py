@@ -0,0 +1,59 @@
+import struct
+import zlib
+
+import numpy as np
+
+# (width, height, pixels) of a PNG as write_png writes it: 8-bit RGB, no filters
+def _read_png(path):
+  with open(path, "rb") as f:
+    data = f.read()
+  assert data[:8] == b"\x89PNG\r\n\x1a\n"
+  pos, chunks = 8, {}
+  while pos < len(data):
+    length, tag = struct.unpack(">I4s", data[pos:pos + 8])
+    body = data[pos + 8:pos + 8 + length]
+    assert struct.unpack(">I", data[pos + 8 + length:pos + 12 + length])[0] == zlib.crc32(tag + body)
+    chunks[tag] = body
+    pos += 12 + length
+  w, h = struct.unpack(">II", chunks[b"IHDR"][:8])
+  raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(h, w * 3 + 1)
+  return w, h, raw[:, 1:].reshape(h, w, 3)
+
+def _figure(pkg):
+  figure = pkg("plot").new_figure()
+  figure._set_viewport(320, 200)
+  plot = figure.get_new_plot()
+  plot.plot(np.linspace(0, 10, 1000), np.sin(np.linspace(0, 10, 1000)))
+  plot._dataset["borderColor"] = "#ff0000"
+  return figure
+
+def test_png_round_trips(pkg, tmp_path):
+  pixels = np.random.default_rng(0).integers(0, 256, (7, 5, 3), dtype=np.uint8)
+  pkg("raster").write_png(str(tmp_path / "p.png"), pixels)
+  w, h, read = _read_png(str(tmp_path / "p.png"))
+  assert (w, h) == (5, 7) and np.array_equal(read, pixels)
+
+def test_save_png_is_the_viewport_size(pkg, tmp_path):
+  raster = pkg("raster")
+  figure = _figure(pkg)
+  raster.save_png(figure, str(tmp_path / "a.png"))
+  assert _read_png(str(tmp_path / "a.png"))[:2] == (320, 200)
+  raster.save_png(figure, str(tmp_path / "b.png"), 100, 80, scale=2)
+  assert _read_png(str(tmp_path / "b.png"))[:2] == (200, 160)
+
+def test_the_line_is_drawn_in_its_color(pkg, tmp_path):
+  pixels = pkg("raster").render(_figure(pkg)._get_static_data(), 320, 200)
+  red = (pixels[:, :, 0] > 200) & (pixels[:, :, 1] < 80) & (pixels[:, :, 2] < 80)
+  rows, cols = np.nonzero(red)
+  # a sine over the whole plot area: most columns, a good part of the height
+  assert np.unique(cols).shape[0] > 200 and rows.max() - rows.min() > 100
+
+def test_title_and_colors(pkg):
+  raster = pkg("raster")
+  assert raster.parse_color("#f00")[:3] == (255, 0, 0)
+  assert raster.parse_color("rgba(0, 128, 255, 0.5)") == (0, 128, 255, 0.5)
+  figure = _figure(pkg)
+  plain = raster.render(figure._get_static_data(), 320, 200)
+  figure.set_title("Title")
+  titled = raster.render(figure._get_static_data(), 320, 200)
+  assert (titled[:30] < 100).all(axis=2).any() and not (plain[:5] < 100).all(axis=2).any()
@@ -0,0 +1,56 @@
+import concurrent.futures
+import threading
+
+import numpy as np
+import pytest
+
+class _Counting(object):
+  def __init__(self, f):
+    self.f = f
+    self.calls = 0
+    self.points = 0
+
+  def __call__(self, xs):
+    self.calls += 1
+    self.points += xs.shape[0]
+    return self.f(xs)
+
+def _sample(pkg, f, xmin=0.0, xmax=10.0, **kwargs):
+  args = dict(init_count=64, max_iterations=12, pixel_tolerance=0.5, width_px=800, height_px=600)
+  args.update(kwargs)
+  return pkg("sampling").adaptive_sample(f, xmin, xmax, **args)
+
+def test_straight_lines_are_not_refined(pkg):
+  f = _Counting(lambda xs: 3 * xs + 1)
+  xs, ys = _sample(pkg, f)
+  assert f.calls == 1 and xs.shape[0] < 100
+  assert xs[0] <= 0 and xs[-1] >= 10
+
+def test_curves_are_within_the_pixel_tolerance(pkg):
+  f = _Counting(np.sin)
+  xs, ys = _sample(pkg, f, 0.0, 20.0)
+  assert np.all(np.diff(xs) > 0) and np.array_equal(ys, np.sin(xs))
+  # one evaluate call per pass, not per point
+  assert f.calls < 14 and f.points == xs.shape[0]
+  dense = np.linspace(0, 20, 100000)
+  error_px = np.abs(np.interp(dense, xs, ys) - np.sin(dense)) * 600 / 2
+  assert error_px.max() < 1
+
+def test_samples_gather_where_f_bends(pkg):
+  xs, _ = _sample(pkg, lambda xs: np.exp(-100 * (xs - 5) ** 2))
+  near = np.count_nonzero(np.abs(xs - 5) < 0.5)
+  assert near > np.count_nonzero(np.abs(xs - 2) < 0.5) * 4
+
+def test_edges_of_gaps_are_refined(pkg):
+  with np.errstate(invalid="ignore"):
+    xs, ys = _sample(pkg, np.sqrt, -5.0, 5.0)
+  finite = np.isfinite(ys)
+  assert not finite[xs < 0].any() and finite[xs >= 0].all()
+  # the gap is found to within a pixel
+  assert xs[finite].min() - xs[~finite].max() <= 10 / 800
+
+def test_cancel_stops_sampling(pkg):
+  cancel = threading.Event()
+  cancel.set()
+  with pytest.raises(concurrent.futures.CancelledError):
+    _sample(pkg, np.sin, cancel=cancel)
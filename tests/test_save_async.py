@@ -0,0 +1,102 @@
+import asyncio
+import base64
+
+import pytest
+
+# a page that holds image requests until answer(), then replies to them last first,
+# each image being the figure and request it was for
+class _Page(object):
+  def __init__(self, session, wire):
+    self.session = session
+    self.requests = []
+    self.sio = wire(self._on_message)
+
+  def _on_message(self, sid, event, data):
+    if event == "request_image_data":
+      self.requests.append((sid, data))
+
+  async def requested(self, count):
+    while len(self.requests) < count:
+      await asyncio.sleep(0)
+
+  async def answer(self, empty=()):
+    for sid, data in reversed(self.requests):
+      image = f"{data['figure']}/{data['id']}".encode()
+      url = "" if data["figure"] in empty else "data:image/png;base64," + base64.b64encode(image).decode()
+      await self.session._receive_image_data(sid, {"id": data["id"], "figure": data["figure"], "data": url})
+    self.requests = []
+
+async def _session(pkg, wire):
+  session = pkg("async_session").AsyncChartSession()
+  page = _Page(session, wire)
+  session.sio = page.sio
+  session._fanout = pkg("fanout")._FanOut(session.sio, session._metrics)
+  await session._fanout.add("page", [])
+  return session, page
+
+def _close(session):
+  session._io_pool.shutdown(wait=True)
+  session._thread_pool.shutdown(wait=False)
+
+def test_saves_in_flight_get_their_own_images(pkg, wire, tmp_path):
+  async def run():
+    session, page = await _session(pkg, wire)
+    try:
+      second = session.new_figure()
+      futures = []
+      for i in range(3):
+        futures += session.save_async(str(tmp_path / f"frame{i}.png"), [session.get_figure(), second])
+      # all of them in flight at once
+      await page.requested(6)
+      assert len(session._pending_saves) == 6
+      await page.answer()
+      return await asyncio.gather(*futures)
+    finally:
+      _close(session)
+
+  names = asyncio.run(run())
+  for n, name in enumerate(names):
+    i, figure = divmod(n, 2)
+    assert name == str(tmp_path / f"frame{i}_{figure}.png")
+    with open(name, "rb") as f:
+      assert f.read() == f"{figure}/{n}".encode()
+
+def test_failed_and_late_images(pkg, wire, tmp_path, monkeypatch):
+  async def run():
+    session, page = await _session(pkg, wire)
+    try:
+      missing = session.save_async(str(tmp_path / "missing.png"))[0]
+      await page.requested(1)
+      await page.answer(empty=(session.get_figure().id_,))
+      with pytest.raises(RuntimeError):
+        await missing
+      monkeypatch.setattr(pkg("chart_session"), "SAVE_TIMEOUT", 0.05)
+      late = session.save_async(str(tmp_path / "late.png"))[0]
+      await page.requested(1)
+      with pytest.raises(RuntimeError):
+        await late
+      # the reply after the timeout is dropped
+      await page.answer()
+      return session._pending_saves, session._metrics.snapshot()["counters"]
+    finally:
+      _close(session)
+
+  pending, counters = asyncio.run(run())
+  assert pending == {} and counters["save_timeouts"] == 1
+  assert not (tmp_path / "late.png").exists() and not (tmp_path / "missing.png").exists()
+
+def test_raster_saves_take_the_figure_as_it_was(pkg, tmp_path):
+  session = pkg("chart_session").ChartSession(renderer="raster")
+  with session:
+    session.set_figure_size(200, 100)
+    plot = session.get_figure().get_new_plot()
+    plot.plot([0, 1], [0, 1])
+    before = session.save_async(str(tmp_path / "before.png"))[0]
+    plot.plot([0, 1], [1, 0])
+    session.save(str(tmp_path / "after.png"))
+    figure = session.get_figure()
+    reference = pkg("raster").render(figure._get_static_data(), *figure._viewport)
+  assert before.result() == str(tmp_path / "before.png")
+  assert (tmp_path / "before.png").read_bytes() != (tmp_path / "after.png").read_bytes()
+  pkg("raster").write_png(str(tmp_path / "reference.png"), reference)
+  assert (tmp_path / "after.png").read_bytes() == (tmp_path / "reference.png").read_bytes()
@@ -0,0 +1,89 @@
+import asyncio
+
+# a run() that holds each request until released, recording what ran
+class _Runs(object):
+  def __init__(self):
+    self.started = []
+    self.finished = []
+    self._gates = {}
+
+  async def __call__(self, key, params):
+    gate = self._gates[(key, params)] = asyncio.Event()
+    self.started.append((key, params))
+    await gate.wait()
+    self.finished.append((key, params))
+
+  async def release(self, key, params):
+    while (key, params) not in self._gates:
+      await asyncio.sleep(0)
+    self._gates[(key, params)].set()
+    for _ in range(3):
+      await asyncio.sleep(0)
+
+def _scheduler(pkg):
+  runs = _Runs()
+  return pkg("scheduler")._LatestWinsScheduler(runs), runs
+
+def test_superseded_requests_are_dropped(pkg):
+  async def run():
+    scheduler, runs = _scheduler(pkg)
+    scheduler.submit("a", 0)
+    await asyncio.sleep(0)
+    # arriving while 0 runs, only the newest is kept
+    for i in range(1, 5):
+      scheduler.submit("a", i)
+    await runs.release("a", 0)
+    await runs.release("a", 4)
+    return scheduler.stats(), runs.finished
+
+  stats, finished = asyncio.run(run())
+  assert finished == [("a", 0), ("a", 4)]
+  assert stats == {"submitted": 5, "dropped": 3, "completed": 2, "pending": 0, "in_flight": 0}
+
+def test_keys_run_independently(pkg):
+  async def run():
+    scheduler, runs = _scheduler(pkg)
+    scheduler.submit("a", 0)
+    scheduler.submit("b", 0)
+    await asyncio.sleep(0)
+    started = list(runs.started)
+    scheduler.submit("b", 1)
+    await runs.release("b", 0)
+    await runs.release("b", 1)
+    await runs.release("a", 0)
+    return started, runs.finished
+
+  started, finished = asyncio.run(run())
+  assert started == [("a", 0), ("b", 0)]
+  assert finished == [("b", 0), ("b", 1), ("a", 0)]
+
+def test_discard_and_close(pkg):
+  async def run():
+    scheduler, runs = _scheduler(pkg)
+    scheduler.submit("a", 0)
+    scheduler.submit("a", 1)
+    await asyncio.sleep(0)
+    scheduler.discard("a")
+    await scheduler.close()
+    return scheduler.stats(), runs.finished
+
+  stats, finished = asyncio.run(run())
+  assert finished == []
+  assert stats["dropped"] == 1 and stats["pending"] == 0 and stats["in_flight"] == 0
+
+def test_errors_dont_stop_the_key(pkg, capsys):
+  async def run():
+    ran = []
+    async def flaky(key, params):
+      ran.append(params)
+      if params == 0:
+        raise ValueError("boom")
+    scheduler = pkg("scheduler")._LatestWinsScheduler(flaky)
+    scheduler.submit("a", 0)
+    await asyncio.sleep(0.01)
+    scheduler.submit("a", 1)
+    await asyncio.sleep(0.01)
+    return ran
+
+  assert asyncio.run(run()) == [0, 1]
+  assert "boom" in capsys.readouterr().out
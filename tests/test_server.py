@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+PARAMS = {"xmin": 0, "xmax": 1, "parameters": {"a": 2}}
+
+async def _run(server, session, code, params=PARAMS):
+  assert server._admit()
+  res = await server._compile(session, code)
+  assert res["error"] is None
+  assert server._admit()
+  return await server._evaluate(session, params)
+
+def _serve(pkg, coro, **kwargs):
+  server = pkg("server")._HostedServer(port=0, **kwargs)
+  try:
+    return asyncio.run(coro(pkg("server"), server)), server
+  finally:
+    server._thread_pool.shutdown(wait=False)
+    server._workers.shutdown()
+
+def test_sessions_dont_share_modules(pkg):
+  async def run(module, server):
+    a, b = module._HostedSession("a"), module._HostedSession("b")
+    assert await _run(server, a, "np.sin = lambda x: x * 0 + 42\ndef f(x, a):\n  return np.sin(a * x)\n") is None
+    assert a.ipl._ylims[1] == 42
+    # on the same and only worker process slot, after a
+    assert await _run(server, b, "def f(x, a):\n  return np.sin(a * x)\n") is None
+    return b.ipl._ylims
+
+  ylims, server = _serve(pkg, run, workers=1)
+  assert ylims[1] <= 1
+  assert server._workers.stats()["replaced"] == 1
+
+def test_stuck_session_leaves_others_running(pkg):
+  async def run(module, server):
+    a, b = module._HostedSession("a"), module._HostedSession("b")
+    stuck = asyncio.ensure_future(_run(server, a, "def f(x, a):\n  while True: pass\n"))
+    await asyncio.sleep(1)
+    # still sampling when a times out at 2s and its worker is killed
+    start = time.perf_counter()
+    error = await _run(server, b, "import time\ndef f(x, a):\n  time.sleep(1.5)\n  return a * x\n")
+    return await stuck, error, time.perf_counter() - start, b.ipl._ylims
+
+  (stuck, error, seconds, ylims), server = _serve(pkg, run, workers=2, eval_timeout=2)
+  assert "longer than" in "".join(stuck)
+  assert error is None
+  assert seconds > 1
+  assert ylims[1] == 2
+  assert server._workers.stats()["killed"] == 1
+
+SLOW = "import time\ndef f(x, a):\n  time.sleep(0.5)\n  return a * x\n"
+
+# once session's f is being evaluated
+async def _evaluating(session):
+  while session.cancel is None:
+    await asyncio.sleep(0.01)
+  await asyncio.sleep(0.1)
+
+def test_disconnect_cancels_evaluation(pkg):
+  async def run(module, server):
+    a = module._HostedSession("a")
+    task = asyncio.ensure_future(_run(server, a, SLOW))
+    await _evaluating(a)
+    a.cancel.set()
+    return await task
+
+  error, server = _serve(pkg, run)
+  assert error is None
+  assert server._metrics.snapshot()["counters"]["evals_cancelled"] == 1
+
+def test_cancelling_the_update_task_propagates(pkg):
+  async def run(module, server):
+    a = module._HostedSession("a")
+    task = asyncio.ensure_future(_run(server, a, SLOW))
+    await _evaluating(a)
+    cancel = a.cancel
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+      await task
+    return cancel.is_set()
+
+  stopped, server = _serve(pkg, run)
+  assert stopped
+  assert "evals_cancelled" not in server._metrics.snapshot()["counters"]
+  assert server._in_flight == 0
@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+
+def _figure(pkg):
+  figure = pkg("plot").new_figure()
+  plot = figure.get_new_plot()
+  plot.plot(np.linspace(0, 1, 50), np.linspace(0, 1, 50) ** 2)
+  labelled = figure.get_new_plot()
+  labelled.scatter([1, 2], [3, 4], labels=["a", "b"])
+  figure.set_title("squares </script>")
+  return figure
+
+def _decode(columns):
+  dtype = {"float32": "<f4", "float64": "<f8"}[columns["dtype"]]
+  return np.frombuffer(columns["x"], dtype), np.frombuffer(columns["y"], dtype)
+
+def test_json_round_trips_binary_columns(pkg):
+  figure = _figure(pkg)
+  spec = pkg("encoding").loads_spec(figure.to_json())
+  first, labelled = spec["data"]["datasets"]
+  xs, ys = _decode(first["columns"])
+  assert np.array_equal(xs, np.linspace(0, 1, 50)) and np.array_equal(ys, xs ** 2)
+  assert labelled["columns"]["labels"] == ["a", "b"]
+  assert spec["options"]["title"]["text"] == "squares </script>"
+  # plain JSON for anything else reading it
+  raw = json.loads(figure.to_json(precision="float32"))["data"]["datasets"][0]["columns"]
+  assert raw["dtype"] == "float32" and set(raw["x"]) == {"__bytes__"}
+
+def test_export_doesnt_count_as_sent(pkg):
+  figure = _figure(pkg)
+  figure._get_data()
+  figure.to_json()
+  assert figure._get_delta()["datasets"] == {}
+
+def test_html_is_standalone(pkg, tmp_path, monkeypatch):
+  static_export = pkg("static_export")
+  for script in static_export.SCRIPTS:
+    path = tmp_path / script
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("var library = '</script>';")
+  monkeypatch.setattr(static_export, "NODE_MODULES", str(tmp_path))
+  monkeypatch.setattr(static_export, "_scripts", None)
+  figure = _figure(pkg)
+  figure.to_html(str(tmp_path / "report.html"))
+  page = (tmp_path / "report.html").read_text()
+  assert "<title>squares &lt;/script&gt;</title>" in page
+  # one closing tag per inlined script, nothing in the data or libraries closes one early
+  assert page.count("</script>") == len(static_export.SCRIPTS) + 2
+  assert "src=" not in page and "href=" not in page
+  spec = page.split('id="figure-spec">')[1].split("</script>")[0]
+  assert pkg("encoding").loads_spec(spec) == pkg("encoding").loads_spec(figure.to_json())
@@ -0,0 +1,58 @@
+import numpy as np
+
+# what the page holds for a dataset: whole datasets replace it, appends drop from the
+# front and push on the end, like src/transport.js
+def _decode(dataset):
+  columns = dataset.get("columns")
+  if columns is None:
+    return [(p["x"], p["y"]) for p in dataset["data"]]
+  xs = np.frombuffer(columns["x"], dtype=columns["dtype"])[:columns["length"]]
+  ys = np.frombuffer(columns["y"], dtype=columns["dtype"])[:columns["length"]]
+  return list(zip(xs.tolist(), ys.tolist()))
+
+def _apply(page, delta):
+  for i, dataset in delta["datasets"].items():
+    page[i] = _decode(dataset)
+  for i, append in delta.get("appends", {}).items():
+    del page[i][:append["drop"]]
+    page[i] += _decode(append)
+
+def test_window_first_extend(pkg):
+  figure = pkg("plot").new_figure()
+  plot = figure.get_new_plot()
+  plot.set_stream(1000, window=5.0)
+  plot.append(range(20), range(20))
+  assert plot._stream.xlims == (14.0, 19.0)
+  assert plot._stream.ylims == (14.0, 19.0)
+  plot.append([20, 21], [-1, 100])
+  assert plot._stream.ylims == (-1.0, 100.0)
+
+def _stream_page(figure, plot, decimate):
+  figure._set_viewport(400, 300)
+  plot.set_stream(20000)
+  if decimate:
+    plot.set_decimation("minmax")
+  plot.append(np.arange(10000.0), np.sin(np.arange(10000.0)))
+  page = {i: _decode(d) for i, d in enumerate(figure._get_data()["data"]["datasets"])}
+  rng = np.random.default_rng(0)
+  for start in range(10000, 40000, 5000):
+    plot.append(np.arange(start, start + 5000.0), rng.normal(size=5000))
+    _apply(page, figure._get_stream_delta())
+  return page[0]
+
+def test_stream_deltas_rebuild_buffer(pkg):
+  figure = pkg("plot").new_figure()
+  plot = figure.get_new_plot()
+  page = _stream_page(figure, plot, decimate=False)
+  xs, ys = plot._stream.view()
+  assert page == list(zip(xs.tolist(), ys.tolist()))
+
+def test_decimated_stream_deltas_follow_buffer(pkg):
+  figure = pkg("plot").new_figure()
+  plot = figure.get_new_plot()
+  page = _stream_page(figure, plot, decimate=True)
+  xs, ys, _ = plot._get_visible_data()
+  assert page == list(zip(xs.tolist(), ys.tolist()))
+  # nothing evicted stays on the page, and the pixel budget holds
+  assert min(x for x, _ in page) >= plot._stream.xlims[0]
+  assert len(page) < len(plot._stream)
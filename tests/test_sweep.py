@@ -0,0 +1,46 @@
+import asyncio
+import base64
+import os
+
+CODE = "def f(x, a):\n  return a * x\n"
+
+# a page that acks every update and answers image requests with the number of the
+# update it last drew
+def _page(session, wire):
+  drawn = []
+  def on_message(sid, event, data):
+    if event in ("update_graph", "update_graph_delta"):
+      drawn.append(data)
+      asyncio.ensure_future(session._graph_updated(sid, {"figure": data["id"]}))
+    elif event == "request_image_data":
+      image = base64.b64encode(str(len(drawn)).encode()).decode()
+      reply = {"id": data["id"], "figure": data["figure"], "data": "data:image/png;base64," + image}
+      asyncio.ensure_future(session._receive_image_data(sid, reply))
+  return wire(on_message)
+
+def test_sweep_captures_each_frame(pkg, wire, tmp_path):
+  chart_session = pkg("chart_session")
+  session = chart_session.ChartSession(workers=2)
+  figure = session.get_figure()
+  figure._set_viewport(400, 300)
+  ipl = figure.add_interactive_plot()
+  ipl.set_function(CODE)
+  values = [1, 2, 3, 4, 5]
+  out = os.path.join(tmp_path, "{i}.png")
+
+  async def run():
+    session.sio = _page(session, wire)
+    session._fanout = pkg("fanout")._FanOut(session.sio, session._metrics)
+    await session._fanout.add("page", [])
+    frames = chart_session._sweep_frames({"a": values}, ipl.func_params, (0, 1), None)
+    stats = await session._sweep(figure, ipl, frames, out)
+    return stats, session.sio.events("page")
+
+  stats, events = asyncio.run(run())
+  assert stats["rendered"] == len(values) and stats["failed"] == 0
+  # every frame is drawn, then captured, before the next one goes out
+  assert events == ["update_graph", "request_image_data"] + (
+    ["update_graph_delta", "request_image_data"] * (len(values) - 1))
+  for i in range(len(values)):
+    with open(out.format(i=i), "rb") as f:
+      assert f.read() == str(i + 1).encode()
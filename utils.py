@@ -1,8 +1,11 @@
 import asyncio 
+import math
 import traceback
 
+import numpy as np
+
 def exception_as_string(e):
-  return traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
+  return traceback.format_exception(type(e), e, e.__traceback__)
 
 async def wait_with_timeout(event, timeout):
   try:
@@ -12,3 +15,33 @@ async def wait_with_timeout(event, timeout):
     return False
   finally:
     event.clear()  # executed before return statements
+
+# a run_in_executor future that was awaited and raised CancelledError: whether the job
+# gave up by itself (get_result seeing its cancel event). If the awaiting task was
+# cancelled instead, the future is cancelled with it and that has to propagate.
+def job_cancelled(future):
+  return future.done() and not future.cancelled()
+
+# cancel every other task of the running loop and wait for them to finish
+async def cancel_pending_tasks():
+  tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+  for task in tasks:
+    task.cancel()
+  await asyncio.gather(*tasks, return_exceptions=True)
+
+# (min, max) ignoring NaN/inf, or (None, None) if there is no finite value
+def finite_extent(arr):
+  if arr.size == 0:
+    return None, None
+  lo, hi = arr.min(), arr.max()
+  if np.isfinite(lo) and np.isfinite(hi):
+    return float(lo), float(hi)
+  finite = arr[np.isfinite(arr)]
+  if finite.size == 0:
+    return None, None
+  return float(finite.min()), float(finite.max())
+
+# (columns, rows) of the grid the frontend lays count figures out in, see App.jsx
+def grid_shape(count):
+  cols = max(1, math.ceil(math.sqrt(count)))
+  return cols, max(1, math.ceil(count / cols))
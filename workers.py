@@ -0,0 +1,275 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+import traceback
+
+# Worker processes for evaluating interactive functions. Unlike a ProcessPoolExecutor,
+# every call runs on a known process, so a call that is stuck (a runaway f) can be
+# stopped by killing just that process, which is then replaced; calls on the other
+# workers carry on.
+#
+# With isolate=True, calls are submitted on behalf of an owner (a hosted session) and
+# a process only ever runs the calls of one owner: code that changes the modules it
+# was given (np.sin = ...) or anything else in its process can't reach other owners,
+# since another owner gets a fresh process instead. Fresh processes are forked from a
+# forkserver that has only imported this package, so they don't carry the memory of
+# the parent either.
+
+# start method for worker processes, "fork" would copy the server with all its sessions
+def _context():
+  if "forkserver" in multiprocessing.get_all_start_methods():
+    context = multiprocessing.get_context("forkserver")
+    # without __main__, which scripts that don't guard their top level would re-run
+    context.set_forkserver_preload([f"{__package__}.sampling"])
+    return context
+  return multiprocessing.get_context("spawn")
+
+# the traceback of an exception raised in a worker, as its __cause__
+class _RemoteTraceback(Exception):
+  def __init__(self, text):
+    self.text = text
+
+  def __str__(self):
+    return self.text
+
+# a worker was killed while running a call, or died
+class WorkerLost(RuntimeError):
+  pass
+
+# runs calls sent over conn until the parent closes it
+def _serve(conn):
+  while True:
+    try:
+      fn, args = conn.recv()
+    except (EOFError, OSError):
+      return
+    try:
+      reply = (True, fn(*args), None)
+    except BaseException as e:
+      reply = (False, e, "".join(traceback.format_exception(type(e), e, e.__traceback__)))
+    try:
+      conn.send(reply)
+    except Exception:
+      # the result or the exception doesn't pickle
+      conn.send((False, RuntimeError(f"Couldn't send back the result: {reply[1]!r}"), reply[2]))
+
+class _Worker(object):
+  def __init__(self, context, on_done):
+    self._conn, child = context.Pipe()
+    self.process = context.Process(target=_serve, args=(child,), daemon=True)
+    self.process.start()
+    child.close()
+    self._on_done = on_done
+    # the owner whose code has run here, and the call running now
+    self.owner = None
+    self.future = None
+    self.last_used = time.monotonic()
+    self.dead = False
+    self._reader = threading.Thread(target=self._read, daemon=True)
+    self._reader.start()
+
+  def run(self, future, fn, args):
+    self.future = future
+    self._conn.send((fn, args))
+
+  def _read(self):
+    while True:
+      try:
+        ok, value, text = self._conn.recv()
+      except (EOFError, OSError):
+        self._conn.close()
+        self._on_done(self, None, None, None)
+        return
+      self._on_done(self, ok, value, text)
+
+  # the reader sees the pipe close and fails the call running, if any
+  def kill(self):
+    self.dead = True
+    self.process.kill()
+
+class _WorkerPool(object):
+  def __init__(self, size, isolate=False):
+    self.size = size
+    self.isolate = isolate
+    self._context = _context()
+    self._lock = threading.Lock()
+    self._workers = []
+    # (future, fn, args, owner) waiting for a worker
+    self._queue = collections.deque()
+    # owner -> _OwnedPools not released yet, its workers aren't handed to others
+    self._leases = collections.Counter()
+    self._shutdown = False
+    self.started = 0
+    # workers killed with the call they were running, replaced for another owner
+    self.killed = 0
+    self.replaced = 0
+
+  def __len__(self):
+    return len(self._workers)
+
+  # like Executor.submit, with fn, args and the result pickled to and from a worker
+  def submit(self, fn, *args, owner=None):
+    future = concurrent.futures.Future()
+    with self._lock:
+      if self._shutdown:
+        raise RuntimeError("The worker pool is shut down")
+      self._queue.append((future, fn, args, owner))
+      self._dispatch()
+    return future
+
+  # the pool as seen by one owner, for sampling._ProcessEvaluator. Until it's released,
+  # a worker that ran owner's code is kept for its next call (the next batch of the
+  # same get_result) rather than replaced for another owner.
+  def owned_by(self, owner):
+    with self._lock:
+      self._leases[owner] += 1
+    return _OwnedPool(self, owner)
+
+  def _release(self, owner):
+    with self._lock:
+      self._leases[owner] -= 1
+      if self._leases[owner] <= 0:
+        del self._leases[owner]
+      if not self._shutdown:
+        self._dispatch()
+
+  # stop the call of future: cancelled if it's still waiting, otherwise its worker is
+  # killed and replaced. Returns whether it was running.
+  def kill(self, future):
+    if future.cancel():
+      return False
+    with self._lock:
+      worker = next((w for w in self._workers if w.future is future), None)
+      if worker is None:
+        return False
+      self._remove(worker)
+      self.killed += 1
+      self._dispatch()
+    if not future.done():
+      future.set_exception(WorkerLost("The worker was stopped while running this"))
+    return True
+
+  # stop workers idle for longer than timeout, returns how many
+  def evict_idle(self, timeout):
+    now = time.monotonic()
+    with self._lock:
+      idle = [w for w in self._workers if w.future is None and now - w.last_used > timeout]
+      for worker in idle:
+        self._remove(worker)
+    return len(idle)
+
+  def shutdown(self, wait=False):
+    with self._lock:
+      self._shutdown = True
+      for future, _, _, _ in self._queue:
+        future.cancel()
+      self._queue.clear()
+      for worker in list(self._workers):
+        self._remove(worker)
+
+  def stats(self):
+    with self._lock:
+      return {
+        "workers": len(self._workers),
+        "busy": sum(w.future is not None for w in self._workers),
+        "queued": len(self._queue),
+        "started": self.started,
+        "killed": self.killed,
+        "replaced": self.replaced,
+      }
+
+  def _remove(self, worker):
+    self._workers.remove(worker)
+    worker.kill()
+
+  def _start(self):
+    worker = _Worker(self._context, self._done)
+    self._workers.append(worker)
+    self.started += 1
+    return worker
+
+  # a worker for owner's calls: one that already ran owner's code, a fresh one, a new
+  # one while there are fewer than size, or in place of the idle worker used longest ago
+  # whose owner doesn't hold a lease
+  def _worker_for(self, owner):
+    idle = [w for w in self._workers if w.future is None]
+    if not self.isolate:
+      if idle:
+        return idle[0]
+      return self._start() if len(self._workers) < self.size else None
+    for worker in idle:
+      if worker.owner == owner:
+        return worker
+    for worker in idle:
+      if worker.owner is None:
+        return worker
+    if len(self._workers) < self.size:
+      return self._start()
+    spare = [w for w in idle if w.owner not in self._leases]
+    if spare:
+      self._remove(min(spare, key=lambda w: w.last_used))
+      self.replaced += 1
+      return self._start()
+    return None
+
+  # hand queued calls to workers, with the lock held. A call that has to wait doesn't
+  # hold up the calls behind it whose owner has a worker of its own idle.
+  def _dispatch(self):
+    waiting = collections.deque()
+    while self._queue:
+      future, fn, args, owner = item = self._queue.popleft()
+      if future.cancelled():
+        continue
+      worker = self._worker_for(owner)
+      if worker is None:
+        waiting.append(item)
+        if not self.isolate:
+          break
+        continue
+      if not future.set_running_or_notify_cancel():
+        continue
+      worker.owner = owner
+      try:
+        worker.run(future, fn, args)
+      except OSError:
+        # the process is gone, its reader removes it
+        worker.future = None
+        future.set_exception(WorkerLost("The worker process died"))
+    waiting.extend(self._queue)
+    self._queue = waiting
+
+  # from a worker's reader thread, ok is None when its process is gone
+  def _done(self, worker, ok, value, text):
+    with self._lock:
+      future, worker.future = worker.future, None
+      worker.last_used = time.monotonic()
+      if ok is None and not worker.dead:
+        # it died on its own
+        self._remove(worker)
+      if not self._shutdown:
+        self._dispatch()
+    if future is None or future.done():
+      return
+    if ok is None:
+      future.set_exception(WorkerLost("The worker process died while running this"))
+    elif ok:
+      future.set_result(value)
+    else:
+      value.__cause__ = _RemoteTraceback(text)
+      future.set_exception(value)
+
+class _OwnedPool(object):
+  def __init__(self, pool, owner):
+    self.pool = pool
+    self.owner = owner
+
+  def submit(self, fn, *args):
+    return self.pool.submit(fn, *args, owner=self.owner)
+
+  def kill(self, future):
+    return self.pool.kill(future)
+
+  def release(self):
+    self.pool._release(self.owner)